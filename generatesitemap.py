@@ -31,25 +31,385 @@ import re
 import os
 import os.path
 import subprocess
-from datetime import datetime
+import ctypes
+import ctypes.util
+import select
+import struct
+import time
+import json
+import threading
+import queue
+import heapq
+import itertools
+import zlib
+import gzip
+import array
+import glob
+import random
+import math
+import mmap
+import io
+import hashlib
+import html
+import operator
+import xml.etree.ElementTree as ET
+import urllib.parse
+import email.utils
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timedelta, timezone
 
-def gatherfiles(extensionsToInclude) :
+class Tracer :
+    """Records timed spans of the work done while generating
+    a sitemap, which can be saved in the Chrome Trace Event
+    format for viewing in a trace viewer such as Perfetto.
+    """
+
+    def __init__(self) :
+        self.events = []
+        self.threadNames = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+        self.origin = time.perf_counter()
+
+    @contextmanager
+    def span(self, name, **args) :
+        """Records the time spent within the with block as a span.
+
+        Keyword arguments:
+        name - the name of the span
+        args - additional details to show with the span, such as the file
+        """
+        start = time.perf_counter()
+        try :
+            yield
+        finally :
+            end = time.perf_counter()
+            thread = threading.current_thread()
+            self.threadNames[thread.ident] = thread.name
+            self.events.append({
+                "name" : name,
+                "ph" : "X",
+                "ts" : (start - self.origin) * 1000000,
+                "dur" : (end - start) * 1000000,
+                "pid" : self.pid,
+                "tid" : thread.ident,
+                "args" : args
+            })
+
+    def count(self, name, n=1) :
+        """Adds to the total of a counter, such as of the bytes read.
+
+        Keyword arguments:
+        name - the name of the counter
+        n - the amount to add
+        """
+        with self.lock :
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def stageDurations(self) :
+        """Returns a dictionary with the total number of seconds spent
+        in the spans of each stage, which are those without details."""
+        durations = {}
+        for e in self.events :
+            if len(e["args"]) == 0 :
+                durations[e["name"]] = durations.get(e["name"], 0) + e["dur"] / 1000000
+        return durations
+
+    def write(self, filename) :
+        """Writes the recorded spans to a file in the Chrome
+        Trace Event format.
+
+        Keyword arguments:
+        filename - the name of the trace file
+        """
+        metadata = [
+            { "name" : "thread_name", "ph" : "M", "pid" : self.pid, "tid" : tid, "args" : { "name" : name } }
+            for tid, name in self.threadNames.items()
+        ]
+        with open(filename, "w") as f :
+            json.dump({ "traceEvents" : metadata + self.events, "displayTimeUnit" : "ms" }, f)
+
+class NullTracer :
+    """Tracer used when tracing is disabled, which records nothing."""
+
+    NULL_SPAN = nullcontext()
+
+    def span(self, name, **args) :
+        """Returns a context that does nothing.
+
+        Keyword arguments:
+        name - the name of the span
+        args - additional details to show with the span
+        """
+        return NullTracer.NULL_SPAN
+
+    def count(self, name, n=1) :
+        """Does nothing.
+
+        Keyword arguments:
+        name - the name of the counter
+        n - the amount to add
+        """
+        pass
+
+class StageTimer(NullTracer) :
+    """Tracer used for telemetry when not tracing, which records only
+    the total time of each stage (the spans without details) and the
+    totals of the counters, rather than a span for each file.
+    """
+
+    def __init__(self) :
+        self.stages = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def span(self, name, **args) :
+        """Times the with block if it is a stage, and otherwise
+        returns a context that does nothing.
+
+        Keyword arguments:
+        name - the name of the span
+        args - additional details to show with the span
+        """
+        return NullTracer.NULL_SPAN if len(args) > 0 else self.stage(name)
+
+    @contextmanager
+    def stage(self, name) :
+        """Adds the time spent within the with block to the total of a stage.
+
+        Keyword arguments:
+        name - the name of the stage
+        """
+        start = time.perf_counter()
+        try :
+            yield
+        finally :
+            with self.lock :
+                self.stages[name] = self.stages.get(name, 0) + time.perf_counter() - start
+
+    def count(self, name, n=1) :
+        """Adds to the total of a counter, such as of the bytes read.
+
+        Keyword arguments:
+        name - the name of the counter
+        n - the amount to add
+        """
+        with self.lock :
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def stageDurations(self) :
+        """Returns a dictionary with the total number of seconds spent in each stage."""
+        return dict(self.stages)
+
+class ThreadTracers :
+    """Passes spans to the tracer in use by the current thread, so
+    that sitemaps generated concurrently on different threads each
+    record their own trace. Threads that haven't chosen a tracer
+    record nothing.
+    """
+
+    def __init__(self) :
+        self._local = threading.local()
+
+    def use(self, t) :
+        """Sets the tracer of the current thread.
+
+        Keyword arguments:
+        t - a Tracer, or a NullTracer to stop recording
+        """
+        self._local.tracer = t
+
+    def current(self) :
+        """Gets the tracer of the current thread."""
+        return getattr(self._local, "tracer", NULL_TRACER)
+
+    def span(self, name, **args) :
+        """Records a span with the tracer of the current thread.
+
+        Keyword arguments:
+        name - the name of the span
+        args - additional details to show with the span
+        """
+        return self.current().span(name, **args)
+
+    def count(self, name, n=1) :
+        """Adds to a counter of the tracer of the current thread.
+
+        Keyword arguments:
+        name - the name of the counter
+        n - the amount to add
+        """
+        self.current().count(name, n)
+
+NULL_TRACER = NullTracer()
+tracer = ThreadTracers()
+
+def sitePath(root, f) :
+    """Forms the path to a file of the website from the path
+    relative to its root, such as ./dir/file.html.
+
+    Keyword arguments:
+    root - the root directory of the website
+    f - file name including path relative from the root of the website.
+    """
+    return f if root == "." else os.path.join(root, f)
+
+def gatherfiles(extensionsToInclude, followSymlinks=False, useIgnoreFiles=False, root=".") :
     """Walks the directory tree discovering
     files of specified types for inclusion in
-    sitemap.
+    sitemap, with paths relative from the root
+    of the website (e.g., ./dir/file.html).
 
     Keyword arguments:
     extensionsToInclude - a set of the file extensions to include in sitemap
+    followSymlinks - true to also walk directories that are symbolic links,
+        skipping any that lead back to a directory that encloses them
+    useIgnoreFiles - true to skip files and directories that match the rules
+        of .sitemapignore files in the directories that enclose them
+    root - the root directory of the website
     """
     if len(extensionsToInclude) == 0 :
         return []
     allfiles = []
-    for root, dirs, files in os.walk(".") :
+    enclosing = { "." : (fileIdentity(root),) } if followSymlinks else None
+    ignoreRules = { "." : () } if useIgnoreFiles else None
+    top = os.path.join(root, "")
+    for walked, dirs, files in os.walk(top, followlinks=followSymlinks) :
+        current = "." if len(walked) == len(top) else os.path.join(".", walked[len(top):])
+        if useIgnoreFiles :
+            rules = ignoreRules.pop(current) + readIgnoreFile(current, root)
+            if len(rules) > 0 :
+                dirs[:] = [ d for d in dirs if not ignoredPath(os.path.join(current, d), rules, True) ]
+                files = [ f for f in files if not ignoredPath(os.path.join(current, f), rules, False) ]
+            for d in dirs :
+                ignoreRules[os.path.join(current, d)] = rules
+        if followSymlinks :
+            chain = enclosing.pop(current)
+            for d in dirs[:] :
+                path = os.path.join(current, d)
+                identity = fileIdentity(sitePath(root, path))
+                if identity is None or identity in chain :
+                    dirs.remove(d)
+                    if useIgnoreFiles :
+                        ignoreRules.pop(path)
+                else :
+                    enclosing[path] = chain + (identity,)
         for f in files :
             if getFileExtension(f) in extensionsToInclude :
-                allfiles.append(os.path.join(root, f))
+                allfiles.append(os.path.join(current, f))
     return allfiles
 
+SITEMAP_IGNORE_FILENAME = ".sitemapignore"
+
+def compileIgnorePattern(pattern) :
+    """Compiles a pattern in gitignore syntax into a regular expression
+    that matches paths relative to the directory of the ignore file.
+    Returns a tuple (regex, negated, directoryOnly), or None if the line
+    is blank or a comment.
+
+    Keyword arguments:
+    pattern - a line of an ignore file
+    """
+    pattern = pattern.rstrip("\n")
+    if not pattern.endswith("\\ ") :
+        pattern = pattern.rstrip()
+    if len(pattern) == 0 or pattern[0] == "#" :
+        return None
+    negated = pattern[0] == "!"
+    if negated :
+        pattern = pattern[1:]
+    elif pattern[0] == "\\" :
+        pattern = pattern[1:]
+    directoryOnly = pattern.endswith("/")
+    pattern = pattern.rstrip("/")
+    if len(pattern) == 0 :
+        return None
+    anchored = "/" in pattern
+    pattern = pattern.lstrip("/")
+    regex = []
+    i = 0
+    while i < len(pattern) :
+        c = pattern[i]
+        if pattern.startswith("**/", i) and (i == 0 or pattern[i-1] == "/") :
+            regex.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("**", i) and i + 2 == len(pattern) and (i == 0 or pattern[i-1] == "/") :
+            regex.append(".*")
+            i += 2
+        elif c == "*" :
+            regex.append("[^/]*")
+            i += 1
+        elif c == "?" :
+            regex.append("[^/]")
+            i += 1
+        elif c == "[" and pattern.find("]", i + 2) > 0 :
+            j = pattern.find("]", i + 2)
+            chars = pattern[i+1:j]
+            if chars[0] == "!" :
+                chars = "^" + chars[1:]
+            regex.append("[" + chars.replace("\\", "\\\\") + "]")
+            i = j + 1
+        elif c == "\\" and i + 1 < len(pattern) :
+            regex.append(re.escape(pattern[i+1]))
+            i += 2
+        else :
+            regex.append(re.escape(c))
+            i += 1
+    prefix = "" if anchored else "(?:.*/)?"
+    return re.compile(prefix + "".join(regex) + "$", flags=re.S), negated, directoryOnly
+
+def readIgnoreFile(directory, root=".") :
+    """Reads and compiles the rules of the .sitemapignore file in a
+    directory, if it has one, returning a tuple of the rules, each of
+    which is a tuple (directory, regex, negated, directoryOnly).
+
+    Keyword arguments:
+    directory - the directory relative from the root of the website
+    root - the root directory of the website
+    """
+    filename = sitePath(root, os.path.join(directory, SITEMAP_IGNORE_FILENAME))
+    rules = []
+    try :
+        if os.path.isfile(filename) :
+            with open(filename, "r", errors="surrogateescape") as ignore :
+                for line in ignore :
+                    rule = compileIgnorePattern(line)
+                    if rule is not None :
+                        rules.append((directory + "/",) + rule)
+    except OSError :
+        print("WARNING: OS error while reading:", filename)
+    return tuple(rules)
+
+def ignoredPath(path, rules, isDirectory) :
+    """Checks if a path is ignored by the rules of .sitemapignore files,
+    where the last rule that matches decides, and rules of ignore files
+    in deeper directories come after those of the directories enclosing them.
+
+    Keyword arguments:
+    path - the path of the file or directory relative from the root of the website.
+    rules - the rules of the enclosing ignore files (see readIgnoreFile)
+    isDirectory - true if the path is a directory
+    """
+    for directory, regex, negated, directoryOnly in reversed(rules) :
+        if (isDirectory or not directoryOnly) and path.startswith(directory) and regex.match(path, len(directory)) :
+            return not negated
+    return False
+
+def fileIdentity(f) :
+    """Gets a tuple (device, inode) that identifies the file or
+    directory that a path leads to after following any symbolic
+    links, or None if it can't be determined.
+
+    Keyword arguments:
+    f - the path
+    """
+    try :
+        st = os.stat(f)
+    except OSError :
+        return None
+    return (st.st_dev, st.st_ino)
+
 INDEX_FILENAMES = { "index.html", "index.shtml" }
 
 def sortname(f, dropExtension=False) :
@@ -81,10 +441,57 @@ def urlsort(files, dropExtension=False) :
     files.sort(key = lambda f : sortname(f, dropExtension))
     files.sort(key = lambda f : f.count("/"))
 
+class FileRecord :
+    """A file of the website together with the values derived from
+    its path that the stages of generating the sitemap need, which
+    are computed once when the file is discovered rather than by
+    each stage. Uses __slots__ to keep the memory per file small.
+    """
+
+    __slots__ = ("path", "extension", "depth", "sortname")
+
+    def __init__(self, path, dropExtension=False) :
+        """Creates the record of a file.
+
+        Keyword arguments:
+        path - file name including path relative from the root of the website.
+        dropExtension - true to drop extensions of .html from the filename when sorting
+        """
+        self.path = path
+        i = path.rfind(".")
+        self.extension = sys.intern(path[i+1:].lower()) if i >= 0 and path.rfind("/") < i else None
+        self.depth = path.count("/")
+        self.sortname = sortname(path, dropExtension)
+
+    def isHTML(self) :
+        """Checks if the file is an HTML file (see isHTMLFile)."""
+        return self.extension in HTML_EXTENSIONS
+
+def fileRecords(files, dropExtension=False) :
+    """Creates the records of a list of files, keeping any that
+    are already records.
+
+    Keyword arguments:
+    files - a list of filenames or FileRecords
+    dropExtension - true to drop extensions of .html from the filename when sorting
+    """
+    return [ f if isinstance(f, FileRecord) else FileRecord(f, dropExtension) for f in files ]
+
+def sortRecords(records) :
+    """Sorts records in the same order as urlsort, with a primary
+    sort by depth in the website, and a secondary sort alphabetically.
+
+    Keyword arguments:
+    records - a list of FileRecords
+    """
+    records.sort(key = operator.attrgetter("depth", "sortname"))
 
 RE_FLAGS = re.I | re.M | re.S
 RE_META_TAG = re.compile(r"<meta([^>]*)>", flags=RE_FLAGS)
 
+RE_META_LASTMOD = re.compile(r"""(?:property|name)\s*=\s*["']\s*(?:article:modified_time|last-modified)\s*["']""", flags=re.I)
+RE_META_CONTENT = re.compile(r"""content\s*=\s*(?:"([^"]*)"|'([^']*)')""", flags=re.I)
+
 def hasMetaRobotsNoindex(f) :
     """Checks whether an html file contains
     <meta name="robots" content="noindex"> or
@@ -95,21 +502,68 @@ def hasMetaRobotsNoindex(f) :
     Keyword arguments:
     f - Filename including path
     """
+    return scanHead(f)[0]
+
+def scanHead(f, findLastmod=False) :
+    """Checks the head of an html file for a noindex directive, as
+    hasMetaRobotsNoindex does, and optionally, in the same read of
+    the file, for the date that the page was last modified, from
+    <meta property="article:modified_time"> or <meta name="last-modified">.
+    Returns a tuple with whether it has a noindex directive and the
+    date as a lastmod (see parseMetaDate), which is None if not found.
+
+    Keyword arguments:
+    f - Filename including path
+    findLastmod - true to look for the date that the page was last modified
+    """
     try:
-        with open(f, "r", errors="surrogateescape") as file :
+        with tracer.span("scanHead", file=f), open(f, "r", errors="surrogateescape") as file :
             contents = file.read()
+            tracer.count("bytesRead", file.buffer.tell())
             m = re.search("</head>", contents, flags=re.I)
             if not m :
                 m = re.search("<body>", contents, flags=re.I)
             all_meta_tags = RE_META_TAG.findall(contents, endpos=m.start()) if m else RE_META_TAG.findall(contents)
+            noindex, date = False, None
             for tag in all_meta_tags :
                 if re.search("name\\s*=\\s*\"\\s*robots", tag, flags=re.I) and re.search("content\\s*=\\s*\".*noindex", tag, flags=re.I) :
-                    return True
-            return False
+                    noindex = True
+                    if not findLastmod :
+                        break
+                elif findLastmod and date is None and RE_META_LASTMOD.search(tag) :
+                    content = RE_META_CONTENT.search(tag)
+                    if content :
+                        date = parseMetaDate(content.group(1) if content.group(1) is not None else content.group(2))
+            return noindex, date
     except OSError:
         print("WARNING: OS error while checking for noindex directive in:", f)
         print("Assuming", f, "doesn't have noindex directive.")
-    return False
+    return False, None
+
+def parseMetaDate(value) :
+    """Converts the date from a meta tag of an html page to a lastmod
+    date in the format of the dates of commits (e.g., 2024-05-01T10:00:00+00:00),
+    or to just the date if it has no time. The date may be in ISO 8601
+    format, where times without a time zone are treated as UTC, or in
+    the format of the Last-Modified header of HTTP (e.g., Wed, 01 May 2024
+    10:00:00 GMT). Returns None if it is neither.
+
+    Keyword arguments:
+    value - the content of the meta tag
+    """
+    value = html.unescape(value).strip()
+    try :
+        if re.match(r"^\d{4}-\d{2}-\d{2}$", value) :
+            return datetime.strptime(value, "%Y-%m-%d").strftime("%Y-%m-%d")
+        if re.match(r"^\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}", value) :
+            d = datetime.fromisoformat(value[:-1] + "+00:00" if value[-1] in "zZ" else value)
+        else :
+            d = email.utils.parsedate_to_datetime(value)
+    except (ValueError, TypeError) :
+        return None
+    if d.tzinfo is None :
+        d = d.replace(tzinfo=timezone.utc)
+    return d.isoformat(timespec="seconds")
 
 
 def getFileExtension(f) :
@@ -154,9 +608,9 @@ def createExtensionSet(includeHTML, includePDF, additionalExt) :
     
     return fileExtensionsToInclude
     
-def robotsBlocked(f, blockedPaths=[]) :
-    """Checks if robots are blocked from acessing the
-    url.
+def pathBlocked(f, blockedPaths) :
+    """Checks if the path of the file begins with any of
+    the blocked paths, without opening the file.
 
     Keyword arguments:
     f - file name including path relative from the root of the website.
@@ -169,9 +623,80 @@ def robotsBlocked(f, blockedPaths=[]) :
         for b in blockedPaths :
             if f2.startswith(b) :
                 return True
-    if not isHTMLFile(f) : 
-        return False
-    return hasMetaRobotsNoindex(f)
+    return False
+
+def robotsBlocked(f, blockedPaths=[], noindexCache=None, root=".", headerRules=None, metaLastmods=None) :
+    """Checks if robots are blocked from acessing the
+    url (see blockedReason).
+
+    Keyword arguments:
+    f - file name including path relative from the root of the website,
+        or its FileRecord.
+    blockedPaths - a list of paths blocked by robots.txt
+    noindexCache - optional dictionary of the results of noindex checks (see blockedReason)
+    root - the root directory of the website
+    headerRules - optional HeaderRules of a _headers file (see blockedReason)
+    metaLastmods - optional dictionary for the lastmod dates from meta tags (see blockedReason)
+    """
+    return blockedReason(f, blockedPaths, noindexCache, root, headerRules, metaLastmods) is not None
+
+def blockedReason(f, blockedPaths=[], noindexCache=None, root=".", headerRules=None, metaLastmods=None) :
+    """Finds why robots are blocked from acessing the url, returning
+    paths if its path is blocked, headers if a rule of the _headers
+    file attaches a noindex, noindex if it is an html file with a
+    noindex directive, or None if robots aren't blocked.
+
+    Keyword arguments:
+    f - file name including path relative from the root of the website,
+        or its FileRecord.
+    blockedPaths - a list of paths blocked by robots.txt
+    noindexCache - optional dictionary of the results of noindex checks
+        by file identity (see fileIdentity), so that files reachable by
+        multiple paths (e.g., via symbolic links) are checked only once
+    root - the root directory of the website
+    headerRules - optional HeaderRules of a _headers file, which are
+        checked, for files of any type, before opening the file
+    metaLastmods - optional dictionary in which the lastmod dates that html
+        files declare in meta tags of their heads are recorded (see scanHead)
+    """
+    if isinstance(f, FileRecord) :
+        path, html = f.path, f.isHTML()
+    else :
+        path, html = f, isHTMLFile(f)
+    if pathBlocked(path, blockedPaths) :
+        return "paths"
+    if headerRules is not None and headerRules.noindex(path) :
+        return "headers"
+    if html and cachedNoindex(path, noindexCache, root, metaLastmods) :
+        return "noindex"
+    return None
+
+def cachedNoindex(f, noindexCache=None, root=".", metaLastmods=None) :
+    """Checks an html file for a noindex directive, consulting
+    and updating the cache of results if there is one.
+
+    Keyword arguments:
+    f - file name including path relative from the root of the website.
+    noindexCache - optional dictionary of the results of scanHead
+        by file identity (see blockedReason), which isn't used for files
+        without an identity (e.g., broken symbolic links)
+    root - the root directory of the website
+    metaLastmods - optional dictionary in which the lastmod date from
+        the meta tags of the file is recorded, if it has one
+    """
+    if noindexCache is None :
+        noindex, date = scanHead(sitePath(root, f), metaLastmods is not None)
+    else :
+        identity = fileIdentity(sitePath(root, f))
+        if identity is None :
+            noindex, date = scanHead(sitePath(root, f), metaLastmods is not None)
+        else :
+            if identity not in noindexCache :
+                noindexCache[identity] = scanHead(sitePath(root, f), metaLastmods is not None)
+            noindex, date = noindexCache[identity]
+    if date is not None :
+        metaLastmods[f] = date
+    return noindex
 
 def parseRobotsTxt(robotsFile="robots.txt") :
     """Parses a robots.txt if present in the root of the
@@ -215,158 +740,3465 @@ def parseRobotsTxt(robotsFile="robots.txt") :
         print("Assuming nothing disallowed.")
     return blockedPaths
 
-def lastmod(f) :
+class HeaderRules :
+    """The rules of a Netlify or Cloudflare Pages style _headers file
+    that attach an X-Robots-Tag with a noindex directive to paths,
+    compiled into a single regular expression, along with a second for
+    the rules that detach the X-Robots-Tag (Cloudflare's ! prefix).
+    """
+
+    def __init__(self, noindexPatterns, detachPatterns) :
+        """Compiles the rules.
+
+        Keyword arguments:
+        noindexPatterns - a list of the path patterns that attach a noindex
+        detachPatterns - a list of the path patterns that detach the X-Robots-Tag
+        """
+        self.noindexPattern = compileHeaderPatterns(noindexPatterns)
+        self.detachPattern = compileHeaderPatterns(detachPatterns)
+
+    def noindex(self, f) :
+        """Checks if the url of a file has an X-Robots-Tag with a noindex
+        directive, without opening the file. The rules are matched against
+        the path of the file, and its path without the .html extension or
+        index.html, since hosts serve the file at each of those, unless a
+        rule that detaches the X-Robots-Tag matches any of them.
+
+        Keyword arguments:
+        f - file name including path relative from the root of the website.
+        """
+        if self.noindexPattern is None :
+            return False
+        path = f[1:] if f[0] == "." else f
+        urls = { path, sortname(path, False), sortname(path, True) }
+        if not any(self.noindexPattern.fullmatch(u) for u in urls) :
+            return False
+        return self.detachPattern is None or not any(self.detachPattern.fullmatch(u) for u in urls)
+
+def compileHeaderPatterns(patterns) :
+    """Compiles the path patterns of the rules of a _headers file into a
+    single regular expression, where * matches anything and a :placeholder
+    matches a segment of the path, or returns None if there are no patterns.
+
+    Keyword arguments:
+    patterns - a list of path patterns
+    """
+    if len(patterns) == 0 :
+        return None
+    alternatives = []
+    for pattern in patterns :
+        segments = []
+        for segment in pattern.split("/") :
+            if len(segment) > 1 and segment[0] == ":" :
+                segments.append("[^/]+")
+            else :
+                segments.append("".join(".*" if part == "*" else re.escape(part) for part in re.split(r"(\*)", segment)))
+        alternatives.append("/".join(segments))
+    return re.compile("|".join("(?:" + a + ")" for a in alternatives), flags=re.S)
+
+def xRobotsTagNoindex(value) :
+    """Checks if the value of an X-Robots-Tag header has a noindex
+    (or none) directive for all robots, ignoring directives that
+    are only for a specific user agent (e.g., googlebot: noindex).
+
+    Keyword arguments:
+    value - the value of the header
+    """
+    directives = [ d.strip().lower() for d in value.split(",") ]
+    if len(directives) > 0 and ":" in directives[0] :
+        agent = directives[0].split(":")[0].strip()
+        if agent not in ("unavailable_after", "max-snippet", "max-image-preview", "max-video-preview") :
+            return False
+    return "noindex" in directives or "none" in directives
+
+def parseHeadersFile(headersFile) :
+    """Parses a Netlify or Cloudflare Pages style _headers file, in which
+    each unindented line is a path pattern, followed by indented lines of
+    the headers for it, and returns the HeaderRules of its X-Robots-Tag
+    headers. Patterns that are full urls are matched by their paths.
+
+    Keyword arguments:
+    headersFile - the name of the _headers file
+    """
+    noindexPatterns = []
+    detachPatterns = []
+    try :
+        with open(headersFile, "r", errors="surrogateescape") as headers :
+            pattern = None
+            for line in headers :
+                stripped = line.strip()
+                if len(stripped) == 0 or stripped[0] == "#" :
+                    continue
+                if line[0] not in " \t" :
+                    pattern = stripped
+                    if "://" in pattern :
+                        slash = pattern.find("/", pattern.find("://") + 3)
+                        pattern = pattern[slash:] if slash >= 0 else "/"
+                elif pattern is not None :
+                    name, colon, value = stripped.partition(":")
+                    name = name.strip().lower()
+                    if name == "x-robots-tag" and xRobotsTagNoindex(value) :
+                        noindexPatterns.append(pattern)
+                    elif name.startswith("!") and name[1:].strip() == "x-robots-tag" :
+                        detachPatterns.append(pattern)
+    except OSError :
+        print("WARNING: OS error while parsing", headersFile)
+        print("Assuming no X-Robots-Tag headers.")
+    return HeaderRules(noindexPatterns, detachPatterns)
+
+def lastmod(f, root=".", horizon=None) :
     """Determines the date when the file was last modified and
     returns a string with the date formatted as required for
     the lastmod tag in an xml sitemap.
 
     Keyword arguments:
     f - filename
+    root - the directory that f is relative to, which is
+        within the git repository
+    horizon - optional HistoryHorizon that bounds the search
+        of the history
     """
-    mod = subprocess.run(['git', 'log', '-1', '--format=%cI', f],
-                    stdout=subprocess.PIPE,
-                    universal_newlines=True).stdout.strip()
+    with tracer.span("lastmod", file=f) :
+        tracer.count("gitCalls")
+        mod = subprocess.run(['git', 'log', '-1', '--format=%cI'] + ([] if horizon is None else [horizon.sinceArgument()]) + [f],
+                        stdout=subprocess.PIPE,
+                        cwd=root,
+                        universal_newlines=True).stdout.strip()
+    if len(mod) == 0 and horizon is not None and horizon.tracked(f, root) :
+        horizon.count += 1
+        mod = horizon.date
     if len(mod) == 0 :
-        mod = datetime.now().astimezone().replace(microsecond=0).isoformat()
+        mod = currentLastmod()
     return mod
 
-def urlstring(f, baseUrl, dropExtension=False) :
-    """Forms a string with the full url from a filename and base url.
+def currentLastmod() :
+    """Gets the current date and time formatted as lastmod does
+    for files that aren't in the git history."""
+    return datetime.now().astimezone().replace(microsecond=0).isoformat()
+
+class HistoryHorizon :
+    """A bound on how far back in the git history the lastmod dates
+    are searched for. Files that were committed, but not changed by
+    any commit within the horizon, get the date of the newest commit
+    beyond it, which is no earlier than their last change.
+    """
+
+    def __init__(self, since, date) :
+        """Creates a horizon.
+
+        Keyword arguments:
+        since - POSIX timestamp of the oldest committer date within the horizon
+        date - the committer date, in the format of %cI, of the newest commit
+            beyond the horizon, which is the fallback lastmod
+        """
+        self.since = since
+        self.date = date
+        self.count = 0
+        self.trackedFiles = None
+
+    def sinceArgument(self) :
+        """Forms the option that limits git log to the horizon."""
+        return "--since=" + datetime.fromtimestamp(self.since, timezone.utc).isoformat()
+
+    def tracked(self, f, root=".") :
+        """Checks if a file is in the commit at HEAD, listing the files
+        of the commit the first time that this is checked.
+
+        Keyword arguments:
+        f - filename relative to root
+        root - the root directory of the website
+        """
+        if self.trackedFiles is None :
+            tracer.count("gitCalls")
+            listing = subprocess.run(['git', 'ls-tree', '-r', '-z', '--name-only', 'HEAD'],
+                            stdout=subprocess.PIPE,
+                            stderr=subprocess.DEVNULL,
+                            cwd=root).stdout
+            self.trackedFiles = set(os.fsdecode(listing).split("\0"))
+        return os.path.normpath(f).replace(os.sep, "/") in self.trackedFiles
+
+def parseHistoryHorizon(horizon) :
+    """Parses a history horizon, which is either a number of commits
+    or a date in W3C datetime format (e.g., 2020-01-01). Returns a
+    tuple with either the number of commits and None, or None and the
+    date as a POSIX timestamp.
 
     Keyword arguments:
-    f - filename
-    baseUrl - address of the root of the website
-    dropExtension - true to drop extensions of .html from the filename in urls
+    horizon - the horizon as a string
     """
-    if f[0]=="." :
-        u = f[1:]
-    else :
-        u = f
-    u = sortname(u, dropExtension)
-    if len(u) >= 1 and u[0]=="/" and len(baseUrl) >= 1 and baseUrl[-1]=="/" :
-        u = u[1:]
-    elif (len(u)==0 or u[0]!="/") and (len(baseUrl)==0 or baseUrl[-1]!="/") :
-        u = "/" + u
-    return baseUrl + u
+    if horizon.isdigit() :
+        if int(horizon) < 1 :
+            raise ValueError("Invalid history horizon: " + horizon)
+        return int(horizon), None
+    try :
+        return None, lastmodTimestamp(horizon)
+    except ValueError :
+        raise ValueError("Invalid history horizon: " + horizon)
 
-xmlSitemapEntryTemplate = """<url>
-<loc>{0}</loc>
-<lastmod>{1}</lastmod>
-</url>"""	
+def resolveHistoryHorizon(horizon, root=".", history=None) :
+    """Finds the boundary of a history horizon in the history of HEAD,
+    returning a HistoryHorizon, or None if the entire history is within
+    the horizon, in which case there is no need to bound the search.
 
-def removeTime(dateString) :
-    """Removes the time from a date-time.
+    Keyword arguments:
+    horizon - a number of commits, or a date, as a string (see parseHistoryHorizon)
+    root - the root directory of the website
+    history - optional GitHistory, in which case git isn't run
+    """
+    count, since = parseHistoryHorizon(horizon)
+    if history is not None :
+        boundary = history.horizonBoundary(count, since)
+        return None if boundary is None else HistoryHorizon(*boundary)
+    if count is not None :
+        tracer.count("gitCalls")
+        commits = subprocess.run(['git', 'log', '--skip=' + str(count - 1), '-2', '--format=%ct %cI'],
+                        stdout=subprocess.PIPE,
+                        stderr=subprocess.DEVNULL,
+                        cwd=root,
+                        universal_newlines=True).stdout.split()
+        if len(commits) < 4 :
+            return None
+        return HistoryHorizon(int(commits[0]), commits[3])
+    since = int(math.ceil(since))
+    horizon = HistoryHorizon(since, "")
+    tracer.count("gitCalls")
+    beyond = subprocess.run(['git', 'log', '-1', '--format=%cI', '--until=' + datetime.fromtimestamp(since - 1, timezone.utc).isoformat()],
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.DEVNULL,
+                    cwd=root,
+                    universal_newlines=True).stdout.strip()
+    if len(beyond) == 0 :
+        return None
+    horizon.date = beyond
+    return horizon
+
+class GitReaderError(Exception) :
+    """Raised when the built-in git reader doesn't support the
+    layout of a repository, or can't find an object in it, in
+    which case the git command is used instead."""
+
+# The date that GitHistory.lastCommitDates gives files that weren't
+# changed within the history horizon.
+BEYOND_HORIZON = "beyond-horizon"
+
+GIT_OBJECT_TYPES = { 1 : "commit", 2 : "tree", 3 : "blob", 4 : "tag" }
+GIT_OFS_DELTA = 6
+GIT_REF_DELTA = 7
+GIT_TREE_MODE = b"40000"
+
+# Maximum number of parsed trees, and of objects read from each pack,
+# kept in memory by the built-in git reader.
+GIT_TREE_CACHE_SIZE = 65536
+GIT_PACK_CACHE_SIZE = 1024
+
+# Environment variables that change where git finds a repository,
+# which the built-in git reader leaves to the git command.
+GIT_ENVIRONMENT = { "GIT_DIR", "GIT_COMMON_DIR", "GIT_OBJECT_DIRECTORY", "GIT_ALTERNATE_OBJECT_DIRECTORIES", "GIT_WORK_TREE", "GIT_REPLACE_REF_BASE", "GIT_NO_REPLACE_OBJECTS" }
+
+def readVarint(data, i) :
+    """Reads a size in the variable length encoding of git deltas,
+    returning a tuple with the size and the index after it.
 
     Keyword arguments:
-    dateString - The date-time.
+    data - the delta
+    i - the index of the size within the delta
     """
-    return dateString[:10]
+    value = 0
+    shift = 0
+    while True :
+        c = data[i]
+        i += 1
+        value |= (c & 0x7f) << shift
+        shift += 7
+        if not c & 0x80 :
+            return value, i
 
-def xmlEscapeCharacters(f):
-    """Escapes any characters that XML requires escaped, such as
-    ampersands, etc.
+def applyDelta(base, delta) :
+    """Reconstructs an object stored in a pack as a delta from another.
 
     Keyword arguments:
-    f - the filename
+    base - the contents of the base object
+    delta - the delta
     """
-    return f.replace(
-        "&", "&amp;"
-    ).replace(
-        "<", "&lt;"
-    ).replace(
-        ">", "&gt;"
-    ).replace(
-        "'", "&apos;"
-    ).replace(
-        '"', "&quot;"
-    )
+    size, i = readVarint(delta, 0)
+    if size != len(base) :
+        raise GitReaderError("delta doesn't match its base")
+    size, i = readVarint(delta, i)
+    result = bytearray()
+    while i < len(delta) :
+        op = delta[i]
+        i += 1
+        if op & 0x80 :
+            offset = 0
+            for k in range(4) :
+                if op & (1 << k) :
+                    offset |= delta[i] << (8 * k)
+                    i += 1
+            length = 0
+            for k in range(3) :
+                if op & (0x10 << k) :
+                    length |= delta[i] << (8 * k)
+                    i += 1
+            result += base[offset:offset + (length or 0x10000)]
+        elif op :
+            result += delta[i:i + op]
+            i += op
+        else :
+            raise GitReaderError("invalid delta")
+    if len(result) != size :
+        raise GitReaderError("delta produced the wrong size")
+    return bytes(result)
 
-def xmlSitemapEntry(f, baseUrl, dateString, dropExtension=False, dateOnly=False) :
-    """Forms a string with an entry formatted for an xml sitemap
-    including lastmod date.
+class GitPack :
+    """A pack of git objects, with its version 2 index."""
+
+    def __init__(self, indexFile) :
+        """Opens a pack from its index file.
+
+        Keyword arguments:
+        indexFile - the name of the .idx file of the pack
+        """
+        with open(indexFile, "rb") as f :
+            index = f.read()
+        if index[:4] != b"\377tOc" or struct.unpack_from(">I", index, 4)[0] != 2 :
+            raise GitReaderError("unsupported pack index version: " + indexFile)
+        self.fanout = struct.unpack_from(">256I", index, 8)
+        n = self.fanout[255]
+        self.names = index[1032:1032 + 20 * n]
+        self.offsets = index[1032 + 24 * n:1032 + 28 * n]
+        self.largeOffsets = index[1032 + 28 * n:len(index) - 40]
+        with open(indexFile[:-4] + ".pack", "rb") as f :
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.cache = {}
+
+    def close(self) :
+        """Closes the memory map of the pack."""
+        self.data.close()
+
+    def find(self, sha) :
+        """Finds the offset of an object within the pack,
+        or returns None if it isn't in the pack.
+
+        Keyword arguments:
+        sha - the binary object id
+        """
+        lo = self.fanout[sha[0] - 1] if sha[0] > 0 else 0
+        hi = self.fanout[sha[0]]
+        while lo < hi :
+            mid = (lo + hi) // 2
+            name = self.names[20 * mid:20 * mid + 20]
+            if name < sha :
+                lo = mid + 1
+            elif name > sha :
+                hi = mid
+            else :
+                offset = struct.unpack_from(">I", self.offsets, 4 * mid)[0]
+                if offset & 0x80000000 :
+                    offset = struct.unpack_from(">Q", self.largeOffsets, 8 * (offset & 0x7fffffff))[0]
+                return offset
+        return None
+
+    def inflate(self, i) :
+        """Decompresses the zlib stream that begins at an offset of the pack.
+
+        Keyword arguments:
+        i - the offset
+        """
+        d = zlib.decompressobj()
+        parts = []
+        while not d.eof :
+            chunk = self.data[i:i + 65536]
+            if len(chunk) == 0 :
+                raise GitReaderError("truncated pack")
+            parts.append(d.decompress(chunk))
+            i += len(chunk)
+        return b"".join(parts)
+
+    def read(self, offset, history) :
+        """Reads the object at an offset of the pack, following any
+        chain of deltas, returning a tuple with its type and contents.
+
+        Keyword arguments:
+        offset - the offset of the object
+        history - the GitHistory, for base objects outside of the pack
+        """
+        if offset in self.cache :
+            return self.cache[offset]
+        start = offset
+        deltas = []
+        while True :
+            if offset in self.cache :
+                kind, data = self.cache[offset]
+                break
+            c = self.data[offset]
+            kind = (c >> 4) & 7
+            i = offset + 1
+            while c & 0x80 :
+                c = self.data[i]
+                i += 1
+            if kind == GIT_OFS_DELTA :
+                c = self.data[i]
+                i += 1
+                distance = c & 0x7f
+                while c & 0x80 :
+                    c = self.data[i]
+                    i += 1
+                    distance = ((distance + 1) << 7) | (c & 0x7f)
+                deltas.append(self.inflate(i))
+                offset -= distance
+            elif kind == GIT_REF_DELTA :
+                deltas.append(self.inflate(i + 20))
+                kind, data = history.readObject(self.data[i:i + 20])
+                break
+            elif kind in GIT_OBJECT_TYPES :
+                kind, data = GIT_OBJECT_TYPES[kind], self.inflate(i)
+                break
+            else :
+                raise GitReaderError("invalid object type in pack")
+        for delta in reversed(deltas) :
+            data = applyDelta(data, delta)
+        if len(self.cache) >= GIT_PACK_CACHE_SIZE :
+            self.cache.clear()
+        self.cache[start] = (kind, data)
+        return kind, data
+
+def findGitDirectories(root) :
+    """Finds the git repository that contains a directory, returning a
+    tuple with its git directory, its common directory (which differ
+    for linked worktrees), and the top level of its working tree.
 
     Keyword arguments:
-    f - filename
-    baseUrl - address of the root of the website
-    dateString - lastmod date correctly formatted
-    dropExtension - true to drop extensions of .html from the filename in urls
+    root - the directory
     """
-    return xmlSitemapEntryTemplate.format(
-        urlstring(xmlEscapeCharacters(f), baseUrl, dropExtension),
-        removeTime(dateString) if dateOnly else dateString
-    )
+    top = os.path.realpath(root)
+    while True :
+        dotgit = os.path.join(top, ".git")
+        if os.path.isdir(dotgit) :
+            gitDir = dotgit
+            break
+        if os.path.isfile(dotgit) :
+            with open(dotgit, "r") as f :
+                line = f.read().strip()
+            if not line.startswith("gitdir:") :
+                raise GitReaderError("invalid .git file")
+            gitDir = os.path.join(top, line[7:].strip())
+            break
+        parent = os.path.dirname(top)
+        if parent == top :
+            raise GitReaderError("not a git repository")
+        top = parent
+    commonDir = gitDir
+    if os.path.isfile(os.path.join(gitDir, "commondir")) :
+        with open(os.path.join(gitDir, "commondir"), "r") as f :
+            commonDir = os.path.normpath(os.path.join(gitDir, f.read().strip()))
+    return gitDir, commonDir, top
 
-def writeTextSitemap(files, baseUrl, dropExtension=False) :
-    """Writes a plain text sitemap to the file sitemap.txt.
+RE_GIT_UNSUPPORTED_CONFIG = re.compile(r"^\s*(objectformat\s*=\s*sha256|refstorage\s*=\s*reftable)", flags=re.I | re.M)
 
-    Keyword Arguments:
-    files - a list of filenames
-    baseUrl - the base url to the root of the website
-    dropExtension - true to drop extensions of .html from the filename in urls
+class GitHistory :
+    """Reads the history of a git repository directly from its
+    object database (loose objects and packs) without running git,
+    to find the date of the last commit that changed each file, as
+    git log -1 --format=%cI does.
     """
-    with open("sitemap.txt", "w") as sitemap :
-        for f in files :
-            sitemap.write(urlstring(f, baseUrl, dropExtension))
-            sitemap.write("\n")
-            
-def writeXmlSitemap(files, baseUrl, dropExtension=False, dateOnly=False) :
-    """Writes an xml sitemap to the file sitemap.xml.
 
-    Keyword Arguments:
-    files - a list of filenames
-    baseUrl - the base url to the root of the website
-    dropExtension - true to drop extensions of .html from the filename in urls
+    def __init__(self, root) :
+        """Opens the repository that contains a directory. Raises
+        GitReaderError if the layout of the repository isn't supported.
+
+        Keyword arguments:
+        root - a directory within the working tree of the repository
+        """
+        if GIT_ENVIRONMENT & set(os.environ) :
+            raise GitReaderError("git environment variables are set")
+        self.gitDir, self.commonDir, self.worktree = findGitDirectories(root)
+        config = os.path.join(self.commonDir, "config")
+        if os.path.isfile(config) :
+            with open(config, "r", errors="surrogateescape") as f :
+                if RE_GIT_UNSUPPORTED_CONFIG.search(f.read()) :
+                    raise GitReaderError("unsupported object format or ref storage")
+        if os.path.exists(os.path.join(self.commonDir, "reftable")) or os.path.exists(os.path.join(self.commonDir, "info", "grafts")) :
+            raise GitReaderError("unsupported ref storage or grafts")
+        self.packedRefs = {}
+        packedRefs = os.path.join(self.commonDir, "packed-refs")
+        if os.path.isfile(packedRefs) :
+            with open(packedRefs, "r", errors="surrogateescape") as f :
+                for line in f :
+                    if len(line) > 41 and line[0] not in "#^" :
+                        self.packedRefs[line[41:].strip()] = bytes.fromhex(line[:40])
+        if any(ref.startswith("refs/replace/") for ref in self.packedRefs) or self.hasLooseRefs("refs/replace") :
+            raise GitReaderError("replace refs are in use")
+        self.objectDirs = [ os.path.join(self.commonDir, "objects") ]
+        alternates = os.path.join(self.objectDirs[0], "info", "alternates")
+        if os.path.isfile(alternates) :
+            with open(alternates, "r") as f :
+                for line in f :
+                    line = line.strip()
+                    if len(line) > 0 and line[0] != "#" :
+                        self.objectDirs.append(os.path.join(self.objectDirs[0], line))
+        self.packs = [
+            GitPack(index)
+            for objects in self.objectDirs
+            for index in sorted(glob.glob(os.path.join(glob.escape(objects), "pack", "*.idx")))
+        ]
+        try :
+            self.shallow = set()
+            shallow = os.path.join(self.commonDir, "shallow")
+            if os.path.isfile(shallow) :
+                with open(shallow, "r") as f :
+                    self.shallow = { bytes.fromhex(line.strip()) for line in f if len(line.strip()) > 0 }
+            self.head = self.resolveRef("HEAD")
+        except (GitReaderError, OSError, ValueError) :
+            self.close()
+            raise
+        self.commits = {}
+        self.trees = {}
+        # Directories to add to safe.directory if git must be run
+        # after all because the reader fails (see computeLastmods).
+        self.trustDirectories = ()
+
+    def close(self) :
+        """Closes the packs of the repository. The history
+        can't be read any further once closed.
+        """
+        for pack in self.packs :
+            pack.close()
+        self.packs = []
+
+    def hasLooseRefs(self, directory) :
+        """Checks if there are any loose refs within a directory of refs.
+
+        Keyword arguments:
+        directory - the directory relative to the common directory, such as refs/replace
+        """
+        return any(len(files) > 0 for _, _, files in os.walk(os.path.join(self.commonDir, directory)))
+
+    def resolveRef(self, name, depth=0) :
+        """Resolves a ref, such as HEAD, to a binary commit id, or
+        returns None if the ref doesn't exist (e.g., an unborn branch).
+
+        Keyword arguments:
+        name - the name of the ref
+        depth - the number of symbolic refs followed so far
+        """
+        if depth > 5 :
+            raise GitReaderError("too many levels of symbolic refs")
+        path = os.path.join(self.gitDir if name == "HEAD" else self.commonDir, *name.split("/"))
+        if os.path.isfile(path) :
+            with open(path, "r") as f :
+                content = f.read().strip()
+            if content.startswith("ref:") :
+                return self.resolveRef(content[4:].strip(), depth + 1)
+            try :
+                return bytes.fromhex(content)
+            except ValueError :
+                raise GitReaderError("invalid ref: " + name)
+        return self.packedRefs.get(name)
+
+    def readObject(self, sha) :
+        """Reads an object, returning a tuple with its type and contents.
+
+        Keyword arguments:
+        sha - the binary object id
+        """
+        for pack in self.packs :
+            offset = pack.find(sha)
+            if offset is not None :
+                return pack.read(offset, self)
+        name = sha.hex()
+        for objects in self.objectDirs :
+            path = os.path.join(objects, name[:2], name[2:])
+            if os.path.isfile(path) :
+                with open(path, "rb") as f :
+                    header, _, data = zlib.decompress(f.read()).partition(b"\0")
+                return header.split(b" ")[0].decode(), data
+        raise GitReaderError("missing object " + name)
+
+    def commit(self, sha) :
+        """Parses a commit, returning a tuple with the id of its tree,
+        the ids of its parents, and its committer date as a timestamp
+        and in the format of %cI. Shallow commits have no parents.
+
+        Keyword arguments:
+        sha - the binary commit id
+        """
+        if sha not in self.commits :
+            kind, data = self.readObject(sha)
+            if kind != "commit" :
+                raise GitReaderError("not a commit: " + sha.hex())
+            tree = None
+            parents = []
+            timestamp, dateString = 0, None
+            for line in data.split(b"\n\n", 1)[0].split(b"\n") :
+                if line.startswith(b"tree ") :
+                    tree = bytes.fromhex(line[5:].decode())
+                elif line.startswith(b"parent ") :
+                    parents.append(bytes.fromhex(line[7:].decode()))
+                elif line.startswith(b"committer ") :
+                    fields = line.rsplit(b" ", 2)
+                    timestamp = int(fields[1])
+                    offset = fields[2].decode()
+                    minutes = int(offset[1:3]) * 60 + int(offset[3:5])
+                    zone = timezone(timedelta(minutes=-minutes if offset[0] == "-" else minutes))
+                    dateString = datetime.fromtimestamp(timestamp, zone).isoformat()
+            self.commits[sha] = (tree, () if sha in self.shallow else tuple(parents), timestamp, dateString)
+        return self.commits[sha]
+
+    def tree(self, sha) :
+        """Parses a tree, returning a dictionary mapping the names of its
+        entries to tuples of their modes and binary object ids.
+
+        Keyword arguments:
+        sha - the binary tree id
+        """
+        if sha not in self.trees :
+            kind, data = self.readObject(sha)
+            if kind != "tree" :
+                raise GitReaderError("not a tree: " + sha.hex())
+            entries = {}
+            i = 0
+            while i < len(data) :
+                space = data.index(b" ", i)
+                nul = data.index(b"\0", space)
+                entries[data[space + 1:nul]] = (data[i:space], data[nul + 1:nul + 21])
+                i = nul + 21
+            if len(self.trees) >= GIT_TREE_CACHE_SIZE :
+                self.trees.clear()
+            self.trees[sha] = entries
+        return self.trees[sha]
+
+    def changedPaths(self, a, b, paths, depth=0, changed=None) :
+        """Finds the paths whose entries differ between two trees, only
+        descending into the subtrees that differ. Returns a set of the paths.
+
+        Keyword arguments:
+        a - the binary id of a tree, or None for an empty tree
+        b - the binary id of the other tree, or None for an empty tree
+        paths - an iterable of paths as tuples of their binary components
+        depth - the number of components of the paths already matched
+        changed - the set to add the changed paths to
+        """
+        if changed is None :
+            changed = set()
+        if a == b :
+            return changed
+        entriesA = self.tree(a) if a is not None else {}
+        entriesB = self.tree(b) if b is not None else {}
+        groups = {}
+        for path in paths :
+            groups.setdefault(path[depth], []).append(path)
+        for name, group in groups.items() :
+            entryA = entriesA.get(name)
+            entryB = entriesB.get(name)
+            if entryA == entryB :
+                continue
+            deeper = []
+            for path in group :
+                if len(path) == depth + 1 :
+                    changed.add(path)
+                else :
+                    deeper.append(path)
+            if len(deeper) > 0 :
+                self.changedPaths(
+                    entryA[1] if entryA is not None and entryA[0] == GIT_TREE_MODE else None,
+                    entryB[1] if entryB is not None and entryB[0] == GIT_TREE_MODE else None,
+                    deeper,
+                    depth + 1,
+                    changed
+                )
+        return changed
+
+    def repoPath(self, f, root=".", resolveSymlinks=False) :
+        """Forms the path of a file relative to the top level of the
+        working tree as git would for a path relative to the root of the
+        website, or returns None if it is outside of the working tree.
+
+        Keyword arguments:
+        f - file name including path relative from the root of the website.
+        root - the root directory of the website
+        resolveSymlinks - true to resolve symbolic links in the path
+        """
+        if resolveSymlinks :
+            path = os.path.realpath(sitePath(root, f))
+        else :
+            path = os.path.normpath(os.path.join(os.path.realpath(root), f))
+        relative = os.path.relpath(path, self.worktree)
+        if relative == ".." or relative.startswith(".." + os.sep) :
+            return None
+        return relative.replace(os.sep, "/")
+
+    def commitsByDate(self) :
+        """Generates the commits reachable from HEAD, newest first by
+        committer date, in the same order as git log, as tuples of the
+        binary commit id and the result of commit (see commit)."""
+        if self.head is None :
+            return
+        seen = { self.head }
+        queue = [ (-self.commit(self.head)[2], 0, self.head) ]
+        count = 1
+        while len(queue) > 0 :
+            sha = heapq.heappop(queue)[2]
+            commit = self.commit(sha)
+            yield sha, commit
+            for parent in commit[1] :
+                if parent not in seen :
+                    seen.add(parent)
+                    heapq.heappush(queue, (-self.commit(parent)[2], count, parent))
+                    count += 1
+
+    def horizonBoundary(self, count=None, since=None) :
+        """Finds the boundary of a history horizon of either a number of
+        commits or a date, returning a tuple with the timestamp of the
+        oldest committer date within the horizon and the date, in the
+        format of %cI, of the newest commit beyond it, or None if the
+        entire history is within the horizon (see resolveHistoryHorizon).
+
+        Keyword arguments:
+        count - the number of commits within the horizon
+        since - the oldest date within the horizon as a POSIX timestamp
+        """
+        if since is not None :
+            since = int(math.ceil(since))
+        for i, (sha, commit) in enumerate(self.commitsByDate()) :
+            if count is not None and i == count - 1 :
+                since = commit[2]
+            elif count is None and commit[2] < since :
+                return since, commit[3]
+            elif count is not None and i == count :
+                return since, commit[3]
+        return None
+
+    def lastCommitDates(self, paths, deadline=None, since=None) :
+        """Finds the committer date of the last commit that changed each
+        path with a single walk of the history from HEAD, newest commits
+        first, simplifying the history of each path as git log does: at a
+        merge, a path follows the first parent whose version of it is the
+        same, and otherwise the merge is the commit that changed it. Returns
+        a dictionary mapping the paths to dates in the format of %cI, or
+        None for paths that were never committed. Paths whose date isn't
+        found before the deadline are left out. Paths that were committed,
+        but not changed since the given time, map to BEYOND_HORIZON.
+
+        Keyword arguments:
+        paths - an iterable of paths relative to the top level of the working tree
+        deadline - a time.monotonic() value after which to stop, or None for no deadline
+        since - optional POSIX timestamp of the oldest committer date to search
+        """
+        components = { tuple(os.fsencode(p).split(b"/")) : p for p in paths }
+        dates = {}
+        if self.head is None :
+            return { p : None for p in components.values() }
+        pending = { self.head : set(components) }
+        queue = [ (-self.commit(self.head)[2], 0, self.head) ]
+        count = 1
+        while len(queue) > 0 :
+            if deadline is not None and time.monotonic() >= deadline :
+                return dates
+            sha = heapq.heappop(queue)[2]
+            remaining = pending.pop(sha, None)
+            if not remaining :
+                continue
+            tree, parents, timestamp, dateString = self.commit(sha)
+            if since is not None and timestamp < since :
+                pending[sha] = remaining
+                for sha, remaining in pending.items() :
+                    existing = self.changedPaths(self.commit(sha)[0], None, remaining)
+                    for path in remaining :
+                        dates[components[path]] = BEYOND_HORIZON if path in existing else None
+                return dates
+            # The changed paths, usually few, are removed from the set of
+            # pending paths in place, which then passes to the parent.
+            if len(parents) == 0 :
+                changed = self.changedPaths(tree, None, remaining)
+                remaining.difference_update(changed)
+                for path in remaining :
+                    dates[components[path]] = None
+                remaining = changed
+            for parent in parents :
+                changed = self.changedPaths(tree, self.commit(parent)[0], remaining)
+                remaining.difference_update(changed)
+                if len(remaining) > 0 :
+                    if parent not in pending :
+                        pending[parent] = remaining
+                        heapq.heappush(queue, (-self.commit(parent)[2], count, parent))
+                        count += 1
+                    else :
+                        pending[parent] |= remaining
+                remaining = changed
+                if len(remaining) == 0 :
+                    break
+            for path in remaining :
+                dates[components[path]] = dateString
+        return dates
+
+def openGitHistory(root) :
+    """Opens the git history of the repository that contains a directory
+    with the built-in git reader, or returns None, with an explanation,
+    if the reader doesn't support it.
+
+    Keyword arguments:
+    root - a directory within the working tree of the repository
     """
-    with open("sitemap.xml", "w") as sitemap :
-        sitemap.write('<?xml version="1.0" encoding="UTF-8"?>\n')
-        sitemap.write('<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n')
-        for f in files :
-            sitemap.write(xmlSitemapEntry(f, baseUrl, lastmod(f), dropExtension, dateOnly))
-            sitemap.write("\n")
-        sitemap.write('</urlset>\n')
+    try :
+        return GitHistory(root)
+    except (GitReaderError, OSError, ValueError) as e :
+        print("Using the git command for lastmod dates, since the built-in git reader can't be used:", e)
+        return None
 
-def set_outputs(names_values) :
-    """Sets the GitHub Action outputs.
+def trustRepository(*directories) :
+    """Adds directories to the safe.directory setting of the global
+    git configuration, which is needed for running git in the container.
 
     Keyword arguments:
-    names_values - Dictionary of output names with values
+    directories - the directories
     """
-    if "GITHUB_OUTPUT" in os.environ :
-        with open(os.environ["GITHUB_OUTPUT"], "a") as f :
-            for name, value in names_values.items() :
-                print("{0}={1}".format(name, value), file=f)
-    else : # Fall-back to deprecated set-output for non-updated runners
-        for name, value in names_values.items() :
-            print("::set-output name={0}::{1}".format(name, value))
+    for directory in directories :
+        tracer.count("gitCalls")
+        subprocess.run(['git', 'config', '--global', '--add', 'safe.directory', directory])
 
-def sanitize_path(websiteRoot) :
-    """Verifies specified website root is within the current working directory.
+LASTMOD_FALLBACKS = { "mtime", "omit" }
+
+# Portion of the time budget held in reserve for the work that remains
+# after switching to the fallback for lastmod dates, such as writing.
+TIME_BUDGET_RESERVE = 0.1
+
+def parseTimeBudget(budget) :
+    """Parses a time budget, which is a non-negative number of seconds,
+    with 0 for no budget. Returns the number of seconds as a float.
 
     Keyword arguments:
-    websiteRoot - the root of the website relative to current working directory
+    budget - the time budget as a number or a string
     """
-    repo_root = os.getcwd()
-    safe_path = os.path.realpath(websiteRoot)
-    prefix = os.path.commonpath([repo_root, safe_path])
-    if prefix == repo_root :
-        return os.path.join(repo_root, safe_path)
-    else :
-        print("ERROR: Specified website root directory appears to be outside of current working directory. Exiting....")
-        exit(1)
+    try :
+        seconds = float(budget)
+    except ValueError :
+        raise ValueError("Invalid time budget: " + str(budget))
+    if not seconds >= 0 :
+        raise ValueError("Invalid time budget: " + str(budget))
+    return seconds
 
-def adjust_path(path):
-    """Checks that path is formatted as expected, adjusting if necessary.
+def fallbackLastmod(f, fallback, root=".") :
+    """Determines a lastmod date without consulting the git history,
+    for use when the time budget is nearly exhausted. Returns None
+    if the lastmod should be omitted.
 
     Keyword arguments:
-    path - the path to check and adjust
+    f - filename
+    fallback - either mtime to use the file's modification time
+        from the filesystem, or omit to leave out the lastmod
+    root - the root directory of the website
     """
-    path = path.replace("\\", "/").removeprefix(".")
-    if len(path) == 0:
+    if fallback == "mtime" :
+        try :
+            return datetime.fromtimestamp(os.path.getmtime(sitePath(root, f))).astimezone().replace(microsecond=0).isoformat()
+        except OSError :
+            print("WARNING: OS error while getting modification time of:", f)
+    return None
+
+def historyLastmods(history, files, deadline=None, fallback="mtime", followSymlinks=False, root=".", checkpoint=None, horizon=None) :
+    """Determines the lastmod dates of a list of files with the built-in
+    git reader, in a single walk of the history, returning a tuple as
+    computeLastmods does.
+
+    Keyword arguments:
+    history - a GitHistory of the repository that contains the website
+    files - a list of filenames
+    deadline - a time.monotonic() value after which the fallback
+        is used for the files whose dates aren't found yet, or None
+    fallback - either mtime or omit (see fallbackLastmod)
+    followSymlinks - true to resolve symbolic links in the paths of the
+        files, which is the path in the git history (see computeLastmods)
+    root - the root directory of the website
+    checkpoint - optional Checkpoint (see computeLastmods)
+    horizon - optional HistoryHorizon (see computeLastmods)
+    """
+    paths = { f : history.repoPath(f, root, followSymlinks) for f in files }
+    with tracer.span("lastCommitDates", files=len(paths)) :
+        dates = history.lastCommitDates({ p for p in paths.values() if p is not None }, deadline, None if horizon is None else horizon.since)
+    lastmods = {}
+    degraded = 0
+    now = currentLastmod()
+    for f, path in paths.items() :
+        if path is not None and path not in dates :
+            lastmods[f] = fallbackLastmod(f, fallback, root)
+            degraded += 1
+            continue
+        if path is not None and dates[path] == BEYOND_HORIZON :
+            lastmods[f] = horizon.date
+            horizon.count += 1
+        else :
+            lastmods[f] = dates[path] if path is not None and dates[path] is not None else now
+        if checkpoint is not None :
+            checkpoint.state.setdefault("lastmods", {})[f] = lastmods[f]
+    if degraded > 0 :
+        warnDegraded(fallback, degraded)
+    if checkpoint is not None :
+        checkpoint.save(False)
+    return lastmods, degraded
+
+def computeLastmods(files, deadline=None, fallback="mtime", lastmodCache=None, root=".", checkpoint=None, history=None, horizon=None) :
+    """Determines the lastmod dates of a list of files, returning
+    a tuple with a dictionary mapping the files to their dates, and
+    the number of files whose dates came from the fallback because
+    the deadline passed.
+
+    Keyword arguments:
+    files - a list, or other iterable, of filenames
+    deadline - a time.monotonic() value after which the fallback
+        is used instead of lastmod, or None for no deadline
+    fallback - either mtime or omit (see fallbackLastmod)
+    lastmodCache - optional dictionary of lastmod dates by file identity
+        (see fileIdentity), so that the date of a file reachable by multiple
+        paths (e.g., via symbolic links) is determined only once, from the
+        path without symbolic links, which is the one in the git history
+        (files without an identity, such as broken links, aren't cached)
+    root - the root directory of the website
+    checkpoint - optional Checkpoint, which is given each lastmod date
+        from the git history as it is determined
+    history - optional GitHistory, in which case the dates are found with
+        the built-in git reader rather than by running git for each file,
+        unless the reader fails, in which case git is used after all. The
+        history is closed once the dates are found.
+    horizon - optional HistoryHorizon, which bounds the search of the history,
+        and counts the files that get its fallback date
+    """
+    if history is not None :
+        files = list(files)
+        try :
+            return historyLastmods(history, files, deadline, fallback, lastmodCache is not None, root, checkpoint, horizon)
+        except (GitReaderError, OSError, ValueError, IndexError, struct.error, zlib.error) as e :
+            print("WARNING: The built-in git reader failed, so using the git command for lastmod dates instead:", e)
+            trustRepository(*history.trustDirectories)
+        finally :
+            history.close()
+    lastmods = {}
+    degraded = 0
+    for f in files :
+        if deadline is not None and time.monotonic() >= deadline :
+            lastmods[f] = fallbackLastmod(f, fallback, root)
+            degraded += 1
+        elif lastmodCache is None :
+            lastmods[f] = lastmod(f, root, horizon)
+        else :
+            identity = fileIdentity(sitePath(root, f))
+            if identity is None :
+                lastmods[f] = lastmod(f, root, horizon)
+            else :
+                if identity not in lastmodCache :
+                    lastmodCache[identity] = lastmod(os.path.relpath(os.path.realpath(sitePath(root, f)), os.path.realpath(root)), root, horizon)
+                lastmods[f] = lastmodCache[identity]
+        if checkpoint is not None and f in lastmods and degraded == 0 :
+            checkpoint.state.setdefault("lastmods", {})[f] = lastmods[f]
+            checkpoint.save(False)
+    if degraded > 0 :
+        warnDegraded(fallback, degraded)
+    return lastmods, degraded
+
+def warnDegraded(fallback, count) :
+    """Warns that the time budget ran out before the lastmod
+    dates of some files were determined from the git history.
+
+    Keyword arguments:
+    fallback - the fallback used for their lastmod dates (see fallbackLastmod)
+    count - the number of files whose lastmod came from the fallback
+    """
+    print("WARNING: Time budget nearly exhausted. Used fallback ({0}) for the lastmod of the remaining {1} files.".format(fallback, count))
+
+# Maximum number of files waiting between the stages of the pipelined mode.
+PIPELINE_QUEUE_SIZE = 1024
+
+def queuedFiles(files) :
+    """Generates the files put in a queue, until None is put in it.
+
+    Keyword arguments:
+    files - a queue.Queue of filenames
+    """
+    while True :
+        f = files.get()
+        if f is None :
+            return
+        yield f
+
+def pipelinedFilterAndLastmods(records, blockedPaths=[], noindexCache=None, root=".", deadline=None, fallback="mtime", lastmodCache=None, checkpoint=None, known={}, history=None, horizon=None, headerRules=None, metaLastmods=None, excluded=None) :
+    """Filters the records of the files as robotsBlocked does, while a
+    background thread determines the lastmod dates of the files that pass
+    as soon as they do, rather than after all files have been filtered. The
+    files are passed between the stages through a bounded queue. Returns a
+    tuple with the list of the records that pass, in the original order, a
+    dictionary mapping the files to their lastmod dates, and the number of
+    files whose dates came from the fallback (see computeLastmods).
+
+    Keyword arguments:
+    records - an iterable of FileRecords
+    blockedPaths - a list of paths blocked by robots.txt
+    noindexCache - optional dictionary of the results of noindex checks (see robotsBlocked)
+    root - the root directory of the website
+    deadline - a time.monotonic() value after which the fallback is used (see computeLastmods)
+    fallback - either mtime or omit (see fallbackLastmod)
+    lastmodCache - optional dictionary of lastmod dates by file identity (see computeLastmods)
+    checkpoint - optional Checkpoint (see computeLastmods)
+    known - dictionary of files whose lastmod dates are already known, which are skipped
+    history - optional GitHistory (see computeLastmods), in which case the
+        background thread collects the files that pass and then finds all
+        of their dates in one walk of the history once filtering finishes
+    horizon - optional HistoryHorizon (see computeLastmods)
+    headerRules - optional HeaderRules of a _headers file (see robotsBlocked)
+    metaLastmods - optional dictionary for the lastmod dates from meta tags
+        (see robotsBlocked), in which case files with such a date are skipped
+    excluded - optional dictionary in which the files that don't pass are
+        counted by the reason for their exclusion (see blockedReason)
+    """
+    files = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    result = {}
+    current = tracer.current()
+    def determineLastmods() :
+        tracer.use(current)
+        try :
+            result["lastmods"] = computeLastmods(queuedFiles(files), deadline, fallback, lastmodCache, root, checkpoint, history, horizon)
+        except BaseException as e :
+            result["error"] = e
+            for f in queuedFiles(files) :
+                pass
+    thread = threading.Thread(target=determineLastmods, name="lastmod")
+    thread.start()
+    selected = []
+    try :
+        for r in records :
+            reason = blockedReason(r, blockedPaths, noindexCache, root, headerRules, metaLastmods)
+            if reason is None :
+                selected.append(r)
+                if r.path not in known and (metaLastmods is None or r.path not in metaLastmods) :
+                    files.put(r.path)
+            elif excluded is not None :
+                excluded[reason] = excluded.get(reason, 0) + 1
+    finally :
+        files.put(None)
+        thread.join()
+    if "error" in result :
+        raise result["error"]
+    lastmods, degraded = result["lastmods"]
+    return selected, lastmods, degraded
+
+def lastmodTimestamp(dateString) :
+    """Converts a lastmod date to a POSIX timestamp for comparing dates
+    that may be in different time zones. Dates without a time zone are
+    treated as UTC.
+
+    Keyword arguments:
+    dateString - a lastmod date in W3C datetime format
+    """
+    if len(dateString) < 10 :
+        dateString += "-01-01"[len(dateString) - 4:]
+    d = datetime.fromisoformat(dateString)
+    if d.tzinfo is None :
+        d = d.replace(tzinfo=timezone.utc)
+    return d.timestamp()
+
+def aggregateDirectoryLastmods(files, lastmods) :
+    """Replaces the lastmod of each index file (e.g., dir/index.html,
+    whose url is the directory) with the newest lastmod within its
+    subtree, computed bottom-up in a single pass over the lastmods of
+    the files, with no additional git queries. Entries without a lastmod
+    are ignored.
+
+    Keyword arguments:
+    files - a list of the filenames in the sitemap
+    lastmods - dictionary mapping filenames to lastmod dates, which is updated
+    """
+    newest = subtreeLastmods((f[:f.rfind("/")+1], lastmods.get(f)) for f in files)
+    for f in files :
+        slash = f.rfind("/")
+        if f[slash+1:] in INDEX_FILENAMES and f[:slash+1] in newest :
+            lastmods[f] = newest[f[:slash+1]][1]
+
+def subtreeLastmods(pairs) :
+    """Computes the newest lastmod within the subtree of each directory,
+    bottom-up in a single pass over the lastmods of the files. Returns a
+    dictionary mapping each directory (e.g., ./dir/) to a tuple with the
+    timestamp and the newest lastmod date.
+
+    Keyword arguments:
+    pairs - iterable of tuples (directory, lastmod) for the files in urlsort
+        order, where a lastmod of None is ignored
+    """
+    newest = {}
+    for directory, mod in pairs :
+        if mod is not None :
+            t = lastmodTimestamp(mod)
+            if directory not in newest or t > newest[directory][0] :
+                newest[directory] = (t, mod)
+    levels = {}
+    for directory in newest :
+        levels.setdefault(directory.count("/"), set()).add(directory)
+    for depth in range(max(levels, default=0), 1, -1) :
+        for directory in levels.get(depth, ()) :
+            parent = directory[:directory.rfind("/", 0, len(directory)-1)+1]
+            if parent not in newest or newest[directory][0] > newest[parent][0] :
+                newest[parent] = newest[directory]
+            levels.setdefault(depth-1, set()).add(parent)
+    return newest
+
+def urlstring(f, baseUrl, dropExtension=False) :
+    """Forms a string with the full url from a filename and base url.
+
+    Keyword arguments:
+    f - filename
+    baseUrl - address of the root of the website
+    dropExtension - true to drop extensions of .html from the filename in urls
+    """
+    if f[0]=="." :
+        u = f[1:]
+    else :
+        u = f
+    u = sortname(u, dropExtension)
+    if len(u) >= 1 and u[0]=="/" and len(baseUrl) >= 1 and baseUrl[-1]=="/" :
+        u = u[1:]
+    elif (len(u)==0 or u[0]!="/") and (len(baseUrl)==0 or baseUrl[-1]!="/") :
+        u = "/" + u
+    return baseUrl + u
+
+xmlSitemapEntryTemplate = """<url>
+<loc>{0}</loc>
+<lastmod>{1}</lastmod>
+</url>"""	
+
+xmlSitemapEntryNoLastmodTemplate = """<url>
+<loc>{0}</loc>
+</url>"""
+
+def removeTime(dateString) :
+    """Removes the time from a date-time.
+
+    Keyword arguments:
+    dateString - The date-time.
+    """
+    return dateString[:10]
+
+RE_XML_SPECIAL = re.compile(r"""[&<>'"]""")
+XML_ESCAPES = str.maketrans({ "&" : "&amp;", "<" : "&lt;", ">" : "&gt;", "'" : "&apos;", '"' : "&quot;" })
+
+def xmlEscapeCharacters(f):
+    """Escapes any characters that XML requires escaped, such as
+    ampersands, etc, in a single pass, and only if there are any.
+
+    Keyword arguments:
+    f - the filename
+    """
+    return f.translate(XML_ESCAPES) if RE_XML_SPECIAL.search(f) else f
+
+def xmlSitemapEntry(f, baseUrl, dateString, dropExtension=False, dateOnly=False, images=()) :
+    """Forms a string with an entry formatted for an xml sitemap
+    including lastmod date.
+
+    Keyword arguments:
+    f - filename
+    baseUrl - address of the root of the website
+    dateString - lastmod date correctly formatted, or None to omit the lastmod
+    dropExtension - true to drop extensions of .html from the filename in urls
+    dateOnly - true to include only the date in lastmod
+    images - optional iterable of the urls of the images on the page
+    """
+    if dateString is None :
+        entry = xmlSitemapEntryNoLastmodTemplate.format(urlstring(xmlEscapeCharacters(f), baseUrl, dropExtension))
+    else :
+        entry = xmlSitemapEntryTemplate.format(
+            urlstring(xmlEscapeCharacters(f), baseUrl, dropExtension),
+            removeTime(dateString) if dateOnly else dateString
+        )
+    return addImageEntries(entry, images)
+
+imageEntryTemplate = """
+<image:image>
+<image:loc>{0}</image:loc>
+</image:image>"""
+
+def addImageEntries(entry, images) :
+    """Adds <image:image> elements for the images on a page to its
+    entry in an xml sitemap, just before the closing </url>.
+
+    Keyword arguments:
+    entry - the entry for the page
+    images - an iterable of the urls of the images
+    """
+    tags = "".join(imageEntryTemplate.format(xmlEscapeCharacters(image)) for image in images)
+    return entry if len(tags) == 0 else entry[:-7] + tags + entry[-7:]
+
+# Maximum number of images listed for each page, which is the
+# limit of the image sitemap extension.
+MAX_IMAGES_PER_PAGE = 1000
+
+# Number of characters of a page read at a time when scanning
+# for images, and the maximum length of a tag that is carried over
+# from one chunk to the next, beyond which the tag is skipped.
+IMAGE_SCAN_CHUNK_SIZE = 65536
+MAX_IMAGE_TAG_LENGTH = 8192
+
+RE_IMAGE_SCAN = re.compile(r"""<!--|<(img|base)\b((?:[^>"']|"[^"]*"|'[^']*')*)>""", flags=re.I)
+RE_IMAGE_ATTRIBUTE = re.compile(r"""\s(src|href)\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+))""", flags=re.I)
+
+def pageImages(f, pageUrl, maxImages=MAX_IMAGES_PER_PAGE) :
+    """Generates the distinct urls of the images (the src of <img> tags)
+    of an html page, resolved against the url of the page (or its first <base>),
+    skipping comments and inline data. The page is scanned in a streaming
+    fashion, in chunks, so that only a chunk, and a tag that spans two
+    chunks, are in memory at once, and scanning stops after maxImages.
+
+    Keyword arguments:
+    f - filename including path
+    pageUrl - the url of the page
+    maxImages - the maximum number of images
+    """
+    found = set()
+    pending = ""
+    inComment = False
+    hasBase = False
+    try :
+        with tracer.span("pageImages", file=f), open(f, "r", errors="surrogateescape") as page :
+            while len(found) < maxImages :
+                chunk = page.read(IMAGE_SCAN_CHUNK_SIZE)
+                text = pending + chunk
+                pending = ""
+                i = 0
+                while len(found) < maxImages :
+                    if inComment :
+                        j = text.find("-->", i)
+                        if j < 0 :
+                            pending = text[-2:]
+                            break
+                        inComment = False
+                        i = j + 3
+                    m = RE_IMAGE_SCAN.search(text, i)
+                    if m is None :
+                        j = text.rfind("<", i)
+                        if j >= 0 and len(text) - j <= MAX_IMAGE_TAG_LENGTH :
+                            pending = text[j:]
+                        break
+                    i = m.end()
+                    if m.group(1) is None :
+                        inComment = True
+                        continue
+                    isImage = m.group(1).lower() == "img"
+                    if not isImage and hasBase :
+                        continue
+                    for a in RE_IMAGE_ATTRIBUTE.finditer(m.group(2)) :
+                        if (a.group(1).lower() == "src") == isImage :
+                            url = html.unescape(a.group(2) or a.group(3) or a.group(4) or "").strip()
+                            if isImage :
+                                url = urllib.parse.urljoin(pageUrl, url) if len(url) > 0 else ""
+                                if url.startswith(("http://", "https://")) and url not in found :
+                                    found.add(url)
+                                    yield url
+                            elif len(url) > 0 :
+                                pageUrl = urllib.parse.urljoin(pageUrl, url)
+                                hasBase = True
+                            break
+                if len(chunk) == 0 :
+                    break
+            tracer.count("bytesRead", page.buffer.tell())
+    except OSError :
+        print("WARNING: OS error while scanning for images in:", f)
+
+@contextmanager
+def atomicWrite(filename) :
+    """Opens a temporary file next to filename for writing, and
+    renames it to filename once writing completes, so that readers
+    never observe a partially written file.
+
+    Keyword arguments:
+    filename - the name of the file to write
+    """
+    directory, name = os.path.split(filename)
+    tmp = os.path.join(directory, "." + name + ".tmp")
+    try :
+        with open(tmp, "w") as f :
+            yield f
+        os.replace(tmp, filename)
+    finally :
+        if os.path.exists(tmp) :
+            os.remove(tmp)
+
+# Limits of the sitemap protocol on the number of urls, and the
+# uncompressed size in bytes, of a single sitemap file.
+SITEMAP_MAX_URLS = 50000
+SITEMAP_MAX_BYTES = 52428800
+
+XML_SITEMAP_HEADER = '<?xml version="1.0" encoding="UTF-8"?>\n<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+XML_SITEMAP_FOOTER = '</urlset>\n'
+IMAGE_SITEMAP_HEADER = '<?xml version="1.0" encoding="UTF-8"?>\n<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9" xmlns:image="http://www.google.com/schemas/sitemap-image/1.1">\n'
+SITEMAP_INDEX_FILENAME = "sitemap-index.xml"
+
+# Names of the files that the sitemap writers create, including
+# shards and temporary files.
+RE_SITEMAP_FILENAME = re.compile(r"^\.?sitemap(\d*|-index)\.(xml|txt)(\.tmp)?$")
+
+def isGeneratedSitemap(f, root=".", outputDir=None) :
+    """Checks if a file of the website is one of the files that the
+    sitemap writers create in the output directory, which are never
+    listed in the sitemap, even if files of their type are included.
+
+    Keyword arguments:
+    f - file name including path relative from the root of the website.
+    root - the root directory of the website
+    outputDir - the directory of the sitemap files, which defaults to root
+    """
+    if not RE_SITEMAP_FILENAME.match(os.path.basename(f)) :
+        return False
+    return os.path.abspath(os.path.dirname(sitePath(root, f))) == os.path.abspath(root if outputDir is None else outputDir)
+
+def shardFilename(k, ext) :
+    """Forms the name of a shard of a sitemap that is too large
+    for a single file.
+
+    Keyword arguments:
+    k - the number of the shard, beginning at 1
+    ext - the extension of the sitemap, xml or txt
+    """
+    return "sitemap{0}.{1}".format(k, ext)
+
+# The comment that writeSitemapIndex puts in the indexes that it writes,
+# which marks the index, and the shards that it lists, as written by
+# this action, and so safe to replace or remove on a later run.
+GENERATED_INDEX_MARKER = "<!-- Generated by generate-sitemap, which replaces or removes this index and the sitemaps that it lists. -->"
+
+RE_SHARD_FILENAME = re.compile(r"^sitemap\d+\.(xml|txt)$")
+RE_INDEX_LOC = re.compile(r"<loc>([^<]*)</loc>")
+
+def generatedShards(outputDir) :
+    """Finds the shards of a sitemap written by a previous run, from the
+    sitemap index in a directory, if this action wrote it (see
+    GENERATED_INDEX_MARKER). Returns a set of the filenames of the shards,
+    or None if there is no index or it wasn't written by this action.
+
+    Keyword arguments:
+    outputDir - the directory of the sitemap files
+    """
+    try :
+        with open(os.path.join(outputDir, SITEMAP_INDEX_FILENAME), "r", errors="surrogateescape") as index :
+            contents = index.read()
+    except OSError :
+        return None
+    if GENERATED_INDEX_MARKER not in contents :
+        return None
+    names = { html.unescape(loc).strip().rpartition("/")[2] for loc in RE_INDEX_LOC.findall(contents) }
+    return { name for name in names if RE_SHARD_FILENAME.match(name) }
+
+def removeIfExists(filename) :
+    """Removes a file if it exists, such as a sitemap left by a
+    prior run that no longer applies.
+
+    Keyword arguments:
+    filename - the file to remove
+    """
+    if os.path.isfile(filename) :
+        os.remove(filename)
+
+def writeShardedSitemap(entries, sitemapFormat, baseUrl, header=None, outputDir=".") :
+    """Writes the entries of a sitemap in a streaming fashion. If they
+    fit within the limits of the sitemap protocol, they are written to
+    sitemap.xml (or sitemap.txt). Otherwise, they are split among
+    sitemap1.xml, sitemap2.xml, etc (or .txt), and a sitemap index is
+    written to sitemap-index.xml. The only files that are removed are the
+    index and shards of a previous run that are no longer needed, if that
+    index was written by this action (see generatedShards). Other sitemap
+    files left from before are reported but kept. Returns a tuple with the
+    name of the sitemap (or the index), the number of shards, and the number
+    of entries.
+    The entries are written in blocks of RENDER_BLOCK_SIZE with a single
+    write, except for a block that crosses into the next shard.
+
+    Keyword arguments:
+    entries - iterable of the rendered entries in order, without newlines
+    sitemapFormat - xml or txt
+    baseUrl - the base url to the root of the website
+    header - the opening of each xml sitemap, which defaults to XML_SITEMAP_HEADER
+    outputDir - the directory for the sitemap files
+    """
+    ext = "xml" if sitemapFormat == "xml" else "txt"
+    entries = iter(entries)
+    if ext == "xml" :
+        header = XML_SITEMAP_HEADER if header is None else header
+        footer = XML_SITEMAP_FOOTER
+    else :
+        header, footer = "", ""
+    shards = []
+    sitemap = None
+    count = 0
+    size = 0
+    total = 0
+    try :
+        while True :
+            block = list(itertools.islice(entries, RENDER_BLOCK_SIZE))
+            if len(block) == 0 :
+                break
+            text = "\n".join(block) + "\n"
+            n = len(text) if text.isascii() else len(text.encode("utf-8", "surrogateescape"))
+            if sitemap is not None and count + len(block) <= SITEMAP_MAX_URLS and size + n + len(footer) <= SITEMAP_MAX_BYTES :
+                # The whole block fits in the current shard.
+                sitemap.write(text)
+                count += len(block)
+                size += n
+                total += len(block)
+                continue
+            for entry in block :
+                line = entry + "\n"
+                n = len(line) if line.isascii() else len(line.encode("utf-8", "surrogateescape"))
+                if sitemap is None or count == SITEMAP_MAX_URLS or size + n + len(footer) > SITEMAP_MAX_BYTES :
+                    if sitemap is not None :
+                        sitemap.write(footer)
+                        sitemap.close()
+                    shards.append(os.path.join(outputDir, "." + shardFilename(len(shards) + 1, ext) + ".tmp"))
+                    sitemap = open(shards[-1], "w")
+                    sitemap.write(header)
+                    count, size = 0, len(header)
+                sitemap.write(line)
+                count += 1
+                size += n
+                total += 1
+        if sitemap is None :
+            shards.append(os.path.join(outputDir, "." + shardFilename(1, ext) + ".tmp"))
+            sitemap = open(shards[-1], "w")
+            sitemap.write(header)
+        sitemap.write(footer)
+        sitemap.close()
+        previous = generatedShards(outputDir)
+        indexFile = os.path.join(outputDir, SITEMAP_INDEX_FILENAME)
+        if len(shards) == 1 :
+            name = "sitemap." + ext
+            written = set()
+            os.replace(shards[0], os.path.join(outputDir, name))
+            if previous is not None :
+                os.remove(indexFile)
+            elif os.path.isfile(indexFile) :
+                print("WARNING: Keeping", indexFile, "which wasn't written by generate-sitemap, although the sitemap is now", name)
+        else :
+            name = SITEMAP_INDEX_FILENAME
+            written = { shardFilename(k, ext) for k in range(1, len(shards) + 1) }
+            for k, tmp in enumerate(shards, start=1) :
+                target = os.path.join(outputDir, shardFilename(k, ext))
+                if os.path.isfile(target) and (previous is None or shardFilename(k, ext) not in previous) :
+                    print("WARNING: Replacing", target, "which wasn't written by generate-sitemap")
+                os.replace(tmp, target)
+            if previous is None and os.path.isfile(indexFile) :
+                print("WARNING: Replacing", indexFile, "which wasn't written by generate-sitemap")
+            writeSitemapIndex([ shardFilename(k, ext) for k in range(1, len(shards) + 1) ], baseUrl, outputDir)
+            if os.path.isfile(os.path.join(outputDir, "sitemap." + ext)) :
+                print("WARNING: Keeping", os.path.join(outputDir, "sitemap." + ext), "although the sitemap is now split into the sitemaps listed by", indexFile)
+        for stale in sorted((previous or set()) - written) :
+            removeIfExists(os.path.join(outputDir, stale))
+    finally :
+        if sitemap is not None :
+            sitemap.close()
+        for tmp in shards :
+            removeIfExists(tmp)
+    return name, len(shards), total
+
+def writeSitemapIndex(sitemaps, baseUrl, outputDir=".") :
+    """Writes a sitemap index to the file sitemap-index.xml, marked
+    as written by this action (see GENERATED_INDEX_MARKER).
+
+    Keyword arguments:
+    sitemaps - the names of the sitemap files relative to the root of the website
+    baseUrl - the base url to the root of the website
+    outputDir - the directory for the sitemap index
+    """
+    with atomicWrite(os.path.join(outputDir, SITEMAP_INDEX_FILENAME)) as index :
+        index.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        index.write(GENERATED_INDEX_MARKER + "\n")
+        index.write('<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n')
+        for name in sitemaps :
+            index.write("<sitemap>\n<loc>{0}</loc>\n</sitemap>\n".format(urlstring(xmlEscapeCharacters(name), baseUrl)))
+        index.write('</sitemapindex>\n')
+
+def textSitemapEntries(files, baseUrl, dropExtension=False) :
+    """Generates the entries of a plain text sitemap.
+
+    Keyword Arguments:
+    files - a list of filenames
+    baseUrl - the base url to the root of the website
+    dropExtension - true to drop extensions of .html from the filename in urls
+    """
+    return renderRecords(fileRecords(files, dropExtension), baseUrl, "txt")
+
+def xmlSitemapEntries(files, baseUrl, dropExtension=False, dateOnly=False, lastmods=None, root=".") :
+    """Generates the entries of an xml sitemap.
+
+    Keyword Arguments:
+    files - a list of filenames
+    baseUrl - the base url to the root of the website
+    dropExtension - true to drop extensions of .html from the filename in urls
+    dateOnly - true to include only the date in lastmod
+    lastmods - optional dictionary mapping filenames to already known lastmod
+        dates, which otherwise are determined with lastmod
+    root - the root directory of the website
+    """
+    return renderRecords(fileRecords(files, dropExtension), baseUrl, "xml", dateOnly, lastmods, root)
+
+# The number of entries rendered, and written, at a time.
+RENDER_BLOCK_SIZE = 4096
+
+def renderRecords(records, baseUrl, sitemapFormat, dateOnly=False, lastmods=None, root=".", images=False) :
+    """Generates the entries of a sitemap in the specified format from
+    the records of the files, using the sortname of each record for its
+    url rather than deriving it from the path again.
+
+    Keyword Arguments:
+    records - an iterable of FileRecords
+    baseUrl - the base url to the root of the website
+    sitemapFormat - xml or txt
+    dateOnly - true to include only the date in lastmod
+    lastmods - optional dictionary mapping filenames to already known lastmod
+        dates, which otherwise are determined with lastmod
+    root - the root directory of the website
+    images - true to scan html pages for images (see pageImages) and list them
+        in the entries of an xml sitemap with the image sitemap extension
+    """
+    for block in renderRecordBlocks(records, baseUrl, sitemapFormat, dateOnly, lastmods, root, images) :
+        yield from block
+
+def renderRecordBlocks(records, baseUrl, sitemapFormat, dateOnly=False, lastmods=None, root=".", images=False) :
+    """Generates the entries of a sitemap as in renderRecords, but in
+    lists of up to RENDER_BLOCK_SIZE entries. Unless listing images,
+    each block is rendered with a pass over it for each step, where
+    the urls of the block are escaped only if any of them has characters
+    that need escaping, and the entries are concatenated from the pieces
+    of the templates rather than formatted. The rendering of each block
+    is traced as a span, rather than of each entry as when listing images.
+
+    Keyword Arguments:
+    records - an iterable of FileRecords
+    baseUrl - the base url to the root of the website
+    sitemapFormat - xml or txt
+    dateOnly - true to include only the date in lastmod
+    lastmods - optional dictionary mapping filenames to already known lastmod
+        dates, which otherwise are determined with lastmod
+    root - the root directory of the website
+    images - true to scan html pages for images (see pageImages) and list them
+        in the entries of an xml sitemap with the image sitemap extension
+    """
+    xml = sitemapFormat == "xml"
+    base = baseUrl[:-1] if len(baseUrl) > 0 and baseUrl[-1] == "/" else baseUrl
+    current = tracer.current()
+    records = iter(records)
+    if xml and images :
+        while True :
+            block = []
+            for r in itertools.islice(records, RENDER_BLOCK_SIZE) :
+                f = r.path
+                if xml :
+                    dateString = lastmods[f] if lastmods is not None and f in lastmods else lastmod(f, root)
+                with current.span("render", file=f) :
+                    u = r.sortname[1:] if len(f) > 0 and f[0] == "." else r.sortname
+                    if xml :
+                        u = xmlEscapeCharacters(u)
+                    u = base + u if len(u) > 0 and u[0] == "/" else base + "/" + u
+                    if not xml :
+                        entry = u
+                    elif dateString is None :
+                        entry = xmlSitemapEntryNoLastmodTemplate.format(u)
+                    else :
+                        entry = xmlSitemapEntryTemplate.format(u, removeTime(dateString) if dateOnly else dateString)
+                if xml and images and r.isHTML() :
+                    pageUrl = r.sortname[1:] if len(f) > 0 and f[0] == "." else r.sortname
+                    pageUrl = base + pageUrl if len(pageUrl) > 0 and pageUrl[0] == "/" else base + "/" + pageUrl
+                    entry = addImageEntries(entry, pageImages(sitePath(root, f), pageUrl))
+                block.append(entry)
+            if len(block) == 0 :
+                return
+            yield block
+    openLoc, _, rest = xmlSitemapEntryTemplate.partition("{0}")
+    closeLoc, _, closeUrl = rest.partition("{1}")
+    openNoLastmod, _, closeNoLastmod = xmlSitemapEntryNoLastmodTemplate.partition("{0}")
+    while True :
+        block = list(itertools.islice(records, RENDER_BLOCK_SIZE))
+        if len(block) == 0 :
+            return
+        with current.span("render", file=block[0].path, entries=len(block)) :
+            urls = [ r.sortname[1:] if r.path[:1] == "." else r.sortname for r in block ]
+            if xml and RE_XML_SPECIAL.search("".join(urls)) :
+                urls = [ xmlEscapeCharacters(u) for u in urls ]
+            urls = [ base + u if u[:1] == "/" else base + "/" + u for u in urls ]
+            if xml :
+                if lastmods is None :
+                    dates = [ lastmod(r.path, root) for r in block ]
+                else :
+                    dates = [ lastmods[r.path] if r.path in lastmods else lastmod(r.path, root) for r in block ]
+                if dateOnly :
+                    dates = [ None if d is None else removeTime(d) for d in dates ]
+                urls = [
+                    openNoLastmod + u + closeNoLastmod if d is None else openLoc + u + closeLoc + d + closeUrl
+                    for u, d in zip(urls, dates)
+                ]
+        yield urls
+
+def writeTextSitemap(files, baseUrl, dropExtension=False, outputDir=".") :
+    """Writes a plain text sitemap to the file sitemap.txt (or
+    shards of it with an index if too large), returning the
+    name of the file written.
+
+    Keyword Arguments:
+    files - a list of filenames
+    baseUrl - the base url to the root of the website
+    dropExtension - true to drop extensions of .html from the filename in urls
+    outputDir - the directory for the sitemap files
+    """
+    return writeShardedSitemap(textSitemapEntries(files, baseUrl, dropExtension), "txt", baseUrl, outputDir=outputDir)[0]
+            
+def writeXmlSitemap(files, baseUrl, dropExtension=False, dateOnly=False, lastmods=None, root=".", outputDir=None) :
+    """Writes an xml sitemap to the file sitemap.xml (or shards
+    of it with an index if too large), returning the name of the
+    file written.
+
+    Keyword Arguments:
+    files - a list of filenames
+    baseUrl - the base url to the root of the website
+    dropExtension - true to drop extensions of .html from the filename in urls
+    dateOnly - true to include only the date in lastmod
+    lastmods - optional dictionary mapping filenames to already known lastmod
+        dates, which otherwise are determined with lastmod
+    root - the root directory of the website
+    outputDir - the directory for the sitemap files, which defaults to root
+    """
+    entries = xmlSitemapEntries(files, baseUrl, dropExtension, dateOnly, lastmods, root)
+    return writeShardedSitemap(entries, "xml", baseUrl, outputDir=root if outputDir is None else outputDir)[0]
+
+def writeSitemap(files, baseUrl, sitemapFormat, dropExtension=False, dateOnly=False, lastmods=None, root=".", outputDir=None, images=False, external=None) :
+    """Writes the sitemap in the specified format, returning a
+    tuple with the name of the file written (the sitemap index
+    if sharded) and the number of shards.
+
+    Keyword arguments:
+    files - a list of filenames or FileRecords
+    baseUrl - the base url to the root of the website
+    sitemapFormat - xml or txt
+    dropExtension - true to drop extensions of .html from the filename in urls
+    dateOnly - true to include only the date in lastmod
+    lastmods - optional dictionary mapping filenames to already known lastmod dates
+    root - the root directory of the website
+    outputDir - the directory for the sitemap files, which defaults to root
+    images - true to list the images of html pages in an xml sitemap (see renderRecords)
+    external - optional ExternalUrlLists to merge with the entries of the files
+    """
+    records = fileRecords(files, dropExtension)
+    entries = renderRecords(records, baseUrl, sitemapFormat, dateOnly, lastmods, root, images)
+    if external is not None :
+        entries = external.merge(
+            keyedEntries(( (r.depth, r.sortname, entry) for r, entry in zip(records, entries) ), baseUrl),
+            lambda url, mod : externalEntry(url, mod, sitemapFormat, dateOnly)
+        )
+    header = IMAGE_SITEMAP_HEADER if images else None
+    name, shards, count = writeShardedSitemap(entries, sitemapFormat, baseUrl, header, root if outputDir is None else outputDir)
+    return name, shards
+
+class ExternalUrlLists :
+    """Lists of urls from outside of the website's files, such as pages
+    that are served dynamically, each in the format of a manifest (see
+    readManifest) but with full urls, which are merged with the entries
+    of the files in urlsort order without loading the lists into memory.
+    """
+
+    def __init__(self, filenames, baseUrl) :
+        """Creates the lists.
+
+        Keyword arguments:
+        filenames - the names of the files with the lists
+        baseUrl - the base url to the root of the website
+        """
+        self.filenames = filenames
+        self.baseUrl = baseUrl
+        self.count = 0
+
+    def sortedList(self, filename) :
+        """Generates the urls of a list in urlsort order, as tuples of
+        the sort key (see urlSortKey), the url, and its lastmod, streaming
+        them from the file if it is already in order, and otherwise sorting
+        them in memory.
+
+        Keyword arguments:
+        filename - the name of the file with the list
+        """
+        with openManifest(filename) as urls :
+            keys = ( urlSortKey(url, self.baseUrl) for url, mod in readManifest(urls) )
+            previous = None
+            inOrder = True
+            for key in keys :
+                if previous is not None and key < previous :
+                    inOrder = False
+                    break
+                previous = key
+        with openManifest(filename) as urls :
+            entries = ( (urlSortKey(url, self.baseUrl), url, mod) for url, mod in readManifest(urls) )
+            if not inOrder :
+                print("WARNING:", filename, "is not in sorted order. Sorting it in memory.")
+                entries = sorted(entries, key = operator.itemgetter(0))
+            yield from entries
+
+    def merge(self, discovered, render) :
+        """Merges the urls of the lists with the entries of the files of
+        the website with a streaming k-way merge, generating the entries in
+        urlsort order, without duplicate urls (the entries of the files take
+        precedence). Counts the urls of the lists that are included.
+
+        Keyword arguments:
+        discovered - iterable of tuples (key, url, entry) for the files,
+            in urlsort order, where key is (depth, sortname) (see keyedEntries)
+        render - function that forms the entry of a url and its lastmod
+        """
+        self.count = 0
+        merged = heapq.merge(
+            ( (key, url, entry, False) for key, url, entry in discovered ),
+            *( ( (key, url, mod, True) for key, url, mod in self.sortedList(filename) ) for filename in self.filenames ),
+            key = operator.itemgetter(0)
+        )
+        previousKey = None
+        urls = set()
+        for key, url, value, isExternal in merged :
+            if key != previousKey :
+                previousKey = key
+                urls.clear()
+            if url in urls :
+                continue
+            urls.add(url)
+            if isExternal :
+                self.count += 1
+                yield render(url, value)
+            else :
+                yield value
+
+def keyedEntries(entries, baseUrl) :
+    """Converts tuples (depth, sortname, entry) of the entries of files
+    in urlsort order, as in partial outputs, to tuples of the sort key,
+    the url, and the entry, for ExternalUrlLists.merge.
+
+    Keyword arguments:
+    entries - iterable of tuples (depth, sortname, entry)
+    baseUrl - the base url to the root of the website
+    """
+    base = baseUrl[:-1] if len(baseUrl) > 0 and baseUrl[-1] == "/" else baseUrl
+    for depth, name, entry in entries :
+        u = name[1:] if len(name) > 0 and name[0] == "." else name
+        yield (depth, name), base + u if len(u) > 0 and u[0] == "/" else base + "/" + u, entry
+
+def externalEntry(url, dateString, sitemapFormat, dateOnly=False) :
+    """Forms the entry of a url from an external list.
+
+    Keyword arguments:
+    url - the full url
+    dateString - its lastmod date, or None to omit the lastmod
+    sitemapFormat - xml or txt
+    dateOnly - true to include only the date in lastmod
+    """
+    if sitemapFormat != "xml" :
+        return url
+    if dateString is None :
+        return xmlSitemapEntryNoLastmodTemplate.format(xmlEscapeCharacters(url))
+    return xmlSitemapEntryTemplate.format(xmlEscapeCharacters(url), removeTime(dateString) if dateOnly else dateString)
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+INOTIFY_EVENT_HEADER = struct.Struct("iIII")
+
+class Inotify :
+    """Minimal wrapper around the Linux inotify API, which
+    reports changes within a set of watched directories.
+    """
+
+    def __init__(self) :
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._libc = libc
+        self._fd = libc.inotify_init1(IN_CLOEXEC)
+        if self._fd < 0 :
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._dirs = {}
+
+    def addWatch(self, directory) :
+        """Starts watching a directory (not recursively).
+
+        Keyword arguments:
+        directory - the directory to watch
+        """
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0 :
+            raise OSError(ctypes.get_errno(), "inotify_add_watch failed", directory)
+        self._dirs[wd] = directory
+
+    def addWatchRecursive(self, directory) :
+        """Starts watching a directory and all of its subdirectories.
+
+        Keyword arguments:
+        directory - the root of the directory tree to watch
+        """
+        for root, dirs, files in os.walk(directory) :
+            self.addWatch(root)
+
+    def readEvents(self, timeout=None) :
+        """Waits for events, and returns a list of tuples
+        (path, mask) for the events that occurred. Returns an
+        empty list if the timeout expires first.
+
+        Keyword arguments:
+        timeout - maximum number of seconds to wait, or None to wait indefinitely
+        """
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready :
+            return []
+        data = os.read(self._fd, 65536)
+        events = []
+        i = 0
+        while i < len(data) :
+            wd, mask, cookie, length = INOTIFY_EVENT_HEADER.unpack_from(data, i)
+            i += INOTIFY_EVENT_HEADER.size
+            name = os.fsdecode(data[i:i+length].rstrip(b"\0"))
+            i += length
+            if mask & IN_IGNORED :
+                self._dirs.pop(wd, None)
+            elif wd in self._dirs :
+                directory = self._dirs[wd]
+                events.append((os.path.join(directory, name) if name else directory, mask))
+            elif mask & IN_Q_OVERFLOW :
+                events.append((None, mask))
+        return events
+
+    def close(self) :
+        """Releases the inotify file descriptor."""
+        os.close(self._fd)
+
+class SiteIndex :
+    """Keeps what selectSitemapFiles finds out about the files of a
+    website from one generation of the sitemap to the next in watch
+    mode, so that only the files affected by a change are checked for
+    noindex and dated again: the files discovered, together with any
+    lastmod dates listed with them, the results of the noindex checks
+    by file identity (see cachedNoindex), and the lastmod dates found.
+    """
+
+    def __init__(self) :
+        """Creates an empty index, so that the next generation
+        discovers, checks, and dates all of the files."""
+        self.files = None
+        self.known = {}
+        self.discovered = set()
+        self.noindex = {}
+        self.lastmods = {}
+
+    def discover(self, files, known) :
+        """Records the files discovered, before any partition is applied.
+
+        Keyword arguments:
+        files - a list of the files
+        known - a dictionary of the lastmod dates listed with the files
+        """
+        self.files = files
+        self.known = known
+        self.discovered = set(files)
+
+    def rebuild(self, rediscover=True) :
+        """Discards everything known about the files.
+
+        Keyword arguments:
+        rediscover - false to keep the files discovered, such as those
+            read from the standard input, which can only be read once
+        """
+        if rediscover :
+            self.files = None
+            self.known = {}
+            self.discovered = set()
+        self.noindex = {}
+        self.lastmods = {}
+
+    def update(self, changed, removed, root=".", rediscover=False) :
+        """Discards what is known about files that changed or were removed.
+
+        Keyword arguments:
+        changed - files that were created or modified
+        removed - files that were deleted or moved away, where
+            those that end with a / are directories
+        root - the root directory of the website
+        rediscover - true if files were created or removed, in which
+            case the files are discovered again by the next generation
+        """
+        for f in changed :
+            self.lastmods.pop(f, None)
+            self.noindex.pop(fileIdentity(sitePath(root, f)), None)
+        removedDirs = tuple(f for f in removed if f[-1] == "/")
+        if removedDirs :
+            self.lastmods = { f : mod for f, mod in self.lastmods.items() if not f.startswith(removedDirs) }
+        for f in removed :
+            self.lastmods.pop(f, None)
+        if rediscover :
+            self.files = None
+            self.known = {}
+            self.discovered = set()
+
+WATCH_DEBOUNCE = 0.5
+WATCH_MAX_DELAY = 5.0
+
+def collectChanges(events) :
+    """Sorts a batch of inotify events into changed and removed files,
+    returning a tuple (changed, removed, rescan), where rescan
+    is true if the events can only be handled with a full rescan.
+
+    Keyword arguments:
+    events - a list of tuples (path, mask) from Inotify.readEvents
+    """
+    changed = set()
+    removed = set()
+    rescan = False
+    for path, mask in events :
+        if path is None :
+            rescan = True
+        elif mask & IN_ISDIR :
+            if mask & (IN_CREATE | IN_MOVED_TO) :
+                for f in gatherfilesUnder(path) :
+                    changed.add(f)
+                    removed.discard(f)
+            elif mask & (IN_DELETE | IN_MOVED_FROM) :
+                removed.add(path + "/")
+        elif mask & (IN_DELETE | IN_MOVED_FROM) :
+            removed.add(path)
+            changed.discard(path)
+        elif mask & (IN_CREATE | IN_CLOSE_WRITE | IN_MOVED_TO) :
+            changed.add(path)
+            removed.discard(path)
+    return changed, removed, rescan
+
+def gatherfilesUnder(directory) :
+    """Lists all files within a directory tree.
+
+    Keyword arguments:
+    directory - the root of the directory tree
+    """
+    return [ os.path.join(root, f) for root, dirs, files in os.walk(directory) for f in files ]
+
+def watchedPath(path, root) :
+    """Converts the path of a file from an inotify event to its path
+    relative from the root of the website (e.g., ./dir/file.html),
+    keeping the trailing / of the paths of removed directories.
+
+    Keyword arguments:
+    path - the path from the event, which is within the root
+    root - the root directory of the website
+    """
+    f = os.path.join(".", os.path.relpath(path, root))
+    return f + "/" if path[-1] == "/" else f
+
+def watchedChanges(changed, removed, config, index) :
+    """Selects the changes that can affect the sitemap, from those found
+    by collectChanges, returning a tuple (changed, removed, rediscover) of
+    the sets of the paths of the files selected, relative from the root of
+    the website, and whether the files must be discovered again (see
+    SiteIndex.update), which is the case if a file of a type included in
+    the sitemap was created or removed, a directory was removed, or a
+    .sitemapignore file or the file manifest changed. Besides the files
+    of the types included in the sitemap (other than the sitemap files
+    themselves), changes to the robots.txt, the .sitemapignore files, and
+    the _headers file, file manifest, and lists of external urls, if they
+    are within the website, affect the sitemap.
+
+    Keyword arguments:
+    changed - a set of the paths of the files that were created or modified
+    removed - a set of the paths of the files that were deleted or moved away
+    config - the SitemapConfig of the sitemap
+    index - the SiteIndex of the website
+    """
+    root = config.root
+    extensions = config.extensions()
+    manifest = os.path.abspath(config.manifestFile) if config.manifestFile is not None and config.manifestFile != "-" else None
+    inputFiles = { os.path.abspath(f) for f in [config.headersFile] + list(config.externalUrls) if f is not None }
+    changedFiles = set()
+    removedFiles = set()
+    rediscover = False
+    for path in changed | removed :
+        f = watchedPath(path, root)
+        isRemoved = path in removed
+        if f[-1] == "/" :
+            rediscover = True
+        elif getFileExtension(f) in extensions and not isGeneratedSitemap(f, root, config.outputDir) :
+            # Either a file was created, or a discovered file was removed.
+            if (f in index.discovered) == isRemoved :
+                rediscover = True
+        elif config.useIgnoreFiles and os.path.basename(f) == SITEMAP_IGNORE_FILENAME :
+            rediscover = True
+        elif os.path.abspath(path) == manifest :
+            rediscover = True
+        elif f != "./robots.txt" and os.path.abspath(path) not in inputFiles :
+            continue
+        if isRemoved :
+            removedFiles.add(f)
+        else :
+            changedFiles.add(f)
+    # Files from the standard input can only be read once.
+    return changedFiles, removedFiles, rediscover and config.manifestFile != "-"
+
+def watchSite(config) :
+    """Generates the sitemap of a website with generateSitemap, and then
+    keeps it up to date as files change until interrupted, returning the
+    outputs of the last generation. Changes are collected until the site
+    has been quiet briefly, and then the sitemap is generated again, with
+    a SiteIndex so that only the files affected by the changes are checked
+    for noindex and dated again.
+
+    Keyword arguments:
+    config - a SitemapConfig, whose root is the root of the website
+    """
+    inotify = Inotify()
+    index = SiteIndex()
+    outputs = {}
+    try :
+        inotify.addWatchRecursive(config.root)
+        outputs = generateSitemap(config, index=index)
+        print("Generated", os.path.basename(outputs["sitemap-path"]), "with", outputs["url-count"], "urls. Watching for changes....")
+        while True :
+            events = inotify.readEvents()
+            started = time.monotonic()
+            while time.monotonic() - started < WATCH_MAX_DELAY :
+                more = inotify.readEvents(WATCH_DEBOUNCE)
+                if not more :
+                    break
+                events.extend(more)
+            for path, mask in events :
+                if path is not None and mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO) :
+                    inotify.addWatchRecursive(path)
+            changed, removed, rescan = collectChanges(events)
+            if rescan :
+                inotify.addWatchRecursive(config.root)
+                index.rebuild(config.manifestFile != "-")
+            else :
+                changed, removed, rediscover = watchedChanges(changed, removed, config, index)
+                if not changed and not removed :
+                    continue
+                index.update(changed, removed, config.root, rediscover)
+            outputs = generateSitemap(config, index=index)
+            print("Updated", os.path.basename(outputs["sitemap-path"]), "with", outputs["url-count"], "urls.")
+    except KeyboardInterrupt :
+        print("Stopped watching for changes.")
+    finally :
+        inotify.close()
+    return outputs
+
+def urlSortKey(url, baseUrl, dropExtension=False) :
+    """Forms the key that urlsort orders a url by, from the url
+    itself rather than the file, so that entries of existing
+    sitemaps can be compared with newly generated entries.
+
+    Keyword arguments:
+    url - the full url
+    baseUrl - address of the root of the website
+    dropExtension - true if extensions of .html were dropped from the urls
+    """
+    root = baseUrl if len(baseUrl) > 0 and baseUrl[-1] == "/" else baseUrl + "/"
+    if not url.startswith(root) :
+        return (sys.maxsize, url)
+    f = "./" + url[len(root):]
+    return (f.count("/"), sortname(f, dropExtension))
+
+def readSitemapEntries(filename) :
+    """Reads an existing sitemap in a streaming fashion, generating
+    a tuple (url, lastmod) for each entry, where lastmod is None if
+    the entry has none. Nothing is generated if the file doesn't exist.
+    If the file is a sitemap index, the entries of the sitemaps that
+    it lists are generated, locating them in the same directory.
+
+    Keyword arguments:
+    filename - the sitemap file, either xml or txt based on its extension
+    """
+    if not os.path.isfile(filename) :
+        return
+    if getFileExtension(filename) != "xml" :
+        with open(filename, "r", errors="surrogateescape") as sitemap :
+            for line in sitemap :
+                line = line.strip()
+                if len(line) > 0 :
+                    yield line, None
+        return
+    loc, mod = None, None
+    context = ET.iterparse(filename, events=("start", "end"))
+    _, root = next(context)
+    for event, elem in context :
+        if event == "end" :
+            tag = elem.tag.rpartition("}")[2]
+            if tag == "loc" :
+                loc = (elem.text or "").strip()
+            elif tag == "lastmod" :
+                mod = (elem.text or "").strip()
+            elif tag == "url" :
+                if loc is not None :
+                    yield loc, mod
+                loc, mod = None, None
+                root.clear()
+            elif tag == "sitemap" :
+                if loc is not None :
+                    shard = os.path.join(os.path.dirname(filename), loc.rpartition("/")[2])
+                    yield from readSitemapEntries(shard)
+                loc, mod = None, None
+                root.clear()
+
+def sitemapDelta(previous, current, baseUrl, dropExtension=False) :
+    """Compares the entries of a previous sitemap with the current entries
+    with a merge of the two sequences, both in urlsort order, generating a
+    tuple (status, url) for each difference, where status is A for added,
+    D for removed, or M for a changed lastmod. Raises ValueError if the
+    previous sitemap isn't in urlsort order.
+
+    Keyword arguments:
+    previous - iterable of tuples (url, lastmod) from the previous sitemap
+    current - iterable of tuples (url, lastmod) of the new sitemap
+    baseUrl - address of the root of the website
+    dropExtension - true if extensions of .html were dropped from the urls
+    """
+    def keyed(entries, checkOrder) :
+        lastKey = None
+        for url, mod in entries :
+            key = (urlSortKey(url, baseUrl, dropExtension), url)
+            if checkOrder and lastKey is not None and key < lastKey :
+                raise ValueError("previous sitemap is not in sorted order at " + url)
+            lastKey = key
+            yield key, url, mod
+    old = keyed(previous, True)
+    new = keyed(current, False)
+    a = next(old, None)
+    b = next(new, None)
+    while a is not None or b is not None :
+        if b is None or (a is not None and a[0] < b[0]) :
+            yield "D", a[1]
+            a = next(old, None)
+        elif a is None or b[0] < a[0] :
+            yield "A", b[1]
+            b = next(new, None)
+        else :
+            if a[2] != b[2] :
+                yield "M", b[1]
+            a = next(old, None)
+            b = next(new, None)
+
+def unsortedSitemapDelta(previous, current) :
+    """Compares the entries of a previous sitemap with the current entries
+    without assuming any order, generating a tuple (status, url) for each
+    difference as in sitemapDelta.
+
+    Keyword arguments:
+    previous - iterable of tuples (url, lastmod) from the previous sitemap
+    current - iterable of tuples (url, lastmod) of the new sitemap
+    """
+    old = dict(previous)
+    for url, mod in current :
+        if url not in old :
+            yield "A", url
+        elif old.pop(url) != mod :
+            yield "M", url
+    for url in old :
+        yield "D", url
+
+def writeDelta(deltaFile, previousSitemap, current, baseUrl, dropExtension=False) :
+    """Writes the differences between the previous sitemap and the current
+    entries to a file, one per line as the status and url separated by a
+    tab, and returns a dictionary with the counts of each status.
+
+    Keyword arguments:
+    deltaFile - the name of the file for the differences
+    previousSitemap - the name of the previous sitemap file
+    current - a list of tuples (url, lastmod) of the new sitemap in urlsort order
+    baseUrl - address of the root of the website
+    dropExtension - true if extensions of .html were dropped from the urls
+    """
+    counts = { "A" : 0, "D" : 0, "M" : 0 }
+    try :
+        with open(deltaFile, "w") as delta :
+            for status, url in sitemapDelta(readSitemapEntries(previousSitemap), current, baseUrl, dropExtension) :
+                delta.write(status + "\t" + url + "\n")
+                counts[status] += 1
+    except ValueError :
+        print("WARNING: Previous sitemap is not in sorted order. Comparing without assuming order.")
+        counts = { "A" : 0, "D" : 0, "M" : 0 }
+        with open(deltaFile, "w") as delta :
+            for status, url in unsortedSitemapDelta(readSitemapEntries(previousSitemap), current) :
+                delta.write(status + "\t" + url + "\n")
+                counts[status] += 1
+    return counts
+
+# The longest url that the sitemap protocol allows, in characters.
+SITEMAP_MAX_URL_LENGTH = 2047
+
+SITEMAP_NAMESPACE = "{http://www.sitemaps.org/schemas/sitemap/0.9}"
+
+# The W3C Datetime formats of lastmod dates, from a year alone
+# to a date and time with fractions of a second and a time zone.
+RE_W3C_DATETIME = re.compile(r"^\d{4}(-(0[1-9]|1[0-2])(-(0[1-9]|[12]\d|3[01])(T([01]\d|2[0-3]):[0-5]\d(:[0-5]\d(\.\d+)?)?(Z|[+-]([01]\d|2[0-3]):[0-5]\d))?)?)?$")
+
+# The raw text of loc elements, before the parser resolves any entities,
+# and the characters within it that xmlEscapeCharacters would have escaped.
+RE_RAW_LOC = re.compile(rb"<((?:image:)?loc)>([^<]*)</\1>")
+RE_UNESCAPED = re.compile(rb"""['">]|&(?!(?:amp|lt|gt|apos|quot|#[0-9]+|#x[0-9a-fA-F]+);)""")
+
+VALIDATION_CHUNK_SIZE = 65536
+
+# The longest unmatched tail of a chunk that is kept for the next
+# chunk when scanning for loc elements, which is longer than any
+# loc within the limit on the length of urls.
+MAX_RAW_LOC_CARRY = 65536
+
+# The kinds of findings of SitemapValidator. Those other than
+# unsorted break the sitemap protocol.
+VALIDATION_FINDINGS = ( "missing", "malformed", "too-many-urls", "too-large", "url-too-long", "unescaped", "invalid-lastmod", "duplicate", "unsorted" )
+VALIDATION_WARNINGS = { "unsorted" }
+
+# The number of findings that SitemapValidator prints, beyond
+# which they are only counted.
+MAX_REPORTED_FINDINGS = 100
+
+class CompactHashSet :
+    """A set of strings that stores only a 64-bit hash of each, in an
+    open addressing table within an array, which takes about 16 bytes
+    per string no matter how long the strings are. The chance of two
+    distinct strings colliding is negligible even for many millions
+    of strings.
+    """
+
+    __slots__ = ( "table", "size" )
+
+    def __init__(self) :
+        self.table = array.array("Q", bytes(8 * 1024))
+        self.size = 0
+
+    def add(self, s) :
+        """Adds a string, returning True if it was already in the set.
+
+        Keyword arguments:
+        s - the string
+        """
+        h = int.from_bytes(hashlib.blake2b(s.encode("utf-8", "surrogateescape"), digest_size=8).digest(), "little") or 1
+        table = self.table
+        mask = len(table) - 1
+        i = h & mask
+        while table[i] != 0 :
+            if table[i] == h :
+                return True
+            i = (i + 1) & mask
+        table[i] = h
+        self.size += 1
+        if 2 * self.size > len(table) :
+            self.grow()
+        return False
+
+    def grow(self) :
+        """Doubles the size of the table."""
+        old = self.table
+        table = self.table = array.array("Q", bytes(16 * len(old)))
+        mask = len(table) - 1
+        for h in old :
+            if h != 0 :
+                i = h & mask
+                while table[i] != 0 :
+                    i = (i + 1) & mask
+                table[i] = h
+
+@contextmanager
+def openSitemapFile(filename) :
+    """Opens a sitemap file for reading bytes, decompressing it if it
+    is gzipped, which is detected from its contents rather than its name.
+
+    Keyword arguments:
+    filename - the name of the file
+    """
+    with open(filename, "rb") as f :
+        if f.peek(2)[:2] == b"\x1f\x8b" :
+            with gzip.GzipFile(fileobj=f) as g :
+                yield g
+        else :
+            yield f
+
+class SitemapValidator :
+    """Validates existing sitemaps (xml, txt, or sitemap indexes, any
+    of which may be gzipped) in a streaming fashion that holds only a
+    chunk of a file at a time, counting findings of each kind in
+    VALIDATION_FINDINGS. The limits of the sitemap protocol are checked
+    for each file, as are the escaping of urls and the format of lastmod
+    dates. The order of the urls is checked against the order of the
+    generated sitemaps (urlsort), continuing across the sitemaps of an
+    index, and urls repeated anywhere among the validated files are
+    found with a CompactHashSet.
+    """
+
+    def __init__(self, baseUrl, dropExtension=False) :
+        """Initializes a validator.
+
+        Keyword arguments:
+        baseUrl - address of the root of the website, for the order of urls
+        dropExtension - true if extensions of .html were dropped from the urls
+        """
+        self.baseUrl = baseUrl
+        self.dropExtension = dropExtension
+        self.counts = { kind : 0 for kind in VALIDATION_FINDINGS }
+        self.urlCount = 0
+        self.fileCount = 0
+        self.seen = CompactHashSet()
+        self.lastKey = None
+
+    def finding(self, kind, filename, detail) :
+        """Counts a finding, and prints it unless too many have
+        been printed already.
+
+        Keyword arguments:
+        kind - the kind of finding, one of VALIDATION_FINDINGS
+        filename - the file with the finding
+        detail - a description of the finding
+        """
+        reported = sum(self.counts.values())
+        self.counts[kind] += 1
+        if reported < MAX_REPORTED_FINDINGS :
+            print("WARNING:", filename + ":", kind + ":", detail)
+        elif reported == MAX_REPORTED_FINDINGS :
+            print("WARNING: Too many findings to list. Only counting the rest.")
+
+    def errorCount(self) :
+        """Returns the number of findings that break the sitemap protocol."""
+        return sum(count for kind, count in self.counts.items() if kind not in VALIDATION_WARNINGS)
+
+    def outputs(self) :
+        """Returns a dictionary with the outputs of the validation."""
+        return {
+            "validated-url-count" : self.urlCount,
+            "validation-error-count" : self.errorCount(),
+            "validation-findings" : ",".join("{0}:{1}".format(kind, count) for kind, count in self.counts.items() if count > 0)
+        }
+
+    def validate(self, filename) :
+        """Validates a sitemap, or a sitemap index along with the
+        sitemaps that it lists, which are located in the same directory.
+
+        Keyword arguments:
+        filename - the sitemap file, either xml or txt based on its
+            extension (ignoring any .gz)
+        """
+        self.lastKey = None
+        self.validateFile(filename, None)
+
+    def validateFile(self, filename, index) :
+        """Validates one sitemap file.
+
+        Keyword arguments:
+        filename - the sitemap file
+        index - the sitemap index that lists the file, or None
+        """
+        if not os.path.isfile(filename) :
+            self.finding("missing", index if index is not None else filename, "No such sitemap: " + filename)
+            return
+        self.fileCount += 1
+        name = filename[:-3] if filename.endswith(".gz") else filename
+        try :
+            with openSitemapFile(filename) as sitemap :
+                if getFileExtension(name) == "txt" :
+                    self.validateText(filename, sitemap)
+                else :
+                    self.validateXml(filename, sitemap, index is not None)
+        except (OSError, EOFError, zlib.error) as e :
+            self.finding("malformed", filename, "Unable to read: " + str(e))
+
+    def checkUrl(self, filename, url) :
+        """Checks the length, order, and uniqueness of the url of
+        an entry of a sitemap.
+
+        Keyword arguments:
+        filename - the sitemap file
+        url - the url
+        """
+        self.urlCount += 1
+        if len(url) > SITEMAP_MAX_URL_LENGTH :
+            self.finding("url-too-long", filename, "{0} characters in {1}...".format(len(url), url[:80]))
+        key = urlSortKey(url, self.baseUrl, self.dropExtension)
+        if self.lastKey is not None and key < self.lastKey :
+            self.finding("unsorted", filename, "Out of order: " + url)
+        self.lastKey = key
+        if self.seen.add(url) :
+            self.finding("duplicate", filename, "Repeated url: " + url)
+
+    def checkLimits(self, filename, count, size, index=False) :
+        """Checks the number of entries and the size of a file
+        against the limits of the sitemap protocol.
+
+        Keyword arguments:
+        filename - the sitemap file
+        count - the number of entries (urls or sitemaps)
+        size - the size in bytes, before any compression
+        index - true if the file is a sitemap index
+        """
+        if count > SITEMAP_MAX_URLS :
+            self.finding("too-many-urls", filename, "{0} {1}, more than {2}".format(count, "sitemaps" if index else "urls", SITEMAP_MAX_URLS))
+        if size > SITEMAP_MAX_BYTES :
+            self.finding("too-large", filename, "{0} bytes, more than {1}".format(size, SITEMAP_MAX_BYTES))
+
+    def validateText(self, filename, sitemap) :
+        """Validates a plain text sitemap, with one url per line.
+
+        Keyword arguments:
+        filename - the sitemap file
+        sitemap - the file opened for reading bytes
+        """
+        count, size = 0, 0
+        for line in sitemap :
+            size += len(line)
+            line = line.strip()
+            if len(line) == 0 :
+                continue
+            count += 1
+            try :
+                url = line.decode("utf-8")
+            except UnicodeDecodeError :
+                self.finding("malformed", filename, "Not UTF-8 encoded: " + line.decode("utf-8", "replace"))
+                continue
+            self.checkUrl(filename, url)
+        self.checkLimits(filename, count, size)
+
+    def validateXml(self, filename, sitemap, shard=False) :
+        """Validates an xml sitemap or sitemap index, which is parsed
+        incrementally, a chunk at a time. The raw text of each chunk is
+        also scanned for the loc elements, to check their escaping as
+        it was before the parser resolved any entities.
+
+        Keyword arguments:
+        filename - the sitemap file
+        sitemap - the file opened for reading bytes
+        shard - true if the file is listed by a sitemap index
+        """
+        parser = ET.XMLPullParser(events=("start", "end"))
+        root = None
+        loc, mod = None, None
+        count, size = 0, 0
+        carry = b""
+        try :
+            while True :
+                chunk = sitemap.read(VALIDATION_CHUNK_SIZE)
+                size += len(chunk)
+                raw = carry + chunk
+                end = 0
+                for m in RE_RAW_LOC.finditer(raw) :
+                    if RE_UNESCAPED.search(m.group(2)) :
+                        self.finding("unescaped", filename, "Characters that must be escaped in: " + m.group(2).decode("utf-8", "replace"))
+                    end = m.end()
+                carry = raw[end:][-MAX_RAW_LOC_CARRY:]
+                if len(chunk) > 0 :
+                    parser.feed(chunk)
+                else :
+                    parser.close()
+                for event, elem in parser.read_events() :
+                    if root is None :
+                        root = elem
+                        if elem.tag not in (SITEMAP_NAMESPACE + "urlset", SITEMAP_NAMESPACE + "sitemapindex") or (shard and elem.tag != SITEMAP_NAMESPACE + "urlset") :
+                            self.finding("malformed", filename, "Unexpected root element: " + elem.tag)
+                            return
+                        continue
+                    if event != "end" :
+                        continue
+                    if elem.tag == SITEMAP_NAMESPACE + "loc" :
+                        loc = (elem.text or "").strip()
+                    elif elem.tag == SITEMAP_NAMESPACE + "lastmod" :
+                        mod = (elem.text or "").strip()
+                    elif elem.tag == SITEMAP_NAMESPACE + "url" or elem.tag == SITEMAP_NAMESPACE + "sitemap" :
+                        count += 1
+                        if loc is None or len(loc) == 0 :
+                            self.finding("malformed", filename, "An entry without a loc")
+                        elif elem.tag == SITEMAP_NAMESPACE + "url" :
+                            self.checkUrl(filename, loc)
+                        else :
+                            self.validateFile(os.path.join(os.path.dirname(filename), loc.rpartition("/")[2]), filename)
+                        if mod is not None and not RE_W3C_DATETIME.match(mod) :
+                            self.finding("invalid-lastmod", filename, "Not a W3C Datetime: " + mod + " for " + str(loc))
+                        loc, mod = None, None
+                        root.clear()
+                if len(chunk) == 0 :
+                    break
+        except ET.ParseError as e :
+            self.finding("malformed", filename, "Not well-formed XML: " + str(e))
+            return
+        self.checkLimits(filename, count, size, root is not None and root.tag == SITEMAP_NAMESPACE + "sitemapindex")
+
+def parsePartition(partition) :
+    """Parses a partition specified in the form i/N, where N
+    is the number of partitions, and i is from 1 to N. Returns
+    the tuple (i, N).
+
+    Keyword arguments:
+    partition - the partition as a string of the form i/N
+    """
+    i, _, n = partition.partition("/")
+    try :
+        i, n = int(i), int(n)
+    except ValueError :
+        raise ValueError("Invalid partition: " + partition)
+    if n < 1 or i < 1 or i > n :
+        raise ValueError("Invalid partition: " + partition)
+    return i, n
+
+def inPartition(f, i, n) :
+    """Checks if a file belongs to partition i of n, which
+    is determined from a hash of its path, such that each
+    file belongs to exactly one partition regardless of the
+    runner that discovers it.
+
+    Keyword arguments:
+    f - file name including path relative from the root of the website.
+    i - the partition, from 1 to n
+    n - the number of partitions
+    """
+    return zlib.crc32(f.encode("utf-8", "surrogateescape")) % n == i - 1
+
+def partialFilename(i, n) :
+    """Forms the name of the file for the partial output
+    of partition i of n.
+
+    Keyword arguments:
+    i - the partition, from 1 to n
+    n - the number of partitions
+    """
+    return "sitemap-partial-{0}-of-{1}.jsonl".format(i, n)
+
+def writePartial(filename, entries, sitemapFormat, i, n, excluded, images=False, subtree=False, dateOnly=False) :
+    """Writes the partial output of one partition, which consists
+    of a line with a JSON object describing the partition followed
+    by a line with a JSON array [depth, sortname, entry] for each
+    rendered entry in urlsort order. If the lastmods of index files
+    are to be from their subtrees, which span partitions, each array
+    also has the file's own lastmod and whether it is an index file,
+    and the aggregation is left to mergePartials.
+
+    Keyword arguments:
+    filename - the name of the file for the partial output
+    entries - iterable of tuples (depth, sortname, entry) in urlsort order
+    sitemapFormat - xml or txt
+    i - the partition, from 1 to n
+    n - the number of partitions
+    excluded - the number of files of the partition that were excluded
+    images - true if the entries list the images of the pages
+    subtree - true if the entries are tuples (depth, sortname, entry, lastmod, index)
+        for aggregating the lastmods of index files from their subtrees
+    dateOnly - true if the entries include only the date in lastmod
+    """
+    with atomicWrite(filename) as partial :
+        json.dump({ "partition" : i, "partitions" : n, "format" : sitemapFormat, "excluded" : excluded, "images" : images, "subtree" : subtree, "dateOnly" : dateOnly }, partial)
+        partial.write("\n")
+        for entry in entries :
+            json.dump(entry, partial)
+            partial.write("\n")
+
+def readPartial(filename) :
+    """Reads the partial output of a partition, returning a tuple
+    with the JSON object describing the partition and a generator
+    of its entries as tuples (depth, sortname, entry). Raises
+    ValueError if the file isn't a complete partial output.
+
+    Keyword arguments:
+    filename - the name of the file with the partial output
+    """
+    with open(filename, "r", errors="surrogateescape") as partial :
+        try :
+            info = json.loads(partial.readline())
+        except ValueError :
+            raise ValueError("Invalid partial output: " + filename)
+    def entries() :
+        with open(filename, "r", errors="surrogateescape") as partial :
+            partial.readline()
+            for line in partial :
+                try :
+                    yield tuple(json.loads(line))
+                except ValueError :
+                    raise ValueError("Invalid partial output: " + filename)
+    return info, entries()
+
+def mergePartials(filenames, sitemapFormat, baseUrl, outputDir=".", external=None, dateOnly=False) :
+    """Merges the partial outputs of all partitions into the final
+    sitemap (sharded with an index if necessary) with a k-way merge,
+    returning a tuple with the name of the sitemap (or index), the
+    number of shards, the number of entries, and the number of
+    excluded files across the partitions. Raises ValueError, without
+    writing anything, unless the partial outputs are of exactly the
+    partitions 1 through N, all of the same N.
+
+    Keyword arguments:
+    filenames - the names of the files with the partial outputs
+    sitemapFormat - xml or txt
+    baseUrl - the base url to the root of the website
+    outputDir - the directory for the sitemap files
+    external - optional ExternalUrlLists to merge with the entries of the partitions
+    dateOnly - true to include only the date in the lastmods of the external urls
+    """
+    partials = [ readPartial(filename) for filename in filenames ]
+    if len(partials) == 0 :
+        raise ValueError("No partial outputs to merge")
+    counts = sorted({ info["partitions"] for info, entries in partials })
+    if len(counts) > 1 :
+        raise ValueError("Partial outputs disagree on the number of partitions: {0}".format(counts))
+    found = sorted(info["partition"] for info, entries in partials)
+    expected = list(range(1, counts[0] + 1))
+    if found != expected :
+        raise ValueError("Expected partitions {0} but found {1}".format(expected, found))
+    for info, entries in partials :
+        if info["format"] != sitemapFormat :
+            raise ValueError("Partition {0} was generated in {1} format, but merging in {2} format".format(info["partition"], info["format"], sitemapFormat))
+    if len({ info.get("subtree", False) for info, entries in partials }) > 1 :
+        raise ValueError("Only some of the partitions were generated with the lastmods of index files from their subtrees")
+    merged = heapq.merge(*( entries for info, entries in partials ), key = lambda e : (e[0], e[1]))
+    if partials[0][0].get("subtree", False) :
+        rows = heapq.merge(*( readPartial(filename)[1] for filename in filenames ), key = lambda e : (e[0], e[1]))
+        newest = subtreeLastmods((e[1][:e[1].rfind("/")+1], e[3]) for e in rows)
+        subtreeDateOnly = partials[0][0].get("dateOnly", False)
+        merged = ( (e[0], e[1], withSubtreeLastmod(e, newest, subtreeDateOnly)) for e in merged )
+    header = IMAGE_SITEMAP_HEADER if any(info.get("images", False) for info, entries in partials) else None
+    if external is None :
+        merged = ( e[2] for e in merged )
+    else :
+        merged = external.merge(keyedEntries(merged, baseUrl), lambda url, mod : externalEntry(url, mod, sitemapFormat, dateOnly))
+    name, shards, count = writeShardedSitemap(merged, sitemapFormat, baseUrl, header, outputDir)
+    return name, shards, count, sum(info["excluded"] for info, entries in partials)
+
+def withSubtreeLastmod(row, newest, dateOnly=False) :
+    """Replaces the lastmod in the entry of an index file from a
+    partial output with the newest lastmod within its subtree, across
+    all partitions, returning the entry.
+
+    Keyword arguments:
+    row - tuple (depth, sortname, entry, lastmod, index) from a partial output
+    newest - dictionary mapping directories to tuples (timestamp, lastmod)
+        of the newest lastmods within their subtrees (see subtreeLastmods)
+    dateOnly - true if the entries include only the date in lastmod
+    """
+    depth, name, entry, mod, index = row
+    directory = name[:name.rfind("/")+1]
+    if not index or directory not in newest or newest[directory][1] == mod :
+        return entry
+    lastmodTag = "<lastmod>" + (removeTime(newest[directory][1]) if dateOnly else newest[directory][1]) + "</lastmod>"
+    if mod is None :
+        return entry.replace("</loc>\n", "</loc>\n" + lastmodTag + "\n", 1)
+    return entry.replace("<lastmod>" + (removeTime(mod) if dateOnly else mod) + "</lastmod>", lastmodTag, 1)
+
+# Placeholder lastmods of the same lengths as real ones, for
+# estimating the size of a sitemap without determining any.
+PLACEHOLDER_LASTMOD = "0000-00-00T00:00:00+00:00"
+
+def planSitemap(allFiles, robotsPaths, excludePaths, baseUrl, sitemapFormat, dropExtension=False, dateOnly=False, sampleSize=0, root=".", headerRules=None) :
+    """Projects the outcome of generating the sitemap without
+    determining any lastmod dates or writing anything, returning
+    a dictionary of the projected counts of urls, excluded files
+    by reason, size in bytes, and number of shards. If a sample size
+    is specified, only a random sample of that many html files is
+    checked for noindex directives, and the results extrapolated.
+
+    Keyword arguments:
+    allFiles - a list of the files discovered
+    robotsPaths - a set of the paths disallowed by robots.txt
+    excludePaths - a set of adjusted paths excluded by the exclude-paths input
+    baseUrl - the base url to the root of the website
+    sitemapFormat - xml or txt
+    dropExtension - true to drop extensions of .html from the filename in urls
+    dateOnly - true to include only the date in lastmod
+    sampleSize - the number of html files to check for noindex, or 0 for all
+    root - the root directory of the website
+    headerRules - optional HeaderRules of a _headers file (see robotsBlocked)
+    """
+    robotsExcluded = 0
+    pathsExcluded = 0
+    headersExcluded = 0
+    candidates = []
+    for f in allFiles :
+        if pathBlocked(f, robotsPaths) :
+            robotsExcluded += 1
+        elif pathBlocked(f, excludePaths) :
+            pathsExcluded += 1
+        elif headerRules is not None and headerRules.noindex(f) :
+            headersExcluded += 1
+        else :
+            candidates.append(f)
+    html = [ f for f in candidates if isHTMLFile(f) ]
+    scan = html if sampleSize <= 0 or sampleSize >= len(html) else random.sample(html, sampleSize)
+    noindex = { f for f in scan if hasMetaRobotsNoindex(sitePath(root, f)) }
+    noindexExcluded = round(len(noindex) * len(html) / len(scan)) if len(scan) > 0 else 0
+    urlCount = len(candidates) - noindexExcluded
+    dateString = removeTime(PLACEHOLDER_LASTMOD) if dateOnly else PLACEHOLDER_LASTMOD
+    if sitemapFormat == "xml" :
+        sizes = [ len(xmlSitemapEntry(f, baseUrl, dateString, dropExtension).encode("utf-8", "surrogateescape")) + 1 for f in candidates if f not in noindex ]
+        overhead = len(XML_SITEMAP_HEADER) + len(XML_SITEMAP_FOOTER)
+    else :
+        sizes = [ len(urlstring(f, baseUrl, dropExtension).encode("utf-8", "surrogateescape")) + 1 for f in candidates if f not in noindex ]
+        overhead = 0
+    entryBytes = round(sum(sizes) * urlCount / len(sizes)) if len(sizes) > 0 else 0
+    shards = max(1, math.ceil(urlCount / SITEMAP_MAX_URLS), math.ceil(entryBytes / (SITEMAP_MAX_BYTES - overhead)))
+    return {
+        "url-count" : urlCount,
+        "excluded-count" : robotsExcluded + pathsExcluded + headersExcluded + noindexExcluded,
+        "excluded-robots-count" : robotsExcluded,
+        "excluded-paths-count" : pathsExcluded,
+        "excluded-headers-count" : headersExcluded,
+        "excluded-noindex-count" : noindexExcluded,
+        "sitemap-size" : entryBytes + shards * overhead,
+        "shard-count" : shards
+    }
+
+class SitemapConfig :
+    """The configuration of a sitemap for generating it from within
+    another Python program, such as a static site generator, with
+    generateEntries or generateSitemap. The attributes correspond
+    to the inputs of the action.
+    """
+
+    def __init__(
+            self,
+            root=".",
+            baseUrl="https://web.address.of.your.nifty.website/",
+            includeHTML=True,
+            includePDF=True,
+            sitemapFormat="xml",
+            additionalExt=None,
+            dropExtension=False,
+            dateOnly=False,
+            excludePaths=None,
+            followSymlinks=False,
+            useIgnoreFiles=False,
+            indexLastmodFromSubtree=False,
+            outputDir=None,
+            builtinGit=False,
+            headersFile=None,
+            images=False,
+            metaLastmod=False,
+            timeBudget=0,
+            lastmodFallback="mtime",
+            historyHorizon=None,
+            externalUrls=None,
+            pipelined=False,
+            checkpointFile=None,
+            manifestFile=None,
+            partition=None,
+            deltaFile=None,
+            trustDirectories=()
+        ) :
+        """Creates a configuration.
+
+        Keyword arguments:
+        root - the root directory of the website
+        baseUrl - the url of the website
+        includeHTML - true to include html files
+        includePDF - true to include pdf files
+        sitemapFormat - xml or txt
+        additionalExt - optional set of additional file extensions to include
+        dropExtension - true to drop extensions of .html from the filename in urls
+        dateOnly - true to include only the date in lastmod
+        excludePaths - optional set of paths to exclude, relative from the root of the website
+        followSymlinks - true to include files within directories that are symbolic links
+        useIgnoreFiles - true to skip files and directories that match .sitemapignore files
+        indexLastmodFromSubtree - true to use the newest lastmod within a directory
+            as the lastmod of its index file
+        outputDir - the directory for the sitemap files, which defaults to root
+        builtinGit - true to find lastmod dates with the built-in git reader
+        headersFile - optional _headers file whose X-Robots-Tag noindex rules exclude urls
+        images - true to list the images of html pages in an xml sitemap
+        metaLastmod - true to take the lastmod dates of html pages from their meta tags
+        timeBudget - if positive, the number of seconds available, after most of which
+            the lastmod dates of the remaining files come from the fallback
+        lastmodFallback - either mtime or omit (see fallbackLastmod)
+        historyHorizon - optional number of commits or date, as a string, that bounds
+            the search of the git history (see parseHistoryHorizon)
+        externalUrls - optional list of the files of lists of external urls (see ExternalUrlLists)
+        pipelined - true to determine lastmod dates while the files are being filtered
+        checkpointFile - optional file where progress is saved, and resumed from
+        manifestFile - optional manifest of the files (see readManifest), or - for the
+            standard input, which is used instead of walking the directory tree
+        partition - optional partition of the form i/N, in which case only that slice
+            of the files is processed, and a partial output is written (see writePartial)
+        deltaFile - optional file for the differences from the previous sitemap (see writeDelta)
+        trustDirectories - directories to add to the safe.directory setting of git before
+            running it (see trustRepository), which the action needs in its container
+        """
+        self.root = root
+        self.baseUrl = baseUrl
+        self.includeHTML = includeHTML
+        self.includePDF = includePDF
+        self.sitemapFormat = sitemapFormat
+        self.additionalExt = set() if additionalExt is None else additionalExt
+        self.dropExtension = dropExtension
+        self.dateOnly = dateOnly
+        self.excludePaths = set() if excludePaths is None else excludePaths
+        self.followSymlinks = followSymlinks
+        self.useIgnoreFiles = useIgnoreFiles
+        self.indexLastmodFromSubtree = indexLastmodFromSubtree
+        self.outputDir = outputDir
+        self.builtinGit = builtinGit
+        self.headersFile = headersFile
+        self.images = images
+        self.metaLastmod = metaLastmod
+        self.timeBudget = timeBudget
+        self.lastmodFallback = lastmodFallback
+        self.historyHorizon = historyHorizon
+        self.externalUrls = [] if externalUrls is None else externalUrls
+        self.pipelined = pipelined
+        self.checkpointFile = checkpointFile
+        self.manifestFile = manifestFile
+        self.partition = partition
+        self.deltaFile = deltaFile
+        self.trustDirectories = trustDirectories
+
+    def extensions(self) :
+        """Gets the set of the file extensions to include."""
+        return createExtensionSet(self.includeHTML, self.includePDF, set(self.additionalExt))
+
+def siteRelativePath(path) :
+    """Converts a path relative from the root of the website, with or
+    without a leading ./ or /, to the form used within the sitemap
+    generation (e.g., ./dir/file.html).
+
+    Keyword arguments:
+    path - the path
+    """
+    path = path.replace("\\", "/")
+    return path if path.startswith("./") else "./" + path.lstrip("/")
+
+def recordFiles(records, extensions) :
+    """Selects the files of the types to include from records of the
+    files of the website, rather than walking the directory tree,
+    returning a tuple with the list of the files and a dictionary
+    mapping files to the lastmod dates given in their records.
+
+    Keyword arguments:
+    records - an iterable of tuples (path, lastmod), with paths relative
+        from the root of the website, and lastmod None if not given
+    extensions - a set of the file extensions to include in sitemap
+    """
+    files = []
+    known = {}
+    for path, mod in records :
+        f = siteRelativePath(path)
+        if getFileExtension(f) in extensions :
+            files.append(f)
+            if mod is not None :
+                known[f] = mod
+    return files, known
+
+# Number of characters of a manifest read at a time.
+MANIFEST_CHUNK_SIZE = 65536
+
+def listedLastmod(dateString) :
+    """Checks the lastmod date of a file in a manifest, or of a url in an
+    external list, returning it as is if it is in W3C datetime format,
+    converting it as parseMetaDate does if it is another form of ISO 8601
+    date (e.g., without a time zone) or an HTTP date, and otherwise
+    returning None.
+
+    Keyword arguments:
+    dateString - the lastmod date from the manifest or list
+    """
+    if RE_W3C_DATETIME.match(dateString) :
+        return dateString
+    return parseMetaDate(dateString)
+
+def readManifest(manifest) :
+    """Reads a manifest of the files of the website in a streaming
+    fashion, generating a tuple (path, lastmod) for each file. The files
+    are separated by NUL characters if there are any in the first chunk
+    read, and otherwise by newlines. Each path may be followed by a tab
+    and its lastmod date (see listedLastmod), and otherwise the lastmod
+    is None. Paths are relative from the root of the website.
+
+    Keyword arguments:
+    manifest - a text stream opened with newline="" (see openManifest)
+    """
+    separator = None
+    pending = ""
+    while True :
+        chunk = manifest.read(MANIFEST_CHUNK_SIZE)
+        if separator is None :
+            separator = "\0" if "\0" in chunk else "\n"
+        entries = (pending + chunk).split(separator)
+        pending = entries.pop() if len(chunk) > 0 else ""
+        for entry in entries :
+            path, tab, mod = entry.rstrip("\r\n" if separator == "\n" else "").partition("\t")
+            if len(path) == 0 :
+                continue
+            mod = mod.strip()
+            if len(mod) == 0 :
+                mod = None
+            else :
+                valid = listedLastmod(mod)
+                if valid is None :
+                    print("WARNING: Ignoring invalid lastmod", mod, "of", path)
+                mod = valid
+            yield path, mod
+        if len(chunk) == 0 :
+            return
+
+def openManifest(manifestFile) :
+    """Opens a manifest for reading with readManifest.
+
+    Keyword arguments:
+    manifestFile - the name of the manifest file, or - for the standard input
+    """
+    if manifestFile == "-" :
+        return io.TextIOWrapper(sys.stdin.buffer, errors="surrogateescape", newline="")
+    return open(manifestFile, "r", errors="surrogateescape", newline="")
+
+def selectSitemapFiles(config, records=None, counts=None, index=None) :
+    """Determines the files that belong in the sitemap in urlsort order,
+    returning a tuple with the list of their FileRecords, a dictionary
+    mapping the files to their lastmod dates (None for txt sitemaps), and
+    the number of files excluded by robots.txt, the excluded paths, a
+    _headers file, or noindex.
+
+    Keyword arguments:
+    config - a SitemapConfig
+    records - optional iterable of tuples (path, lastmod) of the files
+        of the website, with paths relative from its root, in which
+        case the directory tree isn't walked (nor the manifest read), and
+        the lastmod of each file is taken from its record unless it is None
+    counts - optional dictionary in which the counts of the selection that
+        are outputs of the action are recorded: degraded-lastmod-count, and
+        horizon-fallback-count and excluded-headers-count if configured
+    index - optional SiteIndex of what is known about the files from a
+        previous selection, which is reused and updated, in which case the
+        files are only discovered again if the index doesn't have them
+    """
+    root = config.root
+    extensions = config.extensions()
+    excludePaths = { adjust_path(path) for path in config.excludePaths }
+    xml = config.sitemapFormat == "xml"
+    deadline = time.monotonic() + config.timeBudget * (1 - TIME_BUDGET_RESERVE) if config.timeBudget > 0 else None
+    headerRules = None
+    if config.headersFile is not None :
+        with tracer.span("parseHeadersFile") :
+            headerRules = parseHeadersFile(config.headersFile)
+    history = openGitHistory(root) if config.builtinGit and (xml or config.checkpointFile is not None) else None
+    if history is None :
+        if len(config.trustDirectories) > 0 :
+            trustRepository(*config.trustDirectories)
+    else :
+        history.trustDirectories = config.trustDirectories
+    try :
+        checkpoint = None
+        if config.checkpointFile is not None :
+            checkpoint = Checkpoint(config.checkpointFile, checkpointKey(root, {
+                "root" : root, "baseUrl" : config.baseUrl, "extensions" : sorted(extensions),
+                "sitemapFormat" : config.sitemapFormat, "dropExtension" : config.dropExtension, "dateOnly" : config.dateOnly,
+                "excludePaths" : sorted(excludePaths), "partition" : config.partition or "", "followSymlinks" : config.followSymlinks,
+                "useIgnoreFiles" : config.useIgnoreFiles, "indexLastmodFromSubtree" : config.indexLastmodFromSubtree,
+                "manifestFile" : config.manifestFile or "", "historyHorizon" : config.historyHorizon or "",
+                "headersFile" : config.headersFile or "", "metaLastmod" : config.metaLastmod
+            }, None if history is None else (history.head.hex() if history.head is not None else "")))
+            checkpoint.load()
+        resumed = checkpoint.state if checkpoint is not None else {}
+        horizon = None
+        if config.historyHorizon is not None and xml :
+            with tracer.span("resolveHistoryHorizon") :
+                horizon = resolveHistoryHorizon(config.historyHorizon, root, history)
+        with tracer.span("parseRobotsTxt") :
+            blockedPaths = set(parseRobotsTxt(os.path.join(root, "robots.txt"))) | excludePaths
+        cached = index is not None and index.files is not None
+        listed, known = None, {}
+        if cached :
+            known = index.known
+        elif records is not None :
+            listed, known = recordFiles(records, extensions)
+        elif config.manifestFile is not None :
+            with tracer.span("readManifest"), openManifest(config.manifestFile) as manifest :
+                listed, known = recordFiles(readManifest(manifest), extensions)
+        if "files" in resumed :
+            allFiles = resumed["files"]
+        else :
+            if cached :
+                allFiles = index.files
+            else :
+                if listed is not None :
+                    allFiles = listed
+                else :
+                    with tracer.span("gatherfiles") :
+                        allFiles = gatherfiles(extensions, config.followSymlinks, config.useIgnoreFiles, root)
+                allFiles = [ f for f in allFiles if not isGeneratedSitemap(f, root, config.outputDir) ]
+                if index is not None :
+                    index.discover(allFiles, known)
+            if config.partition is not None :
+                i, n = parsePartition(config.partition)
+                allFiles = [ f for f in allFiles if inPartition(f, i, n) ]
+            if checkpoint is not None :
+                checkpoint.state["files"] = allFiles
+                checkpoint.save()
+        noindexCache, lastmodCache = ({}, {}) if config.followSymlinks else (None, None)
+        if index is not None :
+            noindexCache = index.noindex
+        lastmods, degraded = None, 0
+        known = { **(index.lastmods if index is not None else {}), **known, **resumed.get("lastmods", {}) }
+        metaLastmods = {} if config.metaLastmod and xml else None
+        headersExcluded = 0
+        if "selected" in resumed :
+            selected = fileRecords(resumed["selected"], config.dropExtension)
+            if metaLastmods is not None :
+                metaLastmods = resumed.get("metaLastmods", {})
+            headersExcluded = resumed.get("headersExcluded", 0)
+        else :
+            excluded = {}
+            if config.pipelined and xml :
+                with tracer.span("filter+computeLastmods") :
+                    selected, lastmods, degraded = pipelinedFilterAndLastmods(
+                        fileRecords(allFiles, config.dropExtension),
+                        blockedPaths, noindexCache, root,
+                        deadline, config.lastmodFallback, lastmodCache, checkpoint, known, history, horizon, headerRules, metaLastmods,
+                        excluded
+                    )
+            else :
+                with tracer.span("filter") :
+                    selected = []
+                    for r in fileRecords(allFiles, config.dropExtension) :
+                        reason = blockedReason(r, blockedPaths, noindexCache, root, headerRules, metaLastmods)
+                        if reason is None :
+                            selected.append(r)
+                        else :
+                            excluded[reason] = excluded.get(reason, 0) + 1
+            headersExcluded = excluded.get("headers", 0)
+            if checkpoint is not None :
+                checkpoint.state["selected"] = [ r.path for r in selected ]
+                if metaLastmods is not None :
+                    checkpoint.state["metaLastmods"] = metaLastmods
+                if headerRules is not None :
+                    checkpoint.state["headersExcluded"] = headersExcluded
+                checkpoint.save()
+        if metaLastmods is not None :
+            known = { **known, **metaLastmods }
+        with tracer.span("urlsort") :
+            sortRecords(selected)
+        files = [ r.path for r in selected ]
+        if xml :
+            if lastmods is None :
+                with tracer.span("computeLastmods") :
+                    lastmods, degraded = computeLastmods([ f for f in files if f not in known ], deadline, config.lastmodFallback, lastmodCache, root, checkpoint, history, horizon)
+            # Dates from the fallback are determined again by the next selection.
+            if index is not None and degraded == 0 :
+                index.lastmods.update(lastmods)
+            lastmods.update((f, known[f]) for f in files if f in known)
+            # With partitions, the lastmods of index files are
+            # aggregated across all of them by mergePartials.
+            if config.indexLastmodFromSubtree and config.partition is None :
+                with tracer.span("aggregateDirectoryLastmods") :
+                    aggregateDirectoryLastmods(files, lastmods)
+    finally :
+        if history is not None :
+            history.close()
+    if counts is not None :
+        counts["degraded-lastmod-count"] = degraded
+        if config.historyHorizon is not None :
+            counts["horizon-fallback-count"] = 0 if horizon is None else horizon.count
+        if headerRules is not None :
+            counts["excluded-headers-count"] = headersExcluded
+    return selected, lastmods, len(allFiles) - len(selected)
+
+def generateEntries(config, records=None) :
+    """Generates the rendered entries of the sitemap in order, without
+    writing anything, such as the <url> elements of an xml sitemap or
+    the urls of a txt sitemap.
+
+    Keyword arguments:
+    config - a SitemapConfig
+    records - optional iterable of tuples (path, lastmod) of the files
+        of the website (see selectSitemapFiles)
+    """
+    selected, lastmods, excluded = selectSitemapFiles(config, records)
+    yield from renderRecords(selected, config.baseUrl, config.sitemapFormat, config.dateOnly, lastmods, config.root, config.images)
+
+def generateSitemap(config, records=None, index=None) :
+    """Generates and writes the sitemap (sharded with an index if it is
+    too large), or the partial output if the config has a partition,
+    returning a dictionary with the same names and values as the outputs
+    of the action, such as sitemap-path, url-count, excluded-count, and
+    shard-count. Raises ValueError if the config has both a partition
+    and a delta file, since the delta is relative to the whole sitemap.
+
+    Keyword arguments:
+    config - a SitemapConfig
+    records - optional iterable of tuples (path, lastmod) of the files
+        of the website (see selectSitemapFiles)
+    index - optional SiteIndex of what is known about the files from a
+        previous generation (see selectSitemapFiles)
+    """
+    if config.partition is not None and config.deltaFile is not None :
+        raise ValueError("A delta-file isn't supported with a partition")
+    counts = {}
+    selected, lastmods, excluded = selectSitemapFiles(config, records, counts, index)
+    outputDir = config.root if config.outputDir is None else config.outputDir
+    xml = config.sitemapFormat == "xml"
+    images = config.images and xml
+    external = ExternalUrlLists(config.externalUrls, config.baseUrl) if len(config.externalUrls) > 0 and config.partition is None else None
+    shards = 1
+    deltaCounts = None
+    if config.partition is not None :
+        i, n = parsePartition(config.partition)
+        name = partialFilename(i, n)
+        with tracer.span("writePartial") :
+            entries = renderRecords(selected, config.baseUrl, config.sitemapFormat, config.dateOnly, lastmods, config.root, images)
+            subtree = config.indexLastmodFromSubtree and xml
+            writePartial(
+                os.path.join(outputDir, name),
+                ( (r.depth, r.sortname, entry, lastmods.get(r.path), r.path[r.path.rfind("/")+1:] in INDEX_FILENAMES) if subtree else (r.depth, r.sortname, entry) for r, entry in zip(selected, entries) ),
+                config.sitemapFormat,
+                i,
+                n,
+                excluded,
+                images,
+                subtree,
+                config.dateOnly
+            )
+    else :
+        if config.deltaFile is not None :
+            with tracer.span("writeDelta") :
+                dateOnly = config.dateOnly
+                current = (
+                    (urlstring(r.path, config.baseUrl, config.dropExtension),
+                     (removeTime(lastmods[r.path]) if dateOnly and lastmods[r.path] is not None else lastmods[r.path]) if lastmods is not None else None)
+                    for r in selected
+                )
+                if external is not None :
+                    current = external.merge(
+                        keyedEntries(( (r.depth, r.sortname, entry) for r, entry in zip(selected, current) ), config.baseUrl),
+                        lambda url, mod : (url, (removeTime(mod) if dateOnly and mod is not None else mod) if xml else None)
+                    )
+                previousIndex = os.path.join(outputDir, SITEMAP_INDEX_FILENAME)
+                deltaCounts = writeDelta(
+                    config.deltaFile,
+                    previousIndex if os.path.isfile(previousIndex) else os.path.join(outputDir, "sitemap.xml" if xml else "sitemap.txt"),
+                    current,
+                    config.baseUrl,
+                    config.dropExtension
+                )
+        with tracer.span("writeSitemap") :
+            name, shards = writeSitemap(selected, config.baseUrl, config.sitemapFormat, config.dropExtension, config.dateOnly, lastmods, config.root, outputDir, images, external)
+    if config.checkpointFile is not None :
+        removeIfExists(config.checkpointFile)
+    outputs = {
+        "sitemap-path" : os.path.join(outputDir, name),
+        "url-count" : len(selected) + (external.count if external is not None else 0),
+        "excluded-count" : excluded,
+        "shard-count" : shards,
+        **counts
+    }
+    if external is not None :
+        outputs["external-url-count"] = external.count
+    if deltaCounts is not None :
+        outputs["added-count"] = deltaCounts["A"]
+        outputs["removed-count"] = deltaCounts["D"]
+        outputs["changed-count"] = deltaCounts["M"]
+    return outputs
+
+# Minimum number of seconds between the periodic saves of a checkpoint.
+CHECKPOINT_INTERVAL = 30
+
+class Checkpoint :
+    """Saves the progress of generating a sitemap to a file, at the end
+    of each stage and periodically while determining lastmod dates, so
+    that a rerun after the generation is interrupted can resume from it.
+    The saved state is only reused by a generation for the same commit
+    and configuration. Writing the sitemap isn't checkpointed, so a rerun
+    that resumes writes all of its shards again.
+    """
+
+    def __init__(self, filename, key, interval=CHECKPOINT_INTERVAL) :
+        """Creates a checkpoint with no saved state.
+
+        Keyword arguments:
+        filename - the name of the checkpoint file
+        key - a dictionary identifying the commit and configuration (see checkpointKey)
+        interval - the minimum number of seconds between periodic saves
+        """
+        self.filename = filename
+        self.key = key
+        self.interval = interval
+        self.state = {}
+        self.lastSave = time.monotonic()
+
+    def load(self) :
+        """Loads the state saved in the checkpoint file if there is
+        one and it was saved with the same key, and returns the state,
+        which is empty if there is nothing to resume from.
+        """
+        try :
+            with open(self.filename, "r") as f :
+                saved = json.load(f)
+        except FileNotFoundError :
+            return self.state
+        except (OSError, ValueError) :
+            print("WARNING: Unable to read checkpoint:", self.filename)
+            return self.state
+        if isinstance(saved, dict) and saved.get("key") == self.key :
+            self.state = saved.get("state", {})
+            print("Resuming from checkpoint:", ", ".join(sorted(self.state)))
+        else :
+            print("Ignoring checkpoint saved for a different commit or configuration.")
+        return self.state
+
+    def save(self, force=True) :
+        """Saves the state to the checkpoint file.
+
+        Keyword arguments:
+        force - true to save now, and false to save only if the
+            interval has elapsed since the last save
+        """
+        if force or time.monotonic() - self.lastSave >= self.interval :
+            with atomicWrite(self.filename) as f :
+                json.dump({ "key" : self.key, "state" : self.state }, f)
+            self.lastSave = time.monotonic()
+
+def checkpointKey(root, settings, head=None) :
+    """Forms the key that a checkpoint must have to be reused, from
+    the commit at HEAD and a hash of the configuration.
+
+    Keyword arguments:
+    root - the root directory of the website
+    settings - a dictionary of the configuration, which can be converted to JSON
+    head - the commit at HEAD, if already known, and otherwise git is run for it
+    """
+    if head is None :
+        tracer.count("gitCalls")
+        head = subprocess.run(['git', 'rev-parse', 'HEAD'],
+                        stdout=subprocess.PIPE,
+                        stderr=subprocess.DEVNULL,
+                        cwd=root,
+                        universal_newlines=True).stdout.strip()
+    config = hashlib.sha256(json.dumps(settings, sort_keys=True).encode("utf-8", "surrogateescape")).hexdigest()
+    return { "head" : head, "config" : config }
+
+# The number of runs kept in a telemetry file, the number of the most
+# recent of them whose median is the baseline of each metric, and the
+# fewest runs needed for a baseline.
+TELEMETRY_HISTORY_SIZE = 100
+TELEMETRY_BASELINE_RUNS = 10
+TELEMETRY_MIN_BASELINE_RUNS = 3
+
+# The default percentage above the baseline that is a regression.
+TELEMETRY_DEFAULT_THRESHOLD = 50
+
+# The smallest increase in seconds over the baseline that counts as a
+# regression, so that noise in stages that take very little time doesn't.
+TELEMETRY_MIN_REGRESSION = 1.0
+
+def peakMemory() :
+    """Gets the peak resident memory of the process in bytes, or
+    None if it isn't available on the platform."""
+    try :
+        import resource
+    except ImportError :
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def runMetrics(timer, total, fileCount, urlCount) :
+    """Forms the telemetry record of a run.
+
+    Keyword arguments:
+    timer - the Tracer or StageTimer of the run
+    total - the number of seconds that the run took
+    fileCount - the number of files discovered
+    urlCount - the number of urls in the sitemap
+    """
+    return {
+        "time" : datetime.now(timezone.utc).replace(microsecond=0).isoformat(),
+        "total" : round(total, 3),
+        "stages" : { name : round(seconds, 3) for name, seconds in timer.stageDurations().items() },
+        "files" : fileCount,
+        "urls" : urlCount,
+        "bytesRead" : timer.counters.get("bytesRead", 0),
+        "gitCalls" : timer.counters.get("gitCalls", 0),
+        "peakMemory" : peakMemory()
+    }
+
+def readTelemetry(telemetryFile) :
+    """Reads the records of previous runs from a telemetry file, with a
+    JSON object per line, skipping any lines that can't be parsed. Returns
+    an empty list if the file doesn't exist.
+
+    Keyword arguments:
+    telemetryFile - the name of the telemetry file
+    """
+    runs = []
+    try :
+        with open(telemetryFile, "r") as f :
+            for line in f :
+                try :
+                    run = json.loads(line)
+                except ValueError :
+                    continue
+                if isinstance(run, dict) :
+                    runs.append(run)
+    except FileNotFoundError :
+        pass
+    except OSError :
+        print("WARNING: Unable to read telemetry file:", telemetryFile)
+    return runs
+
+def findRegressions(history, run, threshold) :
+    """Compares the total time of a run, and the time of each of its
+    stages, with the median of the same metric over the most recent
+    previous runs, generating a tuple (name, seconds, baseline) for each
+    that is more than threshold percent (and TELEMETRY_MIN_REGRESSION
+    seconds) above its baseline. Metrics with fewer than
+    TELEMETRY_MIN_BASELINE_RUNS previous values are skipped.
+
+    Keyword arguments:
+    history - the records of the previous runs, oldest first
+    run - the record of the current run
+    threshold - the percentage above the baseline that is a regression
+    """
+    recent = history[-TELEMETRY_BASELINE_RUNS:]
+    metrics = [ ("total", run["total"], [ r.get("total") for r in recent ]) ]
+    metrics += [ (name, seconds, [ r.get("stages", {}).get(name) for r in recent ]) for name, seconds in run["stages"].items() ]
+    for name, seconds, previous in metrics :
+        previous = sorted(p for p in previous if isinstance(p, (int, float)))
+        if len(previous) < TELEMETRY_MIN_BASELINE_RUNS :
+            continue
+        middle = len(previous) // 2
+        baseline = previous[middle] if len(previous) % 2 == 1 else (previous[middle - 1] + previous[middle]) / 2
+        if seconds > baseline * (1 + threshold / 100) and seconds - baseline >= TELEMETRY_MIN_REGRESSION :
+            yield name, seconds, baseline
+
+def recordTelemetry(telemetryFile, run, threshold) :
+    """Appends the record of a run to a telemetry file, keeping only the
+    most recent TELEMETRY_HISTORY_SIZE runs, and checks it for regressions
+    against the previous runs (see findRegressions), raising a warning
+    annotation in the workflow for each. Returns the list of the names of
+    the metrics that regressed.
+
+    Keyword arguments:
+    telemetryFile - the name of the telemetry file
+    run - the record of the run (see runMetrics)
+    threshold - the percentage above the baseline that is a regression
+    """
+    history = readTelemetry(telemetryFile)
+    regressed = []
+    for name, seconds, baseline in findRegressions(history, run, threshold) :
+        regressed.append(name)
+        print("::warning title=Sitemap generation slowed down::{0} took {1:.2f}s, {2:.0f}% more than the median of {3:.2f}s over recent runs".format(
+            "Generating the sitemap" if name == "total" else "Stage " + name, seconds, 100 * (seconds / baseline - 1) if baseline > 0 else float("inf"), baseline
+        ))
+    history.append(run)
+    os.makedirs(os.path.dirname(os.path.abspath(telemetryFile)), exist_ok=True)
+    with atomicWrite(telemetryFile) as f :
+        for r in history[-TELEMETRY_HISTORY_SIZE:] :
+            json.dump(r, f, sort_keys=True)
+            f.write("\n")
+    return regressed
+
+def set_outputs(names_values) :
+    """Sets the GitHub Action outputs.
+
+    Keyword arguments:
+    names_values - Dictionary of output names with values
+    """
+    if "GITHUB_OUTPUT" in os.environ :
+        with open(os.environ["GITHUB_OUTPUT"], "a") as f :
+            for name, value in names_values.items() :
+                print("{0}={1}".format(name, value), file=f)
+    else : # Fall-back to deprecated set-output for non-updated runners
+        for name, value in names_values.items() :
+            print("::set-output name={0}::{1}".format(name, value))
+
+def sanitize_path(websiteRoot) :
+    """Verifies specified website root is within the current working directory.
+
+    Keyword arguments:
+    websiteRoot - the root of the website relative to current working directory
+    """
+    repo_root = os.getcwd()
+    safe_path = os.path.realpath(websiteRoot)
+    prefix = os.path.commonpath([repo_root, safe_path])
+    if prefix == repo_root :
+        return os.path.join(repo_root, safe_path)
+    else :
+        print("ERROR: Specified website root directory appears to be outside of current working directory. Exiting....")
+        exit(1)
+
+def adjust_path(path):
+    """Checks that path is formatted as expected, adjusting if necessary.
+
+    Keyword arguments:
+    path - the path to check and adjust
+    """
+    path = path.replace("\\", "/").removeprefix(".")
+    if len(path) == 0:
         return "/"
     if path[0] != "/":
         return "/" + path
     return path
     
+def runValidation(config, patterns) :
+    """Validates existing sitemaps (or sitemap indexes) rather than
+    generating the sitemap, returning the outputs of the action.
+
+    Keyword arguments:
+    config - the SitemapConfig of the inputs
+    patterns - a set of glob patterns for the sitemaps to validate
+    """
+    validator = SitemapValidator(config.baseUrl, config.dropExtension)
+    with tracer.span("validateSitemaps") :
+        for pattern in sorted(patterns) :
+            filenames = sorted(glob.glob(pattern))
+            if len(filenames) == 0 :
+                validator.finding("missing", pattern, "No sitemaps match the pattern")
+            for filename in filenames :
+                validator.validate(filename)
+    print("Validated", validator.urlCount, "urls in", validator.fileCount, "files. Errors found:", validator.errorCount())
+    return validator.outputs()
+
+def runMerge(config, partialFiles) :
+    """Merges the partial outputs of all partitions into the sitemap
+    (see mergePartials), returning the outputs of the action.
+
+    Keyword arguments:
+    config - the SitemapConfig of the inputs
+    partialFiles - a list of the files of the partial outputs
+    """
+    external = ExternalUrlLists(config.externalUrls, config.baseUrl) if len(config.externalUrls) > 0 else None
+    with tracer.span("mergePartials") :
+        name, shards, count, excluded = mergePartials(partialFiles, config.sitemapFormat, config.baseUrl, config.root, external, config.dateOnly)
+    outputs = {
+        "sitemap-path" : os.path.join(config.root, name),
+        "url-count" : count,
+        "excluded-count" : excluded,
+        "shard-count" : shards
+    }
+    if external is not None :
+        outputs["external-url-count"] = external.count
+    return outputs
+
+def runPlan(config, sampleSize=0) :
+    """Projects the outcome of generating the sitemap without determining
+    any lastmod dates or writing anything (see planSitemap), returning the
+    outputs of the action.
+
+    Keyword arguments:
+    config - the SitemapConfig of the inputs
+    sampleSize - the number of html files to check for noindex, or 0 for all
+    """
+    extensions = config.extensions()
+    headerRules = None
+    if config.headersFile is not None :
+        with tracer.span("parseHeadersFile") :
+            headerRules = parseHeadersFile(config.headersFile)
+    with tracer.span("parseRobotsTxt") :
+        robotsPaths = set(parseRobotsTxt(os.path.join(config.root, "robots.txt")))
+    with tracer.span("gatherfiles") :
+        if config.manifestFile is not None :
+            with openManifest(config.manifestFile) as manifest :
+                allFiles, _ = recordFiles(readManifest(manifest), extensions)
+        else :
+            allFiles = gatherfiles(extensions, config.followSymlinks, config.useIgnoreFiles, config.root)
+        allFiles = [ f for f in allFiles if not isGeneratedSitemap(f, config.root, config.outputDir) ]
+    with tracer.span("planSitemap") :
+        plan = planSitemap(
+            allFiles, robotsPaths, { adjust_path(path) for path in config.excludePaths }, config.baseUrl,
+            config.sitemapFormat, config.dropExtension, config.dateOnly, sampleSize, config.root, headerRules
+        )
+    plan["sitemap-path"] = os.path.join(config.root, SITEMAP_INDEX_FILENAME if plan["shard-count"] > 1 else "sitemap." + ("xml" if config.sitemapFormat == "xml" else "txt"))
+    for name, value in plan.items() :
+        print("Projected", name, "=", value)
+    return plan
+
 def main(
         websiteRoot,
         baseUrl,
@@ -376,7 +4208,31 @@ def main(
         additionalExt,
         dropExtension,
         dateOnly,
-        excludePaths
+        excludePaths,
+        watch=False,
+        traceFile="",
+        timeBudget=0,
+        lastmodFallback="mtime",
+        deltaFile="",
+        partition="",
+        partialFiles=set(),
+        indexLastmodFromSubtree=False,
+        planOnly=False,
+        planSampleSize=0,
+        followSymlinks=False,
+        useIgnoreFiles=False,
+        checkpointFile="",
+        pipelined=False,
+        manifestFile="",
+        builtinGit=False,
+        historyHorizon="",
+        headersFile="",
+        imageSitemap=False,
+        externalUrlFiles=set(),
+        validateSitemaps=set(),
+        metaLastmod=False,
+        telemetryFile="",
+        regressionThreshold=TELEMETRY_DEFAULT_THRESHOLD
     ) :
     """The main function of the generate-sitemap GitHub Action.
 
@@ -400,52 +4256,226 @@ def main(
     excludePaths - A set of paths to exclude from the sitemap, which can
             include directories (relative from the root) or even full
             paths to individual files.
+    watch - If true, keeps running after generating the sitemap,
+            updating it whenever files within the website change
+            (requires Linux).
+    traceFile - If not empty, the name of a file, relative to the
+            root of the repository, for a Chrome Trace Event format
+            trace of the time spent in each stage and on each file.
+    timeBudget - If positive, the number of seconds, as a number or a
+            string, available for generating the sitemap. Once most of
+            it has elapsed, the lastmod dates of the remaining files
+            come from the fallback instead of the git history.
+    lastmodFallback - Either mtime to use the modification time from
+            the filesystem for lastmods once the time budget is nearly
+            exhausted, or omit to leave those lastmods out.
+    deltaFile - If not empty, the name of a file, relative to the root
+            of the repository, for the urls added, removed, and with
+            changed lastmod relative to the previous sitemap.
+    partition - If not empty, a partition of the form i/N, in which
+            case only the i-th of N slices of the files is processed,
+            writing a partial output for a later merge rather than
+            the sitemap.
+    partialFiles - If not empty, a set of glob patterns, relative
+            to the root of the repository, for the partial outputs of
+            all partitions, in which case these are merged into the
+            sitemap rather than generating it from the files.
+    indexLastmodFromSubtree - If true, the lastmod of an index file
+            (e.g., dir/index.html) in an XML sitemap is the newest
+            lastmod of the files in its directory and subdirectories.
+    planOnly - If true, projects the outcome without determining
+            lastmod dates or writing the sitemap.
+    planSampleSize - If positive, the number of randomly chosen html
+            files that planOnly checks for noindex directives.
+    followSymlinks - If true, also discovers files within directories
+            that are symbolic links, checking each distinct file for
+            noindex and determining its lastmod only once.
+    useIgnoreFiles - If true, skips files and directories that match
+            the gitignore-style rules of .sitemapignore files in the
+            directories that enclose them.
+    checkpointFile - If not empty, the name of a file, relative to the
+            root of the repository, where progress is saved, so that
+            a rerun after an interruption resumes from it.
+    pipelined - If true, determines the lastmod dates of files as soon
+            as they pass the robots.txt, exclude paths, and noindex checks,
+            on a separate thread, while the remaining files are checked.
+    manifestFile - If not empty, the name of a file, relative to the root
+            of the repository, or - for the standard input, listing the
+            files of the website (see readManifest), which is used instead
+            of walking the directory tree.
+    builtinGit - If true, finds lastmod dates by reading the history
+            directly from the git repository, in a single walk of it,
+            rather than by running git for each file, falling back to
+            running git if the layout of the repository isn't supported.
+    historyHorizon - If not empty, a number of commits or a date, which
+            bounds how far back in the git history lastmod dates are
+            searched for. Files not changed within the horizon get the
+            date of the newest commit beyond it.
+    headersFile - If not empty, the name of a Netlify or Cloudflare Pages
+            style _headers file, relative to the root of the repository,
+            whose X-Robots-Tag headers with noindex directives exclude
+            the files at the matching paths, of any type.
+    imageSitemap - If true, lists the images (<img> tags) of each html
+            page in an XML sitemap, with the image sitemap extension.
+    externalUrlFiles - If not empty, a set of glob patterns, relative
+            to the root of the repository, for files listing urls that
+            aren't files of the website, with optional lastmod dates,
+            which are merged into the sitemap.
+    validateSitemaps - If not empty, a set of glob patterns, relative
+            to the root of the repository, for existing sitemaps (or
+            sitemap indexes) to validate, in which case they are
+            validated rather than generating the sitemap.
+    metaLastmod - If true, the lastmod of an html page in an XML sitemap
+            is the date in its <meta property="article:modified_time">
+            or <meta name="last-modified">, found in the same read of its
+            head as the noindex check, and only pages without either
+            get a lastmod from the git history or the file manifest.
+    telemetryFile - If not empty, the name of a file, relative to the
+            root of the repository, to which metrics of the run (the
+            time of each stage, counts of files, bytes read, and git
+            calls, and peak memory) are appended, and against whose
+            recent runs the times are checked for regressions. Doesn't
+            apply to the plan-only, validation, and watch modes.
+    regressionThreshold - The percentage by which the time of a stage,
+            or the total time, must exceed the median of recent runs
+            in the telemetry file to be reported as a regression.
     """
+    start = time.perf_counter()
+    try :
+        timeBudget = parseTimeBudget(timeBudget)
+        if len(partition) > 0 :
+            parsePartition(partition)
+        if len(historyHorizon) > 0 :
+            parseHistoryHorizon(historyHorizon)
+        if len(deltaFile) > 0 and len(partition) > 0 :
+            raise ValueError("A delta-file isn't supported with a partition")
+        if len(deltaFile) > 0 and len(partialFiles) > 0 :
+            raise ValueError("A delta-file isn't supported with merge-partials")
+    except ValueError as e :
+        print("ERROR: {0}. Exiting....".format(e))
+        exit(1)
+    partialFiles = sorted({ os.path.abspath(f) for pattern in partialFiles for f in glob.glob(pattern) })
     repo_root = os.getcwd()
-    sanitized_root = sanitize_path(websiteRoot) 
-    os.chdir(sanitized_root)
-
-    # Fixes "dubious ownership" warning related to
-    # how the actions working directory is mounted
-    # inside container actions.
-    subprocess.run(['git', 'config', '--global', '--add', 'safe.directory', repo_root])
-    subprocess.run(['git', 'config', '--global', '--add', 'safe.directory', sanitized_root])
-
-    if len(excludePaths) > 0:
-        excludePaths = { adjust_path(path) for path in excludePaths}
-    blockedPaths = set(parseRobotsTxt()) | excludePaths
-    
-    allFiles = gatherfiles(createExtensionSet(includeHTML, includePDF, additionalExt))
-    files = [ f for f in allFiles if not robotsBlocked(f, blockedPaths) ]
-    urlsort(files, dropExtension)
-
+    telemetry = len(telemetryFile) > 0 and len(validateSitemaps) == 0 and not planOnly and not watch
+    if telemetry :
+        telemetryFile = os.path.abspath(telemetryFile)
+    if len(traceFile) > 0 :
+        traceFile = os.path.abspath(traceFile)
+        tracer.use(Tracer())
+    elif telemetry :
+        tracer.use(StageTimer())
     pathToSitemap = websiteRoot
     if pathToSitemap[-1] != "/" :
         pathToSitemap += "/"
-    if sitemapFormat == "xml" :
-        writeXmlSitemap(files, baseUrl, dropExtension, dateOnly)
-        pathToSitemap += "sitemap.xml"
+    config = SitemapConfig(
+        root = sanitize_path(websiteRoot),
+        baseUrl = baseUrl,
+        includeHTML = includeHTML,
+        includePDF = includePDF,
+        sitemapFormat = sitemapFormat,
+        additionalExt = additionalExt,
+        dropExtension = dropExtension,
+        dateOnly = dateOnly,
+        excludePaths = excludePaths,
+        timeBudget = timeBudget,
+        lastmodFallback = lastmodFallback,
+        deltaFile = os.path.abspath(deltaFile) if len(deltaFile) > 0 else None,
+        partition = partition if len(partition) > 0 else None,
+        indexLastmodFromSubtree = indexLastmodFromSubtree,
+        followSymlinks = followSymlinks,
+        useIgnoreFiles = useIgnoreFiles,
+        checkpointFile = os.path.abspath(checkpointFile) if len(checkpointFile) > 0 else None,
+        pipelined = pipelined,
+        manifestFile = None if len(manifestFile) == 0 else manifestFile if manifestFile == "-" else os.path.abspath(manifestFile),
+        builtinGit = builtinGit,
+        historyHorizon = historyHorizon if len(historyHorizon) > 0 else None,
+        headersFile = os.path.abspath(headersFile) if len(headersFile) > 0 else None,
+        images = imageSitemap,
+        externalUrls = sorted({ os.path.abspath(f) for pattern in externalUrlFiles for f in glob.glob(pattern) }),
+        metaLastmod = metaLastmod
+    )
+
+    if len(validateSitemaps) > 0 :
+        outputs = runValidation(config, validateSitemaps)
+    elif len(partialFiles) > 0 :
+        try :
+            outputs = runMerge(config, partialFiles)
+        except ValueError as e :
+            print("ERROR: {0}. Exiting....".format(e))
+            exit(1)
+    elif planOnly :
+        outputs = runPlan(config, planSampleSize)
+    elif watch :
+        # Fixes "dubious ownership" warning related to
+        # how the actions working directory is mounted
+        # inside container actions, once for all of the
+        # generations of the sitemap.
+        trustRepository(repo_root, config.root)
+        outputs = watchSite(config)
     else :
-        writeTextSitemap(files, baseUrl, dropExtension)
-        pathToSitemap += "sitemap.txt"
+        # Fixes "dubious ownership" warning related to
+        # how the actions working directory is mounted
+        # inside container actions, unless git isn't run.
+        config.trustDirectories = (repo_root, config.root)
+        outputs = generateSitemap(config)
+    if "sitemap-path" in outputs :
+        outputs["sitemap-path"] = pathToSitemap + os.path.basename(outputs["sitemap-path"])
+
+    timer = tracer.current()
+    if len(traceFile) > 0 :
+        timer.write(traceFile)
+    if len(traceFile) > 0 or telemetry :
+        tracer.use(NULL_TRACER)
+
+    if telemetry :
+        fileCount = outputs["url-count"] - outputs.get("external-url-count", 0) + outputs["excluded-count"]
+        regressed = recordTelemetry(telemetryFile, runMetrics(timer, time.perf_counter() - start, fileCount, outputs["url-count"]), regressionThreshold)
+        outputs["performance-regression"] = "true" if len(regressed) > 0 else "false"
+        outputs["regressed-stages"] = ",".join(regressed)
+    set_outputs(outputs)
 
-    set_outputs({
-        "sitemap-path" : pathToSitemap,
-        "url-count" : len(files),
-        "excluded-count" : len(allFiles)-len(files)
-    })
+# The number of inputs passed by action.yml. When run directly, any
+# inputs that are left off at the end default to empty strings.
+NUMBER_OF_INPUTS = 32
 
 if __name__ == "__main__" :
+    watch = len(sys.argv) > 1 and sys.argv[1] == "--watch"
+    args = sys.argv[2:] if watch else sys.argv[1:]
+    args += [""] * (NUMBER_OF_INPUTS - len(args))
     main(
-        websiteRoot = sys.argv[1],
-        baseUrl = sys.argv[2],
-        includeHTML = sys.argv[3].lower() == "true",
-        includePDF = sys.argv[4].lower() == "true",
-        sitemapFormat = sys.argv[5],
-        additionalExt = set(sys.argv[6].lower().replace(",", " ").replace(".", " ").split()),
-        dropExtension = sys.argv[7].lower() == "true",
-        dateOnly = sys.argv[8].lower() == "true",
-        excludePaths = set(sys.argv[9].replace(",", " ").split())
+        websiteRoot = args[0],
+        baseUrl = args[1],
+        includeHTML = args[2].lower() == "true",
+        includePDF = args[3].lower() == "true",
+        sitemapFormat = args[4],
+        additionalExt = set(args[5].lower().replace(",", " ").replace(".", " ").split()),
+        dropExtension = args[6].lower() == "true",
+        dateOnly = args[7].lower() == "true",
+        excludePaths = set(args[8].replace(",", " ").split()),
+        watch = watch,
+        traceFile = args[9],
+        timeBudget = args[10].strip() if len(args[10].strip()) > 0 else 0,
+        lastmodFallback = args[11].lower() if args[11].lower() in LASTMOD_FALLBACKS else "mtime",
+        deltaFile = args[12],
+        partition = args[13].strip(),
+        partialFiles = set(args[14].split()),
+        indexLastmodFromSubtree = args[15].lower() == "true",
+        planOnly = args[16].lower() == "true",
+        planSampleSize = int(args[17]) if len(args[17]) > 0 else 0,
+        followSymlinks = args[18].lower() == "true",
+        useIgnoreFiles = args[19].lower() == "true",
+        checkpointFile = args[20],
+        pipelined = args[21].lower() == "true",
+        manifestFile = args[22].strip(),
+        builtinGit = args[23].lower() == "true",
+        historyHorizon = args[24].strip(),
+        headersFile = args[25].strip(),
+        imageSitemap = args[26].lower() == "true",
+        externalUrlFiles = set(args[27].split()),
+        validateSitemaps = set(args[28].split()),
+        metaLastmod = args[29].lower() == "true",
+        telemetryFile = args[30].strip(),
+        regressionThreshold = float(args[31]) if len(args[31]) > 0 else TELEMETRY_DEFAULT_THRESHOLD
     )
 
     
@@ -0,0 +1,443 @@
+# generate-sitemap: Github action for automating sitemap generation
+#
+# Copyright (c) 2020-2025 Vincent A Cicirello
+# https://www.cicirello.org/
+#
+# MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+# Differential tests that generate random websites and check that the
+# sitemaps generated by generatesitemap.py are byte-identical to those
+# of the straightforward reference implementations below, which are
+# kept as they were prior to any performance optimizations. The number
+# of random websites can be set with the environment variable
+# SITEMAP_DIFFERENTIAL_SITES, and the seed with SITEMAP_DIFFERENTIAL_SEED.
+
+import unittest
+import generatesitemap as gs
+import os
+import re
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+# Reference implementations
+
+def refGatherfiles(extensionsToInclude) :
+    if len(extensionsToInclude) == 0 :
+        return []
+    allfiles = []
+    for root, dirs, files in os.walk(".") :
+        for f in files :
+            if refGetFileExtension(f) in extensionsToInclude :
+                allfiles.append(os.path.join(root, f))
+    return allfiles
+
+REF_INDEX_FILENAMES = { "index.html", "index.shtml" }
+
+def refSortname(f, dropExtension=False) :
+    slash = f.rfind("/")
+    if slash >= 0 and slash < len(f)-1 and f[slash+1:] in REF_INDEX_FILENAMES :
+        return f[:slash+1]
+    elif f in REF_INDEX_FILENAMES :
+        return ""
+    elif dropExtension and len(f) >= 5 and f[-5:] == ".html" :
+        return f[:-5]
+    else :
+        return f
+
+def refUrlsort(files, dropExtension=False) :
+    files.sort(key = lambda f : refSortname(f, dropExtension))
+    files.sort(key = lambda f : f.count("/"))
+
+REF_META_TAG = re.compile(r"<meta([^>]*)>", flags=re.I | re.M | re.S)
+
+def refHasMetaRobotsNoindex(f) :
+    try:
+        with open(f, "r", errors="surrogateescape") as file :
+            contents = file.read()
+            m = re.search("</head>", contents, flags=re.I)
+            if not m :
+                m = re.search("<body>", contents, flags=re.I)
+            all_meta_tags = REF_META_TAG.findall(contents, endpos=m.start()) if m else REF_META_TAG.findall(contents)
+            for tag in all_meta_tags :
+                if re.search("name\\s*=\\s*\"\\s*robots", tag, flags=re.I) and re.search("content\\s*=\\s*\".*noindex", tag, flags=re.I) :
+                    return True
+            return False
+    except OSError:
+        pass
+    return False
+
+def refGetFileExtension(f) :
+    i = f.rfind(".")
+    return f[i+1:].lower() if i >= 0 and f.rfind("/") < i else None
+
+def refIsHTMLFile(f) :
+    return refGetFileExtension(f) in { "html", "htm", "shtml" }
+
+def refRobotsBlocked(f, blockedPaths=[]) :
+    if len(blockedPaths) > 0 :
+        f2 = f
+        if f2[0] == "." :
+            f2 = f2[1:]
+        for b in blockedPaths :
+            if f2.startswith(b) :
+                return True
+    if not refIsHTMLFile(f) :
+        return False
+    return refHasMetaRobotsNoindex(f)
+
+def refParseRobotsTxt(robotsFile="robots.txt") :
+    blockedPaths = []
+    try:
+        if os.path.isfile(robotsFile) :
+            with open(robotsFile, "r", errors="surrogateescape") as robots :
+                foundBlock = False
+                rulesStart = False
+                for line in robots :
+                    commentStart = line.find("#")
+                    if commentStart > 0 :
+                        line = line[:commentStart]
+                    line = line.strip()
+                    lineLow = line.lower()
+                    if lineLow.startswith("user-agent:") :
+                        if len(line)>11 and line[11:].strip() == "*" :
+                            foundBlock = True
+                            rulesStart = False
+                        elif rulesStart :
+                            foundBlock = False
+                            rulesStart = False
+                    elif foundBlock :
+                        if lineLow.startswith("allow:") :
+                            rulesStart = True
+                        elif lineLow.startswith("disallow:") :
+                            rulesStart = True
+                            if len(line) > 9 :
+                                path = line[9:].strip()
+                                if len(path) > 0 and " " not in path and "\t" not in path:
+                                    blockedPaths.append(path)
+    except OSError:
+        pass
+    return blockedPaths
+
+def refLastmod(f) :
+    return subprocess.run(['git', 'log', '-1', '--format=%cI', f],
+                    stdout=subprocess.PIPE,
+                    universal_newlines=True).stdout.strip()
+
+def refUrlstring(f, baseUrl, dropExtension=False) :
+    if f[0]=="." :
+        u = f[1:]
+    else :
+        u = f
+    u = refSortname(u, dropExtension)
+    if len(u) >= 1 and u[0]=="/" and len(baseUrl) >= 1 and baseUrl[-1]=="/" :
+        u = u[1:]
+    elif (len(u)==0 or u[0]!="/") and (len(baseUrl)==0 or baseUrl[-1]!="/") :
+        u = "/" + u
+    return baseUrl + u
+
+def refXmlEscapeCharacters(f):
+    return f.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;").replace("'", "&apos;").replace('"', "&quot;")
+
+def refXmlSitemapEntry(f, baseUrl, dateString, dropExtension=False, dateOnly=False) :
+    if dateString is None :
+        return """<url>
+<loc>{0}</loc>
+</url>""".format(refUrlstring(refXmlEscapeCharacters(f), baseUrl, dropExtension))
+    return """<url>
+<loc>{0}</loc>
+<lastmod>{1}</lastmod>
+</url>""".format(
+        refUrlstring(refXmlEscapeCharacters(f), baseUrl, dropExtension),
+        dateString[:10] if dateOnly else dateString
+    )
+
+def referenceSitemaps(baseUrl, extensions, dropExtension, dateOnly, excludePaths) :
+    blockedPaths = set(refParseRobotsTxt()) | excludePaths
+    allFiles = refGatherfiles(extensions)
+    files = [ f for f in allFiles if not refRobotsBlocked(f, blockedPaths) ]
+    refUrlsort(files, dropExtension)
+    xml = ['<?xml version="1.0" encoding="UTF-8"?>\n<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n']
+    for f in files :
+        xml.append(refXmlSitemapEntry(f, baseUrl, refLastmod(f), dropExtension, dateOnly) + "\n")
+    xml.append('</urlset>\n')
+    txt = [ refUrlstring(f, baseUrl, dropExtension) + "\n" for f in files ]
+    return "".join(xml), "".join(txt)
+
+def refShards(entries, header, footer, maxUrls, maxBytes) :
+    shards = []
+    for entry in entries :
+        line = entry + "\n"
+        n = len(line.encode("utf-8", "surrogateescape"))
+        if len(shards) == 0 or count == maxUrls or size + n + len(footer) > maxBytes :
+            shards.append([header])
+            count, size = 0, len(header)
+        shards[-1].append(line)
+        count += 1
+        size += n
+    if len(shards) == 0 :
+        shards.append([header])
+    return [ "".join(shard) + footer for shard in shards ]
+
+# Sitemaps generated by the engines of generatesitemap.py
+
+def readAndRemove(filename) :
+    with open(filename, "r", errors="surrogateescape") as f :
+        contents = f.read()
+    os.remove(filename)
+    return contents
+
+def optimizedSitemaps(baseUrl, extensions, dropExtension, dateOnly, excludePaths, pipelined=False, builtinGit=False) :
+    blockedPaths = set(gs.parseRobotsTxt()) | excludePaths
+    allFiles = gs.gatherfiles(extensions)
+    if builtinGit :
+        files = [ f for f in allFiles if not gs.robotsBlocked(f, blockedPaths) ]
+        gs.urlsort(files, dropExtension)
+        lastmods, degraded = gs.computeLastmods(files, history=gs.GitHistory("."))
+    elif pipelined :
+        records, lastmods, degraded = gs.pipelinedFilterAndLastmods(gs.fileRecords(allFiles, dropExtension), blockedPaths)
+        gs.sortRecords(records)
+        files = [ r.path for r in records ]
+    else :
+        files = [ f for f in allFiles if not gs.robotsBlocked(f, blockedPaths) ]
+        gs.urlsort(files, dropExtension)
+        lastmods, degraded = gs.computeLastmods(files)
+    name, shards = gs.writeSitemap(files, baseUrl, "xml", dropExtension, dateOnly, lastmods)
+    xml = readAndRemove(name)
+    name, shards = gs.writeSitemap(files, baseUrl, "txt", dropExtension)
+    txt = readAndRemove(name)
+    return xml, txt
+
+# Random websites
+
+HEAD_TAGS = [
+    '<meta charset="utf-8">',
+    '<meta name="googlebot" content="noindex">',
+    '<meta name="robots" content="index, follow">',
+    '<meta name="viewport" content="width=device-width, initial-scale=1">',
+    '<link rel="canonical" href="https://SOME.WEBSITE.WOULD.GO.HERE....">',
+    '<title>Title Goes HERE</title>'
+]
+
+NOINDEX_TAGS = [
+    '<meta name="robots" content="noindex">',
+    '<meta name = "robots" content = "index, NOINDEX">',
+    '<META NAME="ROBOTS" CONTENT="noindex,nofollow">',
+    '<meta content="noindex" name="robots">'
+]
+
+NON_CHAR_DATA = bytes(range(128, 256))
+
+FILENAMES = [
+    "index.html", "index.shtml", "a.html", "b.htm", "c.shtml", "aindex.html",
+    "x.pdf", "y.pdf", "doc.docx", "R&D.html", "it's.html", "caf\u00e9.html",
+    "z.HTML", "noext", "notes.txt"
+]
+
+DIRECTORIES = [ "sub", "docs", "a", "b&c", "deep" ]
+
+def randomHtml(rng) :
+    """Generates the bytes of a random html file with random tags in
+    the head and body, possibly bytes that aren't valid characters,
+    and possibly missing the end of the head."""
+    head = [ rng.choice(HEAD_TAGS) for i in range(rng.randint(0, 4)) ]
+    body = [ rng.choice(HEAD_TAGS) for i in range(rng.randint(0, 2)) ]
+    if rng.random() < 0.3 :
+        rng.choice([head, body]).insert(0, rng.choice(NOINDEX_TAGS))
+    head = "".join(tag + "\n" for tag in head)
+    body = "".join(tag + "\n" for tag in body)
+    parts = [ b"<!DOCTYPE html>\n<html>\n<head>\n", head.encode() ]
+    if rng.random() < 0.3 :
+        parts.insert(rng.randint(1, len(parts)), NON_CHAR_DATA)
+    style = rng.random()
+    if style < 0.7 :
+        parts.append(b"</head>\n<body>\n")
+    elif style < 0.85 :
+        parts.append(b"<body>\n")
+    parts.append(body.encode())
+    parts.append(b"</body>\n</html>\n")
+    return b"".join(parts)
+
+def randomRobotsTxt(rng, directories) :
+    """Generates the contents of a random robots.txt."""
+    lines = [ "# random robots.txt" ]
+    for i in range(rng.randint(0, 3)) :
+        lines.append("User-agent: " + rng.choice(["*", "R2D2", "*", "Googlebot"]))
+        for j in range(rng.randint(0, 2)) :
+            rule = rng.choice(["Disallow: ", "Allow: ", "Disallow:"])
+            target = "/" + rng.choice(directories + FILENAMES) if rng.random() < 0.8 else ""
+            lines.append(rule + target + rng.choice(["", "  # comment"]))
+        lines.append("")
+    return "\n".join(lines) + "\n"
+
+def git(*args, env=None) :
+    subprocess.run(
+        ['git', '-c', 'user.name=Tester', '-c', 'user.email=tester@example.com', '-c', 'commit.gpgsign=false'] + list(args),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        env=env,
+        check=True
+    )
+
+def createRandomSite(rng) :
+    """Creates a random website in the current directory as a git
+    repository with random commit history. Returns the list of
+    directories of the site."""
+    directories = [ "." ]
+    for i in range(rng.randint(2, 12)) :
+        parent = rng.choice(directories)
+        if parent.count("/") < 4 :
+            directory = os.path.join(parent, rng.choice(DIRECTORIES))
+            os.makedirs(directory, exist_ok=True)
+            if directory not in directories :
+                directories.append(directory)
+    files = []
+    for directory in directories :
+        for name in rng.sample(FILENAMES, rng.randint(2, 10)) :
+            path = os.path.join(directory, name)
+            with open(path, "wb") as f :
+                if refIsHTMLFile(name) or name == "z.HTML" :
+                    f.write(randomHtml(rng))
+                else :
+                    f.write(b"not html")
+            files.append(path)
+    relativeDirectories = [ d[2:] for d in directories if d != "." ]
+    if rng.random() < 0.8 :
+        with open("robots.txt", "w") as f :
+            f.write(randomRobotsTxt(rng, relativeDirectories))
+    git("init", "-q", ".")
+    rng.shuffle(files)
+    commits = rng.randint(1, 4)
+    timestamp = 1600000000
+    for i in range(commits) :
+        batch = files[i * len(files) // commits : (i+1) * len(files) // commits]
+        if i == commits - 1 :
+            batch = [ "." ]
+        timestamp += rng.randint(3600, 86400 * 30)
+        offset = rng.choice(["+0000", "-0400", "+0530"])
+        env = dict(os.environ, GIT_COMMITTER_DATE="{0} {1}".format(timestamp, offset), GIT_AUTHOR_DATE="{0} {1}".format(timestamp, offset))
+        git("add", *batch, env=env)
+        git("commit", "-q", "--allow-empty", "-m", "commit " + str(i), env=env)
+    if commits > 1 and rng.random() < 0.5 :
+        # a side branch from an earlier commit, merged back in
+        git("checkout", "-q", "-b", "side", "HEAD~1")
+        present = [ path for path in files if os.path.isfile(path) ]
+        for path in rng.sample(present, min(3, len(present))) :
+            with open(path, "ab") as f :
+                f.write(b"changed on side branch\n")
+        timestamp += rng.randint(3600, 86400)
+        env = dict(os.environ, GIT_COMMITTER_DATE="{0} -0400".format(timestamp), GIT_AUTHOR_DATE="{0} -0400".format(timestamp))
+        git("add", "-A", env=env)
+        git("commit", "-q", "-m", "side", env=env)
+        git("checkout", "-q", "-")
+        timestamp += rng.randint(3600, 86400)
+        env = dict(os.environ, GIT_COMMITTER_DATE="{0} +0530".format(timestamp), GIT_AUTHOR_DATE="{0} +0530".format(timestamp))
+        git("merge", "-q", "--no-ff", "--no-edit", "-X", rng.choice(["ours", "theirs"]), "side", env=env)
+    if rng.random() < 0.3 :
+        git("gc", "-q", "--aggressive")
+    return relativeDirectories
+
+class DifferentialTest(unittest.TestCase) :
+
+    def test_randomSites(self) :
+        sites = int(os.environ.get("SITEMAP_DIFFERENTIAL_SITES", "8"))
+        seed = int(os.environ.get("SITEMAP_DIFFERENTIAL_SEED", str(random.randrange(1000000))))
+        rng = random.Random(seed)
+        referenceTime = 0
+        optimizedTime = 0
+        cwd = os.getcwd()
+        for site in range(sites) :
+            with tempfile.TemporaryDirectory() as d :
+                os.chdir(d)
+                try :
+                    directories = createRandomSite(rng)
+                    baseUrl = rng.choice(["https://TESTING.FAKE.WEB.ADDRESS.TESTING/", "https://TESTING.FAKE.WEB.ADDRESS.TESTING"])
+                    extensions = gs.createExtensionSet(rng.random() < 0.9, rng.random() < 0.5, set(rng.sample(["docx", "txt", "html"], rng.randint(0, 2))))
+                    dropExtension = rng.random() < 0.5
+                    dateOnly = rng.random() < 0.5
+                    excludePaths = { gs.adjust_path(p) for p in rng.sample(directories + ["a.html", "x.pdf"], min(2, rng.randint(0, 1 + len(directories)))) }
+                    config = (baseUrl, extensions, dropExtension, dateOnly, excludePaths)
+                    start = time.perf_counter()
+                    expected = referenceSitemaps(*config)
+                    referenceTime += time.perf_counter() - start
+                    start = time.perf_counter()
+                    mode = ("sequential", "pipelined", "builtin-git")[site % 3]
+                    actual = optimizedSitemaps(*config, pipelined=mode == "pipelined", builtinGit=mode == "builtin-git")
+                    optimizedTime += time.perf_counter() - start
+                    message = "seed {0}, site {1}, config {2}, mode {3}".format(seed, site, config, mode)
+                    self.assertEqual(expected[0], actual[0], msg="xml: " + message)
+                    self.assertEqual(expected[1], actual[1], msg="txt: " + message)
+                finally :
+                    os.chdir(cwd)
+        print(
+            "\nDifferential test (seed {0}): {1} sites, reference {2:.3f}s, optimized {3:.3f}s, speedup {4:.2f}x".format(
+                seed, sites, referenceTime, optimizedTime, referenceTime / optimizedTime if optimizedTime > 0 else float("inf")
+            ),
+            file=sys.stderr
+        )
+
+    def test_batchedRenderer(self) :
+        seed = int(os.environ.get("SITEMAP_DIFFERENTIAL_SEED", str(random.randrange(1000000))))
+        rng = random.Random(seed)
+        for trial in range(4) :
+            files = set()
+            for i in range(rng.randint(1, 3 * gs.RENDER_BLOCK_SIZE)) :
+                path = "."
+                for depth in range(rng.randint(0, 3)) :
+                    path += "/" + rng.choice(DIRECTORIES)
+                files.add(path + "/" + rng.choice(FILENAMES).replace("a", str(rng.randrange(1000)), 1))
+            files = sorted(files)
+            baseUrl = rng.choice(["https://TESTING.FAKE.WEB.ADDRESS.TESTING/", "https://TESTING.FAKE.WEB.ADDRESS.TESTING"])
+            dropExtension = rng.random() < 0.5
+            dateOnly = rng.random() < 0.5
+            gs.urlsort(files, dropExtension)
+            lastmods = { f : rng.choice([None, "2021-03-04T05:06:07+05:30", "2020-12-31T23:59:59-04:00"]) for f in files }
+            maxUrls = rng.randint(gs.RENDER_BLOCK_SIZE // 2, 2 * gs.RENDER_BLOCK_SIZE)
+            maxBytes = rng.randint(100000, 1000000)
+            for sitemapFormat in ["xml", "txt"] :
+                if sitemapFormat == "xml" :
+                    entries = [ refXmlSitemapEntry(f, baseUrl, lastmods[f], dropExtension, dateOnly) for f in files ]
+                    header, footer = gs.XML_SITEMAP_HEADER, gs.XML_SITEMAP_FOOTER
+                else :
+                    entries = [ refUrlstring(f, baseUrl, dropExtension) for f in files ]
+                    header, footer = "", ""
+                expected = refShards(entries, header, footer, maxUrls, maxBytes)
+                original = (gs.SITEMAP_MAX_URLS, gs.SITEMAP_MAX_BYTES)
+                with tempfile.TemporaryDirectory() as d :
+                    try :
+                        gs.SITEMAP_MAX_URLS, gs.SITEMAP_MAX_BYTES = maxUrls, maxBytes
+                        name, shards = gs.writeSitemap(files, baseUrl, sitemapFormat, dropExtension, dateOnly, lastmods, d)
+                    finally :
+                        gs.SITEMAP_MAX_URLS, gs.SITEMAP_MAX_BYTES = original
+                    if shards == 1 :
+                        actual = [ readAndRemove(os.path.join(d, name)) ]
+                    else :
+                        actual = [ readAndRemove(os.path.join(d, gs.shardFilename(k, sitemapFormat))) for k in range(1, shards + 1) ]
+                message = "seed {0}, trial {1}, format {2}".format(seed, trial, sitemapFormat)
+                self.assertEqual(len(expected), len(actual), msg=message)
+                for k in range(len(expected)) :
+                    self.assertEqual(expected[k], actual[k], msg="shard {0}: {1}".format(k + 1, message))
+
+if __name__ == "__main__" :
+    unittest.main()
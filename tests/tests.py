@@ -27,6 +27,10 @@
 import unittest
 import generatesitemap as gs
 import os
+import sys
+import json
+import tempfile
+import gzip
 
 def validateDate(s) :
     if len(s) < 25 :
@@ -369,6 +373,32 @@ class TestGenerateSitemap(unittest.TestCase) :
         for f in blocked :
             self.assertTrue(gs.hasMetaRobotsNoindex(f))
 
+    def test_scanHead(self) :
+        with tempfile.TemporaryDirectory() as d :
+            pages = {
+                "article.html" : '<html><head><meta property="article:modified_time" content="2024-05-01T10:00:00Z"></head><body></body></html>',
+                "header.html" : "<html><head><meta name='Last-Modified' content='Wed, 01 May 2024 10:00:00 GMT'></head></html>",
+                "noindex.html" : '<html><head><meta name="last-modified" content="2024-05-01"><meta name="robots" content="noindex"></head></html>',
+                "body.html" : '<html><head></head><body><meta name="last-modified" content="2024-05-01"></body></html>',
+                "invalid.html" : '<html><head><meta name="last-modified" content="yesterday"></head></html>',
+            }
+            for name, contents in pages.items() :
+                with open(os.path.join(d, name), "w") as f :
+                    f.write(contents)
+            self.assertEqual((False, "2024-05-01T10:00:00+00:00"), gs.scanHead(os.path.join(d, "article.html"), True))
+            self.assertEqual((False, None), gs.scanHead(os.path.join(d, "article.html")))
+            self.assertEqual((False, "2024-05-01T10:00:00+00:00"), gs.scanHead(os.path.join(d, "header.html"), True))
+            self.assertEqual((True, "2024-05-01"), gs.scanHead(os.path.join(d, "noindex.html"), True))
+            self.assertEqual((False, None), gs.scanHead(os.path.join(d, "body.html"), True))
+            self.assertEqual((False, None), gs.scanHead(os.path.join(d, "invalid.html"), True))
+            for noindexCache in [None, {}] :
+                metaLastmods = {}
+                selected = [ "./" + name for name in sorted(pages) if not gs.robotsBlocked("./" + name, [], noindexCache, d, None, metaLastmods) ]
+                self.assertEqual(["./article.html", "./body.html", "./header.html", "./invalid.html"], selected)
+                self.assertEqual({ "./article.html", "./header.html", "./noindex.html" }, set(metaLastmods))
+        self.assertEqual("2024-05-01T10:00:00+05:30", gs.parseMetaDate("2024-05-01T10:00:00.123+05:30"))
+        self.assertIsNone(gs.parseMetaDate("2024-13-01"))
+
     def test_gatherfiles_html(self) :
         os.chdir("tests")
         allfiles = gs.gatherfiles({"html", "htm"})
@@ -741,3 +771,895 @@ class TestGenerateSitemap(unittest.TestCase) :
         self.assertEqual("/hello/bye", gs.adjust_path("./hello/bye"))
         self.assertEqual("/hello", gs.adjust_path("hello"))
         self.assertEqual("/hello/bye", gs.adjust_path("hello/bye"))
+
+    def test_collectChanges(self):
+        events = [
+            ("./a.html", gs.IN_CREATE),
+            ("./a.html", gs.IN_CLOSE_WRITE),
+            ("./b.html", gs.IN_CLOSE_WRITE),
+            ("./b.html", gs.IN_DELETE),
+            ("./c.html", gs.IN_MOVED_FROM),
+            ("./c.html", gs.IN_MOVED_TO),
+            ("./gone", gs.IN_DELETE | gs.IN_ISDIR)
+        ]
+        changed, removed, rescan = gs.collectChanges(events)
+        self.assertEqual({"./a.html", "./c.html"}, changed)
+        self.assertEqual({"./b.html", "./gone/"}, removed)
+        self.assertFalse(rescan)
+        changed, removed, rescan = gs.collectChanges([(None, gs.IN_Q_OVERFLOW)])
+        self.assertTrue(rescan)
+
+    def test_siteIndex_update(self):
+        with tempfile.TemporaryDirectory() as site :
+            os.mkdir(os.path.join(site, "sub"))
+            for f in ["a.html", "sub/b.html", "x.pdf"] :
+                with open(os.path.join(site, f), "w") as out :
+                    out.write("<html><head></head></html>")
+            config = gs.SitemapConfig(root=site, baseUrl="https://example.com/", sitemapFormat="txt")
+            sitemap = os.path.join(site, "sitemap.txt")
+            def urls() :
+                with open(sitemap, "r") as f :
+                    return [ line.strip()[len("https://example.com/"):] for line in f ]
+            index = gs.SiteIndex()
+            outputs = gs.generateSitemap(config, index=index)
+            self.assertEqual(3, outputs["url-count"])
+            self.assertEqual(["a.html", "x.pdf", "sub/b.html"], urls())
+            self.assertEqual({"./a.html", "./sub/b.html", "./x.pdf"}, index.discovered)
+            # The results of the noindex checks are kept until a change is reported
+            with open(os.path.join(site, "sub/b.html"), "w") as out :
+                out.write('<html><head><meta name="robots" content="noindex"></head></html>')
+            gs.generateSitemap(config, index=index)
+            self.assertEqual(["a.html", "x.pdf", "sub/b.html"], urls())
+            changed, removed, rediscover = gs.watchedChanges({os.path.join(site, "sub/b.html"), sitemap}, set(), config, index)
+            self.assertEqual(({"./sub/b.html"}, set(), False), (changed, removed, rediscover))
+            index.update(changed, removed, site, rediscover)
+            gs.generateSitemap(config, index=index)
+            self.assertEqual(["a.html", "x.pdf"], urls())
+            with open(os.path.join(site, "c.html"), "w") as out :
+                out.write("<html><head></head></html>")
+            os.remove(os.path.join(site, "x.pdf"))
+            changed, removed, rediscover = gs.watchedChanges({os.path.join(site, "c.html")}, {os.path.join(site, "x.pdf")}, config, index)
+            self.assertEqual(({"./c.html"}, {"./x.pdf"}, True), (changed, removed, rediscover))
+            index.update(changed, removed, site, rediscover)
+            outputs = gs.generateSitemap(config, index=index)
+            self.assertEqual(["a.html", "c.html"], urls())
+            self.assertEqual(1, outputs["excluded-count"])
+            with open(os.path.join(site, "robots.txt"), "w") as out :
+                out.write("User-agent: *\nDisallow: /c.html\n")
+            changed, removed, rediscover = gs.watchedChanges({os.path.join(site, "robots.txt")}, set(), config, index)
+            self.assertEqual(({"./robots.txt"}, set(), False), (changed, removed, rediscover))
+            index.update(changed, removed, site, rediscover)
+            gs.generateSitemap(config, index=index)
+            self.assertEqual(["a.html"], urls())
+            self.assertEqual((set(), set(), False), gs.watchedChanges({os.path.join(site, "notes.md")}, set(), config, index))
+
+    def test_isGeneratedSitemap(self):
+        self.assertTrue(gs.isGeneratedSitemap("./sitemap.xml"))
+        self.assertTrue(gs.isGeneratedSitemap("./sitemap12.txt", "tests"))
+        self.assertTrue(gs.isGeneratedSitemap("./.sitemap-index.xml.tmp"))
+        self.assertFalse(gs.isGeneratedSitemap("./sub/sitemap.xml"))
+        self.assertTrue(gs.isGeneratedSitemap("./sub/sitemap.xml", "tests", "tests/sub"))
+        self.assertFalse(gs.isGeneratedSitemap("./sitemap.xml", "tests", "tests/sub"))
+        self.assertFalse(gs.isGeneratedSitemap("./sitemaps.xml"))
+
+    def test_inotify(self):
+        if not sys.platform.startswith("linux") :
+            return
+        with tempfile.TemporaryDirectory() as site :
+            inotify = gs.Inotify()
+            try :
+                inotify.addWatchRecursive(site)
+                with open(os.path.join(site, "a.html"), "w") as out :
+                    out.write("hello")
+                events = inotify.readEvents(5)
+                self.assertIn((os.path.join(site, "a.html"), gs.IN_CREATE), events)
+            finally :
+                inotify.close()
+
+    def test_tracer(self):
+        tracer = gs.Tracer()
+        with tracer.span("outer") :
+            with tracer.span("inner", file="./a.html") :
+                pass
+        with tempfile.TemporaryDirectory() as d :
+            filename = os.path.join(d, "trace.json")
+            tracer.write(filename)
+            with open(filename) as f :
+                trace = json.load(f)
+        events = trace["traceEvents"]
+        spans = [ e for e in events if e["ph"] == "X" ]
+        self.assertEqual(["inner", "outer"], [ e["name"] for e in spans ])
+        self.assertEqual({"file" : "./a.html"}, spans[0]["args"])
+        self.assertTrue(spans[1]["ts"] <= spans[0]["ts"])
+        self.assertTrue(spans[1]["dur"] >= spans[0]["dur"])
+        names = [ e for e in events if e["ph"] == "M" ]
+        self.assertEqual(1, len(names))
+        self.assertEqual(spans[0]["tid"], names[0]["tid"])
+        self.assertIs(gs.NullTracer.NULL_SPAN, gs.NullTracer().span("anything"))
+        # Tracing times the same batched rendering as is done without it
+        records = gs.fileRecords([ "./p{0}.html".format(i) for i in range(gs.RENDER_BLOCK_SIZE + 1) ])
+        lastmods = { r.path : "2024-05-01T10:00:00+00:00" for r in records }
+        untraced = list(gs.renderRecordBlocks(records, "https://x.y/", "xml", False, lastmods))
+        tracer = gs.Tracer()
+        gs.tracer.use(tracer)
+        try :
+            traced = list(gs.renderRecordBlocks(records, "https://x.y/", "xml", False, lastmods))
+        finally :
+            gs.tracer.use(gs.NULL_TRACER)
+        self.assertEqual(untraced, traced)
+        self.assertEqual([gs.RENDER_BLOCK_SIZE, 1], [ e["args"]["entries"] for e in tracer.events if e["name"] == "render" ])
+
+    def test_telemetry(self):
+        timer = gs.StageTimer()
+        with timer.span("stage") :
+            with timer.span("perFile", file="./a.html") :
+                timer.count("gitCalls")
+        timer.count("bytesRead", 100)
+        self.assertEqual(["stage"], list(timer.stageDurations()))
+        self.assertEqual({ "gitCalls" : 1, "bytesRead" : 100 }, timer.counters)
+        self.assertIs(gs.NullTracer.NULL_SPAN, timer.span("perFile", file="./a.html"))
+        history = [ { "total" : t, "stages" : { "filter" : 1.0, "computeLastmods" : t - 1 } } for t in [10.0, 11.0, 12.0, 30.0] ]
+        run = { "total" : 17.5, "stages" : { "filter" : 1.2, "computeLastmods" : 17.0, "writeSitemap" : 60.0 } }
+        self.assertEqual([("total", 17.5, 11.5), ("computeLastmods", 17.0, 10.5)], list(gs.findRegressions(history, run, 50)))
+        self.assertEqual([], list(gs.findRegressions(history[:2], run, 50)))
+        self.assertEqual([("computeLastmods", 17.0, 10.5)], list(gs.findRegressions(history, run, 55)))
+        with tempfile.TemporaryDirectory() as d :
+            filename = os.path.join(d, "cache", "telemetry.jsonl")
+            self.assertEqual([[], [], [], ["total", "computeLastmods"]], [ gs.recordTelemetry(filename, run, 50) for run in history ])
+            with open(filename, "a") as f :
+                f.write("not json\n")
+            original = gs.TELEMETRY_HISTORY_SIZE
+            try :
+                gs.TELEMETRY_HISTORY_SIZE = 4
+                self.assertEqual(["total", "computeLastmods"], gs.recordTelemetry(filename, { "total" : 40.0, "stages" : { "computeLastmods" : 39.0 } }, 50))
+            finally :
+                gs.TELEMETRY_HISTORY_SIZE = original
+            runs = gs.readTelemetry(filename)
+            self.assertEqual([11.0, 12.0, 30.0, 40.0], [ r["total"] for r in runs ])
+
+    def test_xmlSitemapEntryNoLastmod(self) :
+        base = "https://TESTING.FAKE.WEB.ADDRESS.TESTING/"
+        expected = "<url>\n<loc>https://TESTING.FAKE.WEB.ADDRESS.TESTING/a&amp;b.html</loc>\n</url>"
+        self.assertEqual(expected, gs.xmlSitemapEntry("./a&b.html", base, None))
+        self.assertEqual(expected, gs.xmlSitemapEntry("./a&b.html", base, None, False, True))
+
+    def test_computeLastmods_deadlinePassed(self) :
+        os.chdir("tests")
+        try :
+            files = ["./unblocked1.html", "./subdir/a.html"]
+            lastmods, degraded = gs.computeLastmods(files, gs.time.monotonic() - 1, "mtime")
+            self.assertEqual(2, degraded)
+            for f in files :
+                self.assertTrue(validateDate(lastmods[f]), msg=lastmods[f])
+            lastmods, degraded = gs.computeLastmods(files, gs.time.monotonic() - 1, "omit")
+            self.assertEqual(2, degraded)
+            self.assertEqual({f : None for f in files}, lastmods)
+            if os.name != "nt" :
+                lastmods, degraded = gs.computeLastmods(files, gs.time.monotonic() + 3600, "omit")
+                self.assertEqual(0, degraded)
+                for f in files :
+                    self.assertTrue(validateDate(lastmods[f]), msg=lastmods[f])
+        finally :
+            os.chdir("..")
+
+    def test_urlSortKey(self) :
+        base = "https://TESTING.FAKE.WEB.ADDRESS.TESTING/"
+        files = [ "./index.html", "./a.html", "./subdir/index.html", "./subdir/b.html", "./subdir/y.pdf" ]
+        for drop in [False, True] :
+            for f in files :
+                url = gs.urlstring(f, base, drop)
+                self.assertEqual((f.count("/"), gs.sortname(f, drop)), gs.urlSortKey(url, base, drop))
+                self.assertEqual((f.count("/"), gs.sortname(f, drop)), gs.urlSortKey(url, base[:-1], drop))
+
+    def test_sitemapDelta(self) :
+        base = "https://x.test/"
+        previous = [ (base, "2020-01-01"), (base + "a.html", "2020-01-01"),
+                     (base + "c.html", "2020-01-01"), (base + "sub/", "2020-01-01") ]
+        current = [ (base, "2020-01-01"), (base + "b.html", "2020-01-01"),
+                    (base + "c.html", "2021-01-01"), (base + "sub/", "2020-01-01"),
+                    (base + "sub/d.html", "2020-01-01") ]
+        expected = [ ("D", base + "a.html"), ("A", base + "b.html"),
+                     ("M", base + "c.html"), ("A", base + "sub/d.html") ]
+        self.assertEqual(expected, list(gs.sitemapDelta(previous, current, base)))
+        self.assertEqual(set(expected), set(gs.unsortedSitemapDelta(previous, current)))
+        with self.assertRaises(ValueError) :
+            list(gs.sitemapDelta(list(reversed(previous)), current, base))
+
+    def test_writeDelta(self) :
+        base = "https://x.test/"
+        with tempfile.TemporaryDirectory() as d :
+            previous = os.path.join(d, "sitemap.xml")
+            with open(previous, "w") as f :
+                f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+                f.write('<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n')
+                f.write(gs.xmlSitemapEntry("./sub/a&b.html", base, "2020-01-01") + "\n")
+                f.write(gs.xmlSitemapEntry("./index.html", base, "2020-01-01") + "\n")
+                f.write('</urlset>\n')
+            self.assertEqual([ (base + "sub/a&b.html", "2020-01-01"), (base, "2020-01-01") ],
+                             list(gs.readSitemapEntries(previous)))
+            deltaFile = os.path.join(d, "delta.txt")
+            current = [ (base, "2020-01-02"), (base + "x.html", "2020-01-01") ]
+            counts = gs.writeDelta(deltaFile, previous, current, base)
+            self.assertEqual({ "A" : 1, "D" : 1, "M" : 1 }, counts)
+            with open(deltaFile) as f :
+                lines = f.read().splitlines()
+            self.assertEqual({ "M\t" + base, "A\t" + base + "x.html", "D\t" + base + "sub/a&b.html" }, set(lines))
+            counts = gs.writeDelta(deltaFile, os.path.join(d, "missing.xml"), current, base)
+            self.assertEqual({ "A" : 2, "D" : 0, "M" : 0 }, counts)
+
+    def test_writeShardedSitemap(self) :
+        base = "https://x.test/"
+        cwd = os.getcwd()
+        maxUrls = gs.SITEMAP_MAX_URLS
+        with tempfile.TemporaryDirectory() as d :
+            os.chdir(d)
+            try :
+                gs.SITEMAP_MAX_URLS = 3
+                files = [ "./f{0}.html".format(i) for i in range(7) ]
+                lastmods = { f : "2020-01-01" for f in files }
+                self.assertEqual(("sitemap-index.xml", 3), gs.writeSitemap(files, base, "xml", lastmods=lastmods))
+                self.assertEqual(["sitemap-index.xml", "sitemap1.xml", "sitemap2.xml", "sitemap3.xml"], sorted(os.listdir(d)))
+                entries = list(gs.readSitemapEntries("sitemap-index.xml"))
+                self.assertEqual([ (gs.urlstring(f, base), "2020-01-01") for f in files ], entries)
+                self.assertEqual(("sitemap.xml", 1), gs.writeSitemap(files[:3], base, "xml", lastmods=lastmods))
+                self.assertEqual(["sitemap.xml"], os.listdir(d))
+                # Sitemap files that the action didn't write are kept
+                for name in ["sitemap-index.xml", "sitemap4.xml"] :
+                    with open(name, "w") as f :
+                        f.write("mine")
+                self.assertEqual(("sitemap.xml", 1), gs.writeSitemap(files[:3], base, "xml", lastmods=lastmods))
+                self.assertEqual(["sitemap-index.xml", "sitemap.xml", "sitemap4.xml"], sorted(os.listdir(d)))
+                self.assertEqual(("sitemap-index.xml", 3), gs.writeSitemap(files, base, "xml", lastmods=lastmods))
+                self.assertEqual(["sitemap-index.xml", "sitemap.xml", "sitemap1.xml", "sitemap2.xml", "sitemap3.xml", "sitemap4.xml"], sorted(os.listdir(d)))
+                self.assertEqual({ "sitemap1.xml", "sitemap2.xml", "sitemap3.xml" }, gs.generatedShards(d))
+                self.assertEqual(("sitemap.xml", 1), gs.writeSitemap(files[:3], base, "xml", lastmods=lastmods))
+                self.assertEqual(["sitemap.xml", "sitemap4.xml"], sorted(os.listdir(d)))
+                with open("sitemap4.xml") as f :
+                    self.assertEqual("mine", f.read())
+                os.remove("sitemap4.xml")
+                self.assertEqual("sitemap.txt", gs.writeTextSitemap([], base))
+                with open("sitemap.txt") as f :
+                    self.assertEqual("", f.read())
+            finally :
+                gs.SITEMAP_MAX_URLS = maxUrls
+                os.chdir(cwd)
+
+    def test_partition(self) :
+        self.assertEqual((2, 4), gs.parsePartition("2/4"))
+        for bad in ["0/4", "5/4", "1/0", "x", "x/4", "1/"] :
+            with self.assertRaises(ValueError) :
+                gs.parsePartition(bad)
+        files = [ "./f{0}.html".format(i) for i in range(100) ]
+        for f in files :
+            self.assertEqual(1, sum(1 for i in range(1, 5) if gs.inPartition(f, i, 4)))
+
+    def test_mergePartials(self) :
+        base = "https://x.test/"
+        files = [ "./index.html", "./b.html", "./a.html", "./sub/index.html", "./sub/c.pdf", "./sub/sub/d.html" ]
+        expected = files[:]
+        gs.urlsort(expected)
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as d :
+            os.chdir(d)
+            try :
+                partials = []
+                for i in range(1, 4) :
+                    part = [ f for f in files if gs.inPartition(f, i, 3) ]
+                    gs.urlsort(part)
+                    entries = gs.textSitemapEntries(part, base)
+                    partials.append(gs.partialFilename(i, 3))
+                    gs.writePartial(partials[-1], ( (f.count("/"), gs.sortname(f), e) for f, e in zip(part, entries) ), "txt", i, 3, 1)
+                self.assertEqual(("sitemap.txt", 1, 6, 3), gs.mergePartials(partials, "txt", base))
+                with open("sitemap.txt") as f :
+                    self.assertEqual([ gs.urlstring(f, base) for f in expected ], f.read().splitlines())
+                with self.assertRaises(ValueError) :
+                    gs.mergePartials(partials, "xml", base)
+                os.remove("sitemap.txt")
+                # A missing, duplicated, or inconsistent partition is an error, not an incomplete sitemap
+                other = gs.partialFilename(1, 2)
+                gs.writePartial(other, [], "txt", 1, 2, 0)
+                short = "short.jsonl"
+                with open(partials[0]) as f, open(short, "w") as g :
+                    g.write(f.read()[:20])
+                for bad in [ partials[:2], partials + partials[:1], [], [other] + partials[1:], [short] + partials[1:] ] :
+                    with self.assertRaises(ValueError) :
+                        gs.mergePartials(bad, "txt", base)
+                self.assertFalse(os.path.exists("sitemap.txt"))
+            finally :
+                os.chdir(cwd)
+
+    def test_aggregateDirectoryLastmods(self) :
+        lastmods = {
+            "./index.html" : "2020-01-01T00:00:00+00:00",
+            "./a.html" : "2020-02-01T00:00:00+00:00",
+            "./sub/index.html" : "2020-01-01T00:00:00+00:00",
+            "./sub/b.pdf" : "2020-03-01T05:00:00+04:00",
+            "./sub/sub/c.html" : "2020-03-01T02:00:00+00:00",
+            "./sub/sub/index.shtml" : "2019-01-01T00:00:00+00:00",
+            "./other/index.html" : "2021-01-01T00:00:00+00:00",
+            "./omitted/index.html" : None,
+            "./omitted/d.html" : None,
+            "./deep/index.html" : "2020-01-01T00:00:00+00:00",
+            "./deep/x/y/e.html" : "2020-06-01T00:00:00+00:00"
+        }
+        files = list(lastmods)
+        gs.aggregateDirectoryLastmods(files, lastmods)
+        self.assertEqual("2021-01-01T00:00:00+00:00", lastmods["./index.html"])
+        self.assertEqual("2020-02-01T00:00:00+00:00", lastmods["./a.html"])
+        self.assertEqual("2020-03-01T02:00:00+00:00", lastmods["./sub/index.html"])
+        self.assertEqual("2020-03-01T05:00:00+04:00", lastmods["./sub/b.pdf"])
+        self.assertEqual("2020-03-01T02:00:00+00:00", lastmods["./sub/sub/index.shtml"])
+        self.assertEqual("2021-01-01T00:00:00+00:00", lastmods["./other/index.html"])
+        self.assertIsNone(lastmods["./omitted/index.html"])
+        self.assertEqual("2020-06-01T00:00:00+00:00", lastmods["./deep/index.html"])
+
+    def test_partitionedSubtreeLastmods(self) :
+        base = "https://x.test/"
+        own = {
+            "./index.html" : "2020-01-01T00:00:00+00:00",
+            "./a.html" : "2020-02-01T00:00:00+00:00",
+            "./sub/index.html" : "2020-01-01T00:00:00+00:00",
+            "./sub/b.pdf" : "2020-03-01T05:00:00+04:00",
+            "./sub/sub/c.html" : "2020-03-01T02:00:00+00:00",
+            "./sub/sub/index.shtml" : "2019-01-01T00:00:00+00:00",
+            "./other/index.html" : "2021-01-01T00:00:00+00:00",
+            "./late/index.html" : None,
+            "./late/f.html" : "2020-07-01T00:00:00+00:00",
+            "./deep/index.html" : "2020-01-01T00:00:00+00:00",
+            "./deep/x/y/e.html" : "2020-06-01T00:00:00+00:00"
+        }
+        records = gs.fileRecords(list(own))
+        gs.sortRecords(records)
+        with tempfile.TemporaryDirectory() as d :
+            for dateOnly in [False, True] :
+                # Unpartitioned
+                lastmods = dict(own)
+                gs.aggregateDirectoryLastmods([ r.path for r in records ], lastmods)
+                gs.writeShardedSitemap(gs.renderRecords(records, base, "xml", dateOnly, lastmods, d), "xml", base, outputDir=d)
+                with open(os.path.join(d, "sitemap.xml")) as f :
+                    expected = f.read()
+                os.remove(os.path.join(d, "sitemap.xml"))
+                # Partitioned, where each partition has only its files' own lastmods
+                partials = []
+                for i in range(1, 4) :
+                    part = [ r for r in records if gs.inPartition(r.path, i, 3) ]
+                    entries = gs.renderRecords(part, base, "xml", dateOnly, own, d)
+                    partials.append(os.path.join(d, gs.partialFilename(i, 3)))
+                    gs.writePartial(
+                        partials[-1],
+                        ( (r.depth, r.sortname, e, own[r.path], r.path[r.path.rfind("/")+1:] in gs.INDEX_FILENAMES) for r, e in zip(part, entries) ),
+                        "xml", i, 3, 0, subtree=True, dateOnly=dateOnly
+                    )
+                self.assertEqual(("sitemap.xml", 1, len(own), 0), gs.mergePartials(partials, "xml", base, d))
+                with open(os.path.join(d, "sitemap.xml")) as f :
+                    self.assertEqual(expected, f.read())
+                os.remove(os.path.join(d, "sitemap.xml"))
+            self.assertIn("<loc>https://x.test/late/</loc>\n<lastmod>2020-07-01</lastmod>", expected)
+
+    def test_planSitemap(self) :
+        base = "https://TESTING.FAKE.WEB.ADDRESS.TESTING/"
+        os.chdir("tests")
+        try :
+            allFiles = gs.gatherfiles({"html", "htm", "pdf"})
+            robotsPaths = set(gs.parseRobotsTxt())
+            excludePaths = { "/subdir/a.html", "/x.pdf" }
+            files = [ f for f in allFiles if not gs.robotsBlocked(f, robotsPaths | excludePaths) ]
+            gs.urlsort(files)
+            plan = gs.planSitemap(allFiles, robotsPaths, excludePaths, base, "txt")
+            self.assertEqual(len(files), plan["url-count"])
+            self.assertEqual(len(allFiles) - len(files), plan["excluded-count"])
+            self.assertEqual(
+                plan["excluded-count"],
+                plan["excluded-robots-count"] + plan["excluded-paths-count"] + plan["excluded-noindex-count"]
+            )
+            self.assertEqual(2, plan["excluded-paths-count"])
+            self.assertEqual(sum(len(gs.urlstring(f, base)) + 1 for f in files), plan["sitemap-size"])
+            self.assertEqual(1, plan["shard-count"])
+            expectedXml = len(gs.XML_SITEMAP_HEADER) + len(gs.XML_SITEMAP_FOOTER) + sum(
+                len(gs.xmlSitemapEntry(f, base, "2020-09-11T13:35:00-04:00")) + 1 for f in files
+            )
+            self.assertEqual(expectedXml, gs.planSitemap(allFiles, robotsPaths, excludePaths, base, "xml")["sitemap-size"])
+            sampled = gs.planSitemap(allFiles, robotsPaths, excludePaths, base, "xml", sampleSize=2)
+            self.assertEqual(plan["excluded-robots-count"], sampled["excluded-robots-count"])
+            self.assertEqual(len(allFiles), sampled["url-count"] + sampled["excluded-count"])
+        finally :
+            os.chdir("..")
+
+    def test_gatherfiles_followSymlinks(self) :
+        if os.name == "nt" :
+            return
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as d :
+            os.chdir(d)
+            try :
+                os.makedirs("docs/v5")
+                with open("docs/v5/a.html", "w") as f :
+                    f.write('<html><head><meta name="robots" content="noindex"></head></html>')
+                with open("docs/v5/b.html", "w") as f :
+                    f.write('<html><head></head></html>')
+                os.symlink("v5", "docs/latest")
+                os.symlink("..", "docs/v5/loop")
+                self.assertEqual({"./docs/v5/a.html", "./docs/v5/b.html"}, set(gs.gatherfiles({"html"})))
+                allFiles = gs.gatherfiles({"html"}, True)
+                self.assertEqual(
+                    {"./docs/v5/a.html", "./docs/v5/b.html", "./docs/latest/a.html", "./docs/latest/b.html"},
+                    set(allFiles)
+                )
+                noindexCache = {}
+                files = [ f for f in allFiles if not gs.robotsBlocked(f, [], noindexCache) ]
+                self.assertEqual({"./docs/v5/b.html", "./docs/latest/b.html"}, set(files))
+                self.assertEqual(2, len(noindexCache))
+                lastmodCache = {}
+                lastmods, degraded = gs.computeLastmods(files, None, "mtime", lastmodCache)
+                self.assertEqual(1, len(lastmodCache))
+                self.assertEqual(lastmods["./docs/v5/b.html"], lastmods["./docs/latest/b.html"])
+                # Files without an identity, such as broken links, don't share a cache entry
+                os.symlink("missing.html", "docs/broken.html")
+                self.assertFalse(gs.robotsBlocked("./docs/broken.html", [], noindexCache))
+                gs.computeLastmods(["./docs/broken.html"], None, "mtime", lastmodCache)
+                self.assertNotIn(None, noindexCache)
+                self.assertNotIn(None, lastmodCache)
+            finally :
+                os.chdir(cwd)
+
+    def test_concurrentSites(self) :
+        import threading
+        cwd = os.getcwd()
+        results = {}
+        def generate(root, baseUrl) :
+            gs.tracer.use(gs.Tracer())
+            with gs.tracer.span("site") :
+                blockedPaths = set(gs.parseRobotsTxt(os.path.join(root, "robots.txt")))
+                files = [ f for f in gs.gatherfiles({"html", "pdf"}, root=root) if not gs.robotsBlocked(f, blockedPaths, root=root) ]
+                gs.urlsort(files)
+                name, shards = gs.writeSitemap(files, baseUrl, "txt", root=root)
+            with open(os.path.join(root, name), "r") as f :
+                events = gs.tracer.current().events
+                results[root] = (f.read().split(), [ e["name"] for e in events ].count("site"), len({ e["tid"] for e in events }))
+        with tempfile.TemporaryDirectory() as d1, tempfile.TemporaryDirectory() as d2 :
+            for d, names in [ (d1, ["a.html", "sub/b.html", "sub/c.pdf"]), (d2, ["x.html", "y.html"]) ] :
+                for name in names :
+                    os.makedirs(os.path.join(d, os.path.dirname(name)), exist_ok=True)
+                    with open(os.path.join(d, name), "w") as f :
+                        f.write("<html><head></head></html>")
+            with open(os.path.join(d2, "robots.txt"), "w") as f :
+                f.write("User-agent: *\nDisallow: /y.html\n")
+            threads = [
+                threading.Thread(target=generate, args=(d1, "https://one.example/")),
+                threading.Thread(target=generate, args=(d2, "https://two.example/"))
+            ]
+            for t in threads :
+                t.start()
+            for t in threads :
+                t.join()
+            self.assertEqual(
+                (["https://one.example/a.html", "https://one.example/sub/b.html", "https://one.example/sub/c.pdf"], 1, 1),
+                results[d1]
+            )
+            self.assertEqual((["https://two.example/x.html"], 1, 1), results[d2])
+            self.assertFalse(os.path.exists(os.path.join(d2, "sitemap.xml")))
+        self.assertEqual(cwd, os.getcwd())
+        self.assertIs(gs.NULL_TRACER, gs.tracer.current())
+
+    def test_gatherfiles_root(self) :
+        os.chdir("tests")
+        try :
+            expected = set(gs.gatherfiles({"html", "pdf"}, False, True))
+        finally :
+            os.chdir("..")
+        self.assertEqual(expected, set(gs.gatherfiles({"html", "pdf"}, False, True, "tests")))
+        self.assertEqual(expected, set(gs.gatherfiles({"html", "pdf"}, False, True, "tests/")))
+
+    def test_generateEntries(self) :
+        config = gs.SitemapConfig(root="tests", baseUrl="https://TESTING.FAKE.WEB.ADDRESS.TESTING/", sitemapFormat="txt", additionalExt={"docx"})
+        blockedPaths = set(gs.parseRobotsTxt("tests/robots.txt"))
+        expected = [ f for f in gs.gatherfiles({"html", "htm", "shtml", "pdf", "docx"}, root="tests") if not gs.robotsBlocked(f, blockedPaths, root="tests") ]
+        gs.urlsort(expected)
+        self.assertEqual(
+            [ gs.urlstring(f, config.baseUrl) for f in expected ],
+            list(gs.generateEntries(config))
+        )
+        self.assertEqual({"docx"}, config.additionalExt)
+        # Each config has its own collections rather than sharing the defaults
+        first, second = gs.SitemapConfig(), gs.SitemapConfig()
+        first.excludePaths.add("/private")
+        first.externalUrls.append("urls.txt")
+        self.assertEqual((set(), set(), []), (second.additionalExt, second.excludePaths, second.externalUrls))
+
+    def test_generateSitemap_records(self) :
+        with tempfile.TemporaryDirectory() as root, tempfile.TemporaryDirectory() as out :
+            os.makedirs(os.path.join(root, "sub"))
+            for name, contents in [ ("index.html", "<html></html>"), ("sub/b.html", "<html></html>"),
+                                    ("sub/c.html", '<html><head><meta name="robots" content="noindex"></head></html>'),
+                                    ("private/d.html", "<html></html>"), ("e.txt", "text") ] :
+                os.makedirs(os.path.join(root, os.path.dirname(name)), exist_ok=True)
+                with open(os.path.join(root, name), "w") as f :
+                    f.write(contents)
+            records = [
+                ("sub/b.html", "2024-03-01T10:00:00+00:00"),
+                ("/index.html", "2024-01-01T10:00:00+00:00"),
+                ("./sub/c.html", "2024-02-01T10:00:00+00:00"),
+                ("private/d.html", "2024-02-01T10:00:00+00:00"),
+                ("e.txt", "2024-02-01T10:00:00+00:00")
+            ]
+            config = gs.SitemapConfig(root=root, baseUrl="https://example.com", dateOnly=True,
+                                      excludePaths={"private"}, indexLastmodFromSubtree=True, outputDir=out)
+            result = gs.generateSitemap(config, records)
+            self.assertEqual({
+                "sitemap-path" : os.path.join(out, "sitemap.xml"),
+                "url-count" : 2,
+                "excluded-count" : 2,
+                "shard-count" : 1,
+                "degraded-lastmod-count" : 0
+            }, result)
+            self.assertFalse(os.path.exists(os.path.join(root, "sitemap.xml")))
+            self.assertEqual(
+                [ ("https://example.com/", "2024-03-01"), ("https://example.com/sub/b.html", "2024-03-01") ],
+                list(gs.readSitemapEntries(result["sitemap-path"]))
+            )
+            # The delta is relative to the whole sitemap, which a partition doesn't write
+            config.partition = "1/2"
+            config.deltaFile = os.path.join(out, "delta.txt")
+            with self.assertRaises(ValueError) :
+                gs.generateSitemap(config, records)
+            self.assertFalse(os.path.exists(config.deltaFile))
+
+    def test_fileRecords(self) :
+        files = [ "./z.html", "./a/index.html", "./index.html", "./a/b.pdf", "./b.html", "./a/c/index.shtml", "./a.html", "./README" ]
+        for dropExtension in [False, True] :
+            records = gs.fileRecords(files, dropExtension)
+            gs.sortRecords(records)
+            expected = files[:]
+            gs.urlsort(expected, dropExtension)
+            self.assertEqual(expected, [ r.path for r in records ])
+            self.assertEqual(records, gs.fileRecords(records))
+        r = gs.FileRecord("./a/Page.HTML", True)
+        self.assertEqual(("html", 2, "./a/Page.HTML", True), (r.extension, r.depth, r.sortname, r.isHTML()))
+        r = gs.FileRecord("./a/page.html", True)
+        self.assertEqual("./a/page", r.sortname)
+        self.assertIsNone(gs.FileRecord("./README").extension)
+        self.assertFalse(hasattr(r, "__dict__"))
+        self.assertIsNone(gs.blockedReason(gs.FileRecord("./a/b.pdf"), ["/b"]))
+        self.assertEqual("paths", gs.blockedReason(gs.FileRecord("./a/b.pdf"), ["/a"]))
+        self.assertEqual("noindex", gs.blockedReason(gs.FileRecord("./blocked1.html"), [], root="tests"))
+        self.assertIsNone(gs.blockedReason(gs.FileRecord("./unblocked1.html"), [], root="tests"))
+        self.assertTrue(gs.robotsBlocked(gs.FileRecord("./blocked1.html"), [], root="tests"))
+
+    def test_checkpoint(self) :
+        with tempfile.TemporaryDirectory() as d :
+            filename = os.path.join(d, "checkpoint.json")
+            key = gs.checkpointKey("tests", { "format" : "xml" })
+            self.assertEqual(key, gs.checkpointKey("tests", { "format" : "xml" }))
+            self.assertNotEqual(key, gs.checkpointKey("tests", { "format" : "txt" }))
+            checkpoint = gs.Checkpoint(filename, key, 3600)
+            self.assertEqual({}, checkpoint.load())
+            checkpoint.state["files"] = ["./a.html", "./b.html"]
+            checkpoint.save()
+            lastmods, degraded = gs.computeLastmods(["./a.html", "./b.html"], None, "mtime", None, d, checkpoint)
+            self.assertEqual(lastmods, checkpoint.state["lastmods"])
+            self.assertEqual(["files"], list(gs.Checkpoint(filename, key).load()))
+            checkpoint.save(False)
+            self.assertEqual(["files"], list(gs.Checkpoint(filename, key).load()))
+            checkpoint.save()
+            resumed = gs.Checkpoint(filename, key).load()
+            self.assertEqual(["./a.html", "./b.html"], resumed["files"])
+            self.assertEqual(lastmods, resumed["lastmods"])
+            other = dict(key, head="0" * 40)
+            self.assertEqual({}, gs.Checkpoint(filename, other).load())
+            gs.removeIfExists(filename)
+            self.assertFalse(os.path.exists(filename))
+            lastmods, degraded = gs.computeLastmods(["./a.html"], 0, "omit", None, d, checkpoint)
+            self.assertEqual(({ "./a.html" : None }, 1), (lastmods, degraded))
+            self.assertIsNotNone(checkpoint.state["lastmods"]["./a.html"])
+
+    def test_pipelinedFilterAndLastmods(self) :
+        blockedPaths = set(gs.parseRobotsTxt("tests/robots.txt"))
+        allFiles = gs.gatherfiles({"html", "pdf"}, root="tests")
+        expected = [ f for f in allFiles if not gs.robotsBlocked(f, blockedPaths, root="tests") ]
+        known = { expected[0] : "2020-01-01T00:00:00+00:00" }
+        records, lastmods, degraded = gs.pipelinedFilterAndLastmods(gs.fileRecords(allFiles), blockedPaths, root="tests", known=known)
+        self.assertEqual(expected, [ r.path for r in records ])
+        self.assertEqual(set(expected[1:]), set(lastmods))
+        self.assertEqual(0, degraded)
+        self.assertEqual(gs.computeLastmods(expected[1:], root="tests")[0], lastmods)
+        records, lastmods, degraded = gs.pipelinedFilterAndLastmods(gs.fileRecords(allFiles), blockedPaths, root="tests", deadline=0, fallback="omit")
+        self.assertEqual((len(expected), { None }), (degraded, set(lastmods.values())))
+        # Once the deadline has passed, the remaining lastmods come from the fallback
+        records, lastmods, degraded = gs.pipelinedFilterAndLastmods(gs.fileRecords(allFiles), blockedPaths, root="tests", deadline=gs.time.monotonic() - 1, fallback="mtime", known=known)
+        self.assertEqual(expected, [ r.path for r in records ])
+        self.assertEqual(len(expected) - 1, degraded)
+        self.assertEqual(set(expected[1:]), set(lastmods))
+        for f in expected[1:] :
+            self.assertEqual(gs.fallbackLastmod(f, "mtime", "tests"), lastmods[f])
+            self.assertTrue(validateDate(lastmods[f]), msg=lastmods[f])
+
+    def test_parseHeadersFile(self) :
+        with tempfile.TemporaryDirectory() as d :
+            headersFile = os.path.join(d, "_headers")
+            with open(headersFile, "w") as f :
+                f.write("""# comment
+/drafts/*
+  X-Robots-Tag: noindex
+  Cache-Control: no-cache
+
+/drafts/public.html
+  ! X-Robots-Tag
+
+/reports/:year/*.pdf
+  X-Robots-Tag: noindex, nofollow
+/private
+  X-Robots-Tag: none
+https://example.com/old/*
+  x-robots-tag: NOINDEX
+/googlebot-only/*
+  X-Robots-Tag: googlebot: noindex
+/indexed/*
+  X-Robots-Tag: nofollow
+/later/*
+  X-Robots-Tag: unavailable_after: 2030-01-01, noindex
+""")
+            rules = gs.parseHeadersFile(headersFile)
+            for f in ["./drafts/a.html", "./drafts/sub/b.pdf", "./reports/2020/q1.pdf", "./private.html",
+                      "./old/page.html", "./later/x.html"] :
+                self.assertTrue(rules.noindex(f), msg=f)
+                self.assertEqual("headers", gs.blockedReason(f, headerRules=rules), msg=f)
+                self.assertTrue(gs.robotsBlocked(f, headerRules=rules), msg=f)
+            for f in ["./drafts/public.html", "./drafts.html", "./reports/q1.pdf", "./reports/2020/q1.html",
+                      "./googlebot-only/a.html", "./indexed/a.html", "./privateer.html"] :
+                self.assertFalse(rules.noindex(f), msg=f)
+            self.assertFalse(gs.parseHeadersFile(os.path.join(d, "missing")).noindex("./drafts/a.html"))
+            allFiles = gs.gatherfiles({"html", "pdf"}, root="tests")
+            blocked = [ f for f in allFiles if gs.robotsBlocked(f, root="tests", headerRules=rules) ]
+            self.assertEqual(blocked, [ f for f in allFiles if gs.robotsBlocked(f, root="tests") ])
+            rules = gs.HeaderRules(["/subdir/*"], [])
+            plan = gs.planSitemap(allFiles, set(), set(), "https://x.y/", "txt", root="tests", headerRules=rules)
+            self.assertEqual(sum(1 for f in allFiles if f.startswith("./subdir/")), plan["excluded-headers-count"])
+            self.assertTrue(plan["excluded-headers-count"] > 0)
+            reasons = [ gs.blockedReason(r, [], None, "tests", rules) for r in gs.fileRecords(allFiles) ]
+            self.assertEqual(plan["excluded-headers-count"], reasons.count("headers"))
+            # The pipelined filter counts the exclusions by their reasons
+            excluded = {}
+            selected, lastmods, degraded = gs.pipelinedFilterAndLastmods(
+                gs.fileRecords(allFiles), [], None, "tests", gs.time.monotonic() - 1, headerRules=rules, excluded=excluded
+            )
+            self.assertEqual({ reason : reasons.count(reason) for reason in ["headers", "noindex"] }, excluded)
+            self.assertEqual(reasons.count(None), len(selected))
+
+    def test_pageImages(self) :
+        with tempfile.TemporaryDirectory() as d :
+            page = os.path.join(d, "page.html")
+            with open(page, "w") as f :
+                f.write('<html><head><base href="/base/"><base href="/ignored/"></head><body>')
+                f.write('<img src="a.png"><IMG alt="x>" SRC=\'/img/b.jpg\'><!-- <img src="hidden.png"> -->')
+                f.write('<img src="data:image/png;base64,AAAA"><img src="a.png"><img data-src="lazy.png" src="c.jpg?x=1&amp;y=2">')
+                f.write("x" * 1000 + "<img src=https://cdn.example.com/d.gif></body></html>")
+            expected = [
+                "https://x.y/base/a.png",
+                "https://x.y/img/b.jpg",
+                "https://x.y/base/c.jpg?x=1&y=2",
+                "https://cdn.example.com/d.gif"
+            ]
+            original = gs.IMAGE_SCAN_CHUNK_SIZE
+            try :
+                for size in [5, 64, 65536] :
+                    gs.IMAGE_SCAN_CHUNK_SIZE = size
+                    self.assertEqual(expected, list(gs.pageImages(page, "https://x.y/dir/page.html")))
+            finally :
+                gs.IMAGE_SCAN_CHUNK_SIZE = original
+            self.assertEqual(expected[:2], list(gs.pageImages(page, "https://x.y/dir/page.html", 2)))
+            entry = gs.xmlSitemapEntry("./dir/page.html", "https://x.y/", "2020-01-01", images=["https://x.y/a&b.png"])
+            self.assertEqual(
+                "<url>\n<loc>https://x.y/dir/page.html</loc>\n<lastmod>2020-01-01</lastmod>\n"
+                "<image:image>\n<image:loc>https://x.y/a&amp;b.png</image:loc>\n</image:image>\n</url>",
+                entry
+            )
+            entries = list(gs.renderRecords(gs.fileRecords(["./page.html"]), "https://x.y/", "xml", False, { "./page.html" : None }, d, True))
+            self.assertEqual(len(expected), entries[0].count("<image:image>"))
+            name, shards = gs.writeSitemap(["./page.html"], "https://x.y/", "xml", lastmods={ "./page.html" : None }, root=d, images=True)
+            with open(os.path.join(d, name), "r") as f :
+                self.assertTrue(f.read().startswith(gs.IMAGE_SITEMAP_HEADER))
+
+    def test_externalUrlLists(self) :
+        with tempfile.TemporaryDirectory() as d :
+            base = "https://x.y/"
+            files = ["./index.html", "./a.html", "./blog/index.html", "./blog/z.html"]
+            lastmods = { f : "2020-01-01T00:00:00+00:00" for f in files }
+            sortedList = os.path.join(d, "sorted.txt")
+            with open(sortedList, "w") as f :
+                f.write("https://x.y/b\t2021-02-03T04:05:06+00:00\nhttps://x.y/blog/\nhttps://x.y/blog/a?x=1&y=2\n")
+            unsortedList = os.path.join(d, "unsorted.txt")
+            with open(unsortedList, "w") as f :
+                f.write("https://other.site/page\nhttps://x.y/blog/deep/p\nhttps://x.y/a.html\nhttps://x.y/b\n")
+            external = gs.ExternalUrlLists([sortedList, unsortedList], base)
+            name, shards = gs.writeSitemap(files, base, "txt", root=d, external=external)
+            with open(os.path.join(d, name), "r") as f :
+                urls = f.read().split()
+            self.assertEqual([
+                "https://x.y/", "https://x.y/a.html", "https://x.y/b",
+                "https://x.y/blog/", "https://x.y/blog/a?x=1&y=2", "https://x.y/blog/z.html",
+                "https://x.y/blog/deep/p", "https://other.site/page"
+            ], urls)
+            self.assertEqual(4, external.count)
+            self.assertEqual(urls, sorted(urls, key = lambda u : gs.urlSortKey(u, base)))
+            original = gs.SITEMAP_MAX_URLS
+            try :
+                gs.SITEMAP_MAX_URLS = 3
+                name, shards = gs.writeSitemap(files, base, "xml", dateOnly=True, lastmods=lastmods, root=d, external=external)
+            finally :
+                gs.SITEMAP_MAX_URLS = original
+            self.assertEqual((gs.SITEMAP_INDEX_FILENAME, 3), (name, shards))
+            with open(os.path.join(d, "sitemap1.xml"), "r") as f :
+                first = f.read()
+            self.assertIn("<loc>https://x.y/b</loc>\n<lastmod>2021-02-03</lastmod>", first)
+            with open(os.path.join(d, "sitemap2.xml"), "r") as f :
+                self.assertIn("<loc>https://x.y/blog/a?x=1&amp;y=2</loc>\n</url>", f.read())
+            partial = os.path.join(d, gs.partialFilename(1, 1))
+            gs.writePartial(partial, ( (r.depth, r.sortname, r.sortname) for r in gs.fileRecords(files) ), "txt", 1, 1, 0)
+            name, shards, count, excluded = gs.mergePartials([partial], "txt", base, d, external)
+            self.assertEqual((8, 4), (count, external.count))
+            # Lastmods that aren't W3C datetimes are converted or omitted, so the sitemap is valid
+            invalidDates = os.path.join(d, "dates.txt")
+            with open(invalidDates, "w") as f :
+                f.write("https://x.y/b\t20210203\nhttps://x.y/c\t2021-02-03 04:05\n")
+            external = gs.ExternalUrlLists([invalidDates], base)
+            os.remove(os.path.join(d, "sitemap.txt"))
+            name, shards = gs.writeSitemap(files, base, "xml", lastmods=lastmods, root=d, external=external)
+            with open(os.path.join(d, name), "r") as f :
+                contents = f.read()
+            self.assertIn("<loc>https://x.y/b</loc>\n</url>", contents)
+            self.assertIn("<loc>https://x.y/c</loc>\n<lastmod>2021-02-03T04:05:00+00:00</lastmod>", contents)
+            validator = gs.SitemapValidator(base)
+            validator.validate(os.path.join(d, name))
+            self.assertEqual(0, validator.errorCount())
+
+    def test_sitemapValidator(self) :
+        with tempfile.TemporaryDirectory() as d :
+            base = "https://x.y/"
+            files = ["./index.html", "./a&b.html", "./blog/index.html", "./blog/z.html"]
+            lastmods = { f : "2020-01-01T00:00:00+00:00" for f in files }
+            original = gs.SITEMAP_MAX_URLS
+            try :
+                gs.SITEMAP_MAX_URLS = 2
+                name, shards = gs.writeSitemap(files, base, "xml", lastmods=lastmods, root=d)
+            finally :
+                gs.SITEMAP_MAX_URLS = original
+            validator = gs.SitemapValidator(base)
+            validator.validate(os.path.join(d, name))
+            self.assertEqual({ "validated-url-count" : 4, "validation-error-count" : 0, "validation-findings" : "" }, validator.outputs())
+            self.assertEqual(3, validator.fileCount)
+            with gzip.open(os.path.join(d, "bad.xml.gz"), "wt") as f :
+                f.write(gs.XML_SITEMAP_HEADER)
+                f.write("<url>\n<loc>https://x.y/b?p='1'</loc>\n<lastmod>2020-02-30T00:00</lastmod>\n</url>\n")
+                f.write("<url>\n<loc>https://x.y/a&amp;b.html</loc>\n<lastmod>2020-02</lastmod>\n</url>\n")
+                f.write("<url>\n<loc>https://x.y/b?p='1'</loc>\n</url>\n")
+                f.write(gs.XML_SITEMAP_FOOTER)
+            with open(os.path.join(d, "bad.txt"), "w") as f :
+                f.write("https://x.y/" + "a" * gs.SITEMAP_MAX_URL_LENGTH + "\n")
+            with open(os.path.join(d, "broken.xml"), "w") as f :
+                f.write(gs.XML_SITEMAP_HEADER + "<url><loc>https://x.y/</loc></url>")
+            validator = gs.SitemapValidator(base)
+            for name in ["bad.xml.gz", "bad.txt", "broken.xml", "missing.xml"] :
+                validator.validate(os.path.join(d, name))
+            expected = { "missing" : 1, "malformed" : 1, "url-too-long" : 1, "unescaped" : 2, "invalid-lastmod" : 1, "duplicate" : 1, "unsorted" : 1 }
+            self.assertEqual({ kind : expected.get(kind, 0) for kind in gs.VALIDATION_FINDINGS }, validator.counts)
+            self.assertEqual(7, validator.errorCount())
+        hashes = gs.CompactHashSet()
+        self.assertEqual([False] * 5000, [ hashes.add(str(i)) for i in range(5000) ])
+        self.assertEqual([True] * 5000, [ hashes.add(str(i)) for i in range(5000) ])
+        self.assertEqual(5000, hashes.size)
+
+    def test_gitHistory(self) :
+        history = gs.GitHistory("tests")
+        self.assertIsNotNone(history.head)
+        files = gs.gatherfiles({"html", "pdf"}, root="tests") + ["./missing.html"]
+        self.assertEqual("tests/subdir/a.html", history.repoPath("./subdir/a.html", "tests"))
+        self.assertIsNone(history.repoPath("../../outside.html", "tests"))
+        lastmods, degraded = gs.computeLastmods(files, root="tests", history=history)
+        self.assertEqual(0, degraded)
+        for f in files[:-1] :
+            self.assertEqual(gs.lastmod(f, "tests"), lastmods[f])
+        self.assertIsNotNone(lastmods["./missing.html"])
+        # The history is closed once the dates are found
+        self.assertEqual([], history.packs)
+        lastmods, degraded = gs.computeLastmods(files, 0, "omit", root="tests", history=gs.GitHistory("tests"))
+        self.assertEqual((len(files), { None }), (degraded, set(lastmods.values())))
+
+    def test_historyHorizon(self) :
+        self.assertEqual((5000, None), gs.parseHistoryHorizon("5000"))
+        self.assertEqual((None, 1577836800), gs.parseHistoryHorizon("2020-01-01"))
+        for invalid in ["0", "-3", "yesterday", ""] :
+            with self.assertRaises(ValueError) :
+                gs.parseHistoryHorizon(invalid)
+        self.assertIsNone(gs.resolveHistoryHorizon("2000-01-01", "tests"))
+        files = gs.gatherfiles({"html", "pdf"}, root="tests")
+        for value in ["1", "2090-01-01"] :
+            history = gs.GitHistory("tests")
+            horizon = gs.resolveHistoryHorizon(value, "tests")
+            builtin = gs.resolveHistoryHorizon(value, "tests", history)
+            self.assertEqual((horizon.since, horizon.date), (builtin.since, builtin.date))
+            lastmods, degraded = gs.computeLastmods(files, root="tests", horizon=horizon)
+            self.assertEqual(lastmods, gs.computeLastmods(files, root="tests", history=history, horizon=builtin)[0])
+            self.assertEqual(horizon.count, builtin.count)
+            self.assertTrue(0 < horizon.count <= len(files))
+            self.assertEqual(horizon.count, sum(1 for f in files if lastmods[f] == horizon.date))
+
+    def test_applyDelta(self) :
+        base = b"0123456789abcdef"
+        # sizes 16 and 13, copy 4 bytes at offset 10, insert 3 bytes, copy 6 bytes at offset 0
+        delta = bytes([16, 13, 0x91, 10, 4, 3]) + b"XYZ" + bytes([0x90, 6])
+        self.assertEqual(b"abcdXYZ012345", gs.applyDelta(base, delta))
+        with self.assertRaises(gs.GitReaderError) :
+            gs.applyDelta(base[1:], delta)
+
+    def test_readManifest(self) :
+        import io
+        expected = [
+            ("index.html", None),
+            ("/sub/a b.html", "2024-05-01T12:00:00+00:00"),
+            ("./c.pdf", None),
+            ("d.html", None)
+        ]
+        newlines = "index.html\r\n/sub/a b.html\t2024-05-01T12:00:00+00:00\n\n./c.pdf\t\nd.html\tnot a date"
+        self.assertEqual(expected, list(gs.readManifest(io.StringIO(newlines, newline=""))))
+        nuls = "index.html\0/sub/a b.html\t2024-05-01T12:00:00+00:00\0./c.pdf\0d.html\0"
+        self.assertEqual(expected, list(gs.readManifest(io.StringIO(nuls, newline=""))))
+        self.assertEqual([("a\nb.html", None)], list(gs.readManifest(io.StringIO("a\nb.html\0", newline=""))))
+        original = gs.MANIFEST_CHUNK_SIZE
+        try :
+            gs.MANIFEST_CHUNK_SIZE = 4
+            self.assertEqual(expected, list(gs.readManifest(io.StringIO(newlines, newline=""))))
+            gs.MANIFEST_CHUNK_SIZE = 16
+            self.assertEqual(expected, list(gs.readManifest(io.StringIO(nuls, newline=""))))
+        finally :
+            gs.MANIFEST_CHUNK_SIZE = original
+        dates = "a\t2024-05\nb\t20240501\nc\t2024-05-01 10:00\nd\t2024-05-01T10:00:00\ne\t2024-05-01T10:00:00.5Z\nf\t2024-13-01\n"
+        self.assertEqual([
+            ("a", "2024-05"), ("b", None), ("c", "2024-05-01T10:00:00+00:00"),
+            ("d", "2024-05-01T10:00:00+00:00"), ("e", "2024-05-01T10:00:00.5Z"), ("f", None)
+        ], list(gs.readManifest(io.StringIO(dates, newline=""))))
+        files, known = gs.recordFiles(expected, {"html"})
+        self.assertEqual(["./index.html", "./sub/a b.html", "./d.html"], files)
+        self.assertEqual({ "./sub/a b.html" : "2024-05-01T12:00:00+00:00" }, known)
+
+    def test_compileIgnorePattern(self) :
+        cases = [
+            ("*.pdf", "a.pdf", True), ("*.pdf", "x/y/a.pdf", True), ("*.pdf", "a.pdfx", False),
+            ("/drafts", "drafts", True), ("/drafts", "x/drafts", False),
+            ("a/b.html", "a/b.html", True), ("a/b.html", "x/a/b.html", False),
+            ("a/**/b", "a/b", True), ("a/**/b", "a/x/y/b", True),
+            ("**/tmp", "tmp", True), ("**/tmp", "x/tmp", True),
+            ("docs/**", "docs/x/y.html", True), ("docs/**", "docs", False),
+            ("?.html", "a.html", True), ("?.html", "ab.html", False),
+            ("[ab].html", "b.html", True), ("[!ab].html", "b.html", False),
+            ("\\#x", "#x", True), ("\\!x", "!x", True),
+        ]
+        for pattern, path, expected in cases :
+            regex, negated, directoryOnly = gs.compileIgnorePattern(pattern)
+            self.assertEqual(expected, regex.match(path) is not None, msg=pattern + " " + path)
+        self.assertIsNone(gs.compileIgnorePattern("# comment\n"))
+        self.assertIsNone(gs.compileIgnorePattern("   \n"))
+        self.assertEqual((True, False), gs.compileIgnorePattern("!keep.html\n")[1:])
+        self.assertEqual((False, True), gs.compileIgnorePattern("build/\n")[1:])
+
+    def test_gatherfiles_useIgnoreFiles(self) :
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as d :
+            os.chdir(d)
+            try :
+                for f in ["a.html", "b.html", "x.pdf", "drafts/c.html", "sub/d.html",
+                          "sub/e.html", "sub/keep.html", "sub/drafts/f.html", "sub/g.pdf", "other/build" ] :
+                    os.makedirs(os.path.dirname(f) or ".", exist_ok=True)
+                    with open(f, "w") as file :
+                        file.write("<html></html>")
+                os.makedirs("build")
+                with open("build/h.html", "w") as file :
+                    file.write("<html></html>")
+                with open(".sitemapignore", "w") as file :
+                    file.write("# comment\n/drafts/\nb.html\nbuild/\n*.pdf\n")
+                with open("sub/.sitemapignore", "w") as file :
+                    file.write("*.html\n!keep.html\n!d.html\n!*.pdf\n")
+                expected = {"./a.html", "./sub/d.html", "./sub/keep.html", "./sub/g.pdf"}
+                self.assertEqual(expected, set(gs.gatherfiles({"html", "pdf"}, False, True)))
+                self.assertEqual(10, len(gs.gatherfiles({"html", "pdf"})))
+            finally :
+                os.chdir(cwd)